@@ -1,14 +1,25 @@
 from openai import AzureOpenAI
+import openai
 import os, json
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from dotenv import load_dotenv
+from common.assistant_runs import Backoff, RunFailedError, stream_run, wait_for_run
 
 load_dotenv()
 
 # Constants
 SAMPLES_DIR = "../AzureMapsCodeSamples/Samples"
 CONFIG_FILE = '../config/assistant_config.json'
+# Content hash -> uploaded file, so unchanged samples are not uploaded again
+UPLOAD_LEDGER_FILE = os.path.join(os.path.dirname(CONFIG_FILE), 'assistant_file_ledger.json')
+UPLOAD_WORKERS = int(os.getenv('ASSISTANT_UPLOAD_WORKERS', '8'))
+UPLOAD_MAX_RETRIES = 5
 API_VERSION = "2024-08-01-preview"
+RUN_TIMEOUT_SECONDS = float(os.getenv('ASSISTANT_RUN_TIMEOUT_SECONDS', '300'))
+RUN_STREAM = os.getenv('ASSISTANT_RUN_STREAM', 'True') == 'True'
 
 def initialize_client():
     try:
@@ -24,28 +35,105 @@ def initialize_client():
         print(f"Error initializing Azure OpenAI client: {str(e)}")
         raise
 
-def upload_sample_files(client, samples_dir):
-    file_ids = []
+def _sample_files(samples_dir):
+    for category_folder in os.listdir(samples_dir):
+        category_path = Path(samples_dir) / category_folder
+        if category_path.is_dir():
+            for sample_folder in category_path.iterdir():
+                if sample_folder.is_dir():
+                    for html_file in sample_folder.glob('*.html'):
+                        yield category_folder, sample_folder, html_file
+
+def _load_ledger(path):
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            return json.load(f)
+    return {}
+
+def _save_ledger(path, ledger):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(ledger, f, indent=4)
+    os.replace(tmp_path, path)
+
+def _existing_file_ids(client):
+    """IDs of the files still on the service, None when they cannot be listed"""
     try:
-        for category_folder in os.listdir(samples_dir):
-            category_path = Path(samples_dir) / category_folder
-            if category_path.is_dir():
-                for sample_folder in category_path.iterdir():
-                    if sample_folder.is_dir():
-                        # Combine all samples in a category into one file
-                        category_content = []
-                        for html_file in sample_folder.glob('*.html'):
-                            print(f"Uploading: {category_folder}/{sample_folder.name}/{html_file.name}")
-                            with open(html_file, 'r', encoding='utf-8') as f:
-                                file = client.files.create(
-                                    file=(html_file.name, f.read(), 'text/html'),
-                                    purpose='assistants'
-                                )
-                                file_ids.append(file.id)
+        return {file.id for file in client.files.list(purpose='assistants')}
+    except Exception as e:
+        print(f"Could not list uploaded files, trusting the upload ledger: {str(e)}")
+        return None
+
+def _upload_file(client, name, content):
+    """Upload one file, retrying rate limits, server and connection errors with backoff"""
+    backoff = Backoff(initial=1.0, maximum=30.0)
+    for attempt in range(UPLOAD_MAX_RETRIES + 1):
+        try:
+            return client.files.create(file=(name, content, 'text/html'), purpose='assistants')
+        except (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError) as e:
+            if attempt == UPLOAD_MAX_RETRIES:
+                raise
+            delay = backoff.next_delay()
+            print(f"Retrying {name} in {delay:.1f}s: {str(e)}")
+            time.sleep(delay)
+
+def upload_sample_files(client, samples_dir, ledger_file=UPLOAD_LEDGER_FILE, workers=UPLOAD_WORKERS):
+    """Upload the sample HTML files concurrently, reusing the file ID of any sample whose content was already uploaded"""
+    start = time.perf_counter()
+    ledger = _load_ledger(ledger_file)
+    existing_ids = _existing_file_ids(client) if ledger else set()
+    samples = []
+    try:
+        for category_folder, sample_folder, html_file in _sample_files(samples_dir):
+            with open(html_file, 'rb') as f:
+                content = f.read()
+            samples.append((f"{category_folder}/{sample_folder.name}/{html_file.name}", html_file.name, content,
+                            hashlib.sha256(content).hexdigest()))
     except Exception as e:
         print(f"Error in upload_sample_files: {str(e)}")
         raise
-    return file_ids
+
+    file_ids = {}
+    to_upload = {}
+    for label, name, content, digest in samples:
+        entry = ledger.get(digest)
+        if entry and (existing_ids is None or entry['file_id'] in existing_ids):
+            file_ids[digest] = entry['file_id']
+            print(f"Reused: {label} ({entry['file_id']})")
+        else:
+            # Identical samples are uploaded once
+            to_upload.setdefault(digest, (label, name, content))
+
+    def upload(digest, label, name, content):
+        upload_start = time.perf_counter()
+        file = _upload_file(client, name, content)
+        return digest, label, name, len(content), file.id, time.perf_counter() - upload_start
+
+    errors = []
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(upload, digest, *sample) for digest, sample in to_upload.items()]
+            for future in as_completed(futures):
+                try:
+                    digest, label, name, size, file_id, seconds = future.result()
+                except Exception as e:
+                    errors.append(e)
+                    print(f"Error uploading sample: {str(e)}")
+                    continue
+                file_ids[digest] = file_id
+                ledger[digest] = {'file_id': file_id, 'name': name, 'bytes': size, 'uploaded_at': int(time.time())}
+                print(f"Uploaded: {label} ({file_id}) in {seconds:.2f}s")
+    finally:
+        # Keep what was uploaded even if some uploads failed
+        _save_ledger(ledger_file, ledger)
+    if errors:
+        raise errors[0]
+
+    print(f"{len(samples)} samples: {len(to_upload)} uploaded, {len(samples) - len(to_upload)} reused, "
+          f"{time.perf_counter() - start:.1f}s")
+    # Same order as the sample files, without duplicates
+    return list(dict.fromkeys(file_ids[digest] for _, _, _, digest in samples))
 
 def create_visualization_assistant(client, file_ids):
     assistant = client.beta.assistants.create(
@@ -98,7 +186,7 @@ def load_or_create_assistant(client):
 def create_thread(client):
     return client.beta.threads.create()
 
-def chat_with_assistant(client, assistant_id, thread_id, user_message):
+def chat_with_assistant(client, assistant_id, thread_id, user_message, stream=RUN_STREAM, on_text=None, timeout=RUN_TIMEOUT_SECONDS):
     # Add the user's message to the thread
     client.beta.threads.messages.create(
         thread_id=thread_id,
@@ -106,20 +194,19 @@ def chat_with_assistant(client, assistant_id, thread_id, user_message):
         content=user_message
     )
 
-    # Run the assistant
-    run = client.beta.threads.runs.create(
-        thread_id=thread_id,
-        assistant_id=assistant_id
-    )
-
-    # Wait for completion
-    while True:
-        run_status = client.beta.threads.runs.retrieve(
+    # Run the assistant and wait for it to finish: follow its events when streaming,
+    # otherwise poll with backoff. Failed, cancelled, expired and timed out runs raise.
+    if stream:
+        run = stream_run(client, thread_id, assistant_id, timeout=timeout, on_text=on_text)
+    else:
+        run = client.beta.threads.runs.create(
             thread_id=thread_id,
-            run_id=run.id
+            assistant_id=assistant_id
         )
-        if run_status.status == 'completed':
-            break
+        run = wait_for_run(client, thread_id, run.id, timeout=timeout)
+    if run.status != 'completed':
+        # The assistant only has code_interpreter, there are no tool outputs to submit
+        raise RunFailedError(run)
 
     # Get the assistant's response
     messages = client.beta.threads.messages.list(thread_id=thread_id)
@@ -133,8 +220,17 @@ def start_interactive_session(client, assistant_id, thread_id):
         if user_input.lower().strip() == 'quit':
             break
             
-        response = chat_with_assistant(client, assistant_id, thread_id, user_input)
-        print("\nAgent:", response)
+        try:
+            if RUN_STREAM:
+                # Print the reply as it is generated
+                print("\nAgent: ", end="", flush=True)
+                chat_with_assistant(client, assistant_id, thread_id, user_input, on_text=lambda text: print(text, end="", flush=True))
+                print()
+            else:
+                response = chat_with_assistant(client, assistant_id, thread_id, user_input)
+                print("\nAgent:", response)
+        except (RunFailedError, TimeoutError) as e:
+            print(f"\nAgent run did not complete: {str(e)}")
 
 # Run the setup and start interaction
 if __name__ == "__main__":
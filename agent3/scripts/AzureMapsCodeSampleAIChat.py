@@ -2,10 +2,24 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from openai import AzureOpenAI
+from collections import Counter
+import hashlib
+import math
 import os
+import re
+import time
 from pathlib import Path
 from common.constants import CONSTANTS
 
+_TERM = re.compile(r'[a-z0-9]+')
+
+def _terms(text):
+    return _TERM.findall(text.lower())
+
+def _estimate_tokens(text):
+    # Roughly 4 characters per token for English text and code
+    return len(text) // 4 + 1
+
 class VisualizationAgent:
     def __init__(self, samples_dir):
         self.client = AzureOpenAI(
@@ -14,26 +28,63 @@ class VisualizationAgent:
             azure_endpoint=os.getenv('AzureOpenAI_ENDPOINT')
         )
         self.samples_dir = samples_dir
-        self.context = self._prepare_context()
+        # Token budget for the samples sent with each message, 0 sends the whole corpus
+        self.context_token_budget = int(os.getenv('VISUALIZATION_CONTEXT_TOKEN_BUDGET', '12000'))
+        self.manifest_check_interval = 2.0
+        self._manifest = None
+        self._manifest_checked = 0.0
+        self._context = None
+        self._sample_blocks = []
+        self._sample_terms = []
+        self._idf = {}
+
+    def _sample_files(self):
+        for category_folder in os.listdir(self.samples_dir):
+            category_path = Path(self.samples_dir) / category_folder
+            if category_path.is_dir():
+                for sample_folder in category_path.iterdir():
+                    if sample_folder.is_dir():
+                        for html_file in sample_folder.glob('*.html'):
+                            yield category_folder, sample_folder, html_file
+
+    def _sample_manifest(self):
+        """Fingerprint of the sample directory from file names, sizes and modification times, without reading any file"""
+        digest = hashlib.sha256()
+        for category_folder, sample_folder, html_file in sorted(self._sample_files()):
+            stat = html_file.stat()
+            digest.update(f"{html_file}|{stat.st_size}|{stat.st_mtime_ns}\n".encode('utf-8'))
+        return digest.hexdigest()
+
+    def _ensure_context(self):
+        """Rebuild the cached sample context when the sample directory manifest changed"""
+        now = time.monotonic()
+        if self._context is not None and now - self._manifest_checked < self.manifest_check_interval:
+            return
+        self._manifest_checked = now
+        manifest = self._sample_manifest()
+        if manifest != self._manifest:
+            self._context = self._prepare_context()
+            self._manifest = manifest
+
+    @property
+    def context(self):
+        """All samples as one context message, built lazily and cached"""
+        self._ensure_context()
+        return self._context
         
     def _load_samples(self):
         print("Loading samples...")
         samples = []
         try:
-            for category_folder in os.listdir(self.samples_dir):
-                category_path = Path(self.samples_dir) / category_folder
-                if category_path.is_dir():
-                    for sample_folder in category_path.iterdir():
-                        if sample_folder.is_dir():
-                            for html_file in sample_folder.glob('*.html'):
-                                print(f"Loading: {category_folder}/{sample_folder.name}/{html_file.name}")
-                                with open(html_file, 'r', encoding='utf-8') as f:
-                                    samples.append({
-                                        'name': html_file.name,
-                                        'category': category_folder,
-                                        'subcategory': sample_folder.name,
-                                        'content': f.read()
-                                    })
+            for category_folder, sample_folder, html_file in self._sample_files():
+                print(f"Loading: {category_folder}/{sample_folder.name}/{html_file.name}")
+                with open(html_file, 'r', encoding='utf-8') as f:
+                    samples.append({
+                        'name': html_file.name,
+                        'category': category_folder,
+                        'subcategory': sample_folder.name,
+                        'content': f.read()
+                    })
         except Exception as e:
             print(f"Error loading samples: {str(e)}")
             raise
@@ -56,20 +107,46 @@ class VisualizationAgent:
 
     def _prepare_context(self):
         samples = self._load_samples()
-        context = "Available Azure Maps samples:\n\n"
-        for sample in self.samples:
-            context += f"Category: {sample['category']}\n"
-            context += f"SubCategory: {sample['subcategory']}\n"
-            context += f"Sample: {sample['name']}\n"
-            context += f"Content: {sample['content']}\n"
-            context += "---\n\n"
-        return context
+        # Render each sample once; the full context and any subset are joins of these blocks
+        self._sample_blocks = [
+            f"Category: {sample['category']}\nSubCategory: {sample['subcategory']}\nSample: {sample['name']}\n"
+            f"Content: {sample['content']}\n---\n\n"
+            for sample in samples
+        ]
+        # Names count three times, they describe the sample better than its markup
+        self._sample_terms = [
+            Counter(_terms(sample['content'])) + Counter(_terms(f"{sample['category']} {sample['subcategory']} {sample['name']}") * 3)
+            for sample in samples
+        ]
+        document_frequencies = Counter(term for terms in self._sample_terms for term in terms)
+        self._idf = {term: math.log(1 + len(samples) / frequency) for term, frequency in document_frequencies.items()}
+        return "".join(["Available Azure Maps samples:\n\n", *self._sample_blocks])
+
+    def _select_context(self, user_input):
+        """The most relevant samples for the message that fit in the context token budget"""
+        self._ensure_context()
+        if not self.context_token_budget:
+            return self._context
+        query_terms = set(_terms(user_input))
+        scores = [
+            sum(self._idf[term] * math.log(1 + terms[term]) for term in query_terms if term in terms)
+            for terms in self._sample_terms
+        ]
+        selected = []
+        budget = self.context_token_budget
+        for index in sorted(range(len(scores)), key=lambda i: -scores[i]):
+            tokens = _estimate_tokens(self._sample_blocks[index])
+            if scores[index] <= 0 or tokens > budget:
+                continue
+            selected.append(self._sample_blocks[index])
+            budget -= tokens
+        return "".join(["Most relevant Azure Maps samples:\n\n", *selected])
 
     def chat(self, user_input):
         try:
             messages = [
                 {"role": "system", "content": self._prepare_system_message()},
-                {"role": "system", "content": self._prepare_context()},
+                {"role": "system", "content": self._select_context(user_input)},
                 {"role": "user", "content": user_input}
             ]
 
@@ -85,12 +162,11 @@ class VisualizationAgent:
 
 def main():
     # Configuration
-    API_KEY = "your-api-key"  # Replace with your API key
     SAMPLES_DIR = "path_to_samples_directory"  # Replace with your samples directory path
 
     try:
         # Initialize the agent
-        agent = VisualizationAgent(API_KEY, SAMPLES_DIR)
+        agent = VisualizationAgent(SAMPLES_DIR)
         
         print("Visualization Intelligence Agent Ready! (Type 'quit' to exit)")
         
@@ -1,17 +1,29 @@
 from dotenv import load_dotenv
 load_dotenv()
 
+import asyncio
+import sys
+
 from common.constants import CONSTANTS
 from common.helpers import get_project_root
 
 from AzureMapsCodeSamplesIndexCreation import process_all_samples, process_html_sample2
 from AzureMapsDocsIndexCreation import process_all_docs
+from AzureMapsIndexEmbeddings import embed_index
 
 if __name__ == '__main__':
-    fileName = 'azmaps_code_samples_docs.json'
+    # Pass --jsonl to write one document per line instead of a JSON array
+    fileName = 'azmaps_code_samples_docs.jsonl' if '--jsonl' in sys.argv[1:] else 'azmaps_code_samples_docs.json'
+    # Pass --incremental to only re-process files changed since the last run. The output then holds
+    # Azure AI Search actions (mergeOrUpload / delete) for the changed documents only, the full set
+    # of documents is kept in the .docs.jsonl stores next to it
+    incremental = '--incremental' in sys.argv[1:]
     # Process all documentation
-    process_all_docs(save_file_name=fileName)
+    process_all_docs(save_file_name=fileName, incremental=incremental)
     
     # Process all code samples
-    process_all_samples(process_fun=process_html_sample2, save_file_name=fileName, add_to_existing=True)
+    process_all_samples(process_fun=process_html_sample2, save_file_name=fileName, add_to_existing=True, incremental=incremental)
 
+    # Pass --embed to embed every document locally, only texts missing from the embedding cache are sent
+    if '--embed' in sys.argv[1:]:
+        asyncio.run(embed_index(fileName))
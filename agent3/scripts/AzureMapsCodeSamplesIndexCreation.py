@@ -3,10 +3,12 @@ load_dotenv()
 
 from common.constants import CONSTANTS
 from common.helpers import get_project_root
+from common.export import DocumentWriter
+from common.incremental import iter_incrementally, stable_id
+from common.parallel import process_files
 from bs4 import BeautifulSoup
 import os, json, shutil
 import re
-import uuid
 
 def _clean_filename(text):
     cleaned = text.split('.')[0]
@@ -49,7 +51,8 @@ def process_html_sample(file_path, file_name, category):
     usage_description = '\n'.join(usage_descriptions)
     
     sample_json = {
-        "id": str(uuid.uuid4()),
+        # Keyed on the source file, so an edited sample replaces its previous version in the index
+        "id": stable_id("azmaps_code_sample", os.path.relpath(file_path, get_project_root()).replace(os.sep, "/"), file_name),
         "file_name": file_name,
         "content_type": "azmaps_code_sample",
         "category": category,
@@ -77,9 +80,10 @@ def process_html_sample2(file_path, file_name, category):
         "embedding_content": sample_json["embedding_content"]
     }
 
-def process_all_samples(process_fun = process_html_sample, save_file_name = 'azmaps_code_samples.json', add_to_existing = False):
+def process_all_samples(process_fun = process_html_sample, save_file_name = 'azmaps_code_samples.json', add_to_existing = False, incremental = False, workers = None):
     source_folder = os.path.join(get_project_root(), CONSTANTS.AGENT3.AZURE_MAPS_CODE_SAMPLES_FOLDER)
-    samples = []
+    dest_file_path = os.path.join(get_project_root(), CONSTANTS.AGENT3.DATA_FOLDER, save_file_name)
+    tasks = []
 
     # Walk through all directories and subdirectories
     for root, dirs, files in os.walk(source_folder):
@@ -90,21 +94,20 @@ def process_all_samples(process_fun = process_html_sample, save_file_name = 'azm
                 # Extract category (file root folder name) and store category - filename
                 category = root.split("\\")[-2].replace("-", " ")
                 file_name = f"{category}-{file}"
-                sample_json = process_fun(source_file, file_name, category)
-                samples.append(sample_json)
+                tasks.append((source_file, (source_file, file_name, category)))
 
-    dest_file_path = os.path.join(get_project_root(), CONSTANTS.AGENT3.DATA_FOLDER, save_file_name)
-    if add_to_existing:
-        # If file is present, load it and append to it
-        if os.path.exists(dest_file_path):
-            existing_samples = json.load(open(dest_file_path, 'r'))
-            samples.extend(existing_samples)
-        json.dump(samples, open(dest_file_path, 'w'), indent=4)
-        return
-    # If file is present, delete it
-    if os.path.exists(dest_file_path):
-        os.remove(dest_file_path)
-    json.dump(samples, open(dest_file_path, 'w'), indent=4)
+    if incremental:
+        # Only re-process samples that changed since the last run, and only write index actions for what changed
+        samples = iter_incrementally(tasks, process_fun, dest_file_path, "samples", get_project_root(), workers)
+    else:
+        # Parse files in a process pool, failed files are reported and left out
+        samples = (result.doc for result in process_files(tasks, process_fun, workers) if result.doc is not None)
+
+    # Stream each document to the output as soon as it is produced, .jsonl/.ndjson files get one document per line.
+    # With add_to_existing the documents are appended without reading the existing file.
+    with DocumentWriter(dest_file_path, append=add_to_existing) as writer:
+        writer.write_all(samples)
+    print(f"Wrote {writer.count} samples to {dest_file_path}")
 
 def create_samples_folder_upload():
     source_folder = os.path.join(get_project_root(), CONSTANTS.AGENT3.AZURE_MAPS_CODE_SAMPLES_FOLDER)
@@ -4,11 +4,49 @@ load_dotenv()
 import yaml
 import json
 import os
+import pickle
 from pathlib import Path
 from typing import Dict, List, Any, Optional
-import uuid
 from common.constants import CONSTANTS
 from common.helpers import get_project_root
+from common.export import DocumentWriter
+from common.incremental import content_hash, iter_incrementally, stable_id
+from common.parallel import process_files
+
+# libyaml C loader when PyYAML was built with it, the pure-Python loader otherwise
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+YAML_PARSE_CACHE = os.getenv("YAML_PARSE_CACHE", "True") == "True"
+
+def _load_yml_file(file_path: str):
+    """Read a YML file once and return its parsed document and text content.
+
+    Parsed documents are cached on disk by content hash, so unchanged files are not parsed again on the next run.
+    """
+    with open(file_path, 'rb') as file:
+        data = file.read()
+    # Same newline handling as reading the file in text mode
+    content = data.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+    if not YAML_PARSE_CACHE:
+        return yaml.load(content, Loader=YAML_LOADER), content
+
+    digest = content_hash(data)
+    cache_file = os.path.join(get_project_root(), CONSTANTS.AGENT3.YAML_CACHE_FOLDER, digest[:2], f"{digest}.pickle")
+    try:
+        with open(cache_file, 'rb') as file:
+            return pickle.load(file), content
+    except (OSError, pickle.UnpicklingError, EOFError):
+        pass
+    doc = yaml.load(content, Loader=YAML_LOADER)
+    try:
+        # Write to a temporary file first, several worker processes may cache the same content
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        with open(tmp_file, 'wb') as file:
+            pickle.dump(doc, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        print(f"Could not cache {file_path}: {str(e)}")
+    return doc, content
 
 def _parse_inner_info(doc, key):
     """Parse inner information from a YML document"""
@@ -24,59 +62,58 @@ def _parse_inner_info(doc, key):
 def process_yml_file(file_path: str) -> Optional[Dict[str, Any]]:
     """Process a single YML file and convert it to search index document format"""
     try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            doc = yaml.safe_load(file)
-            # UID or File Name
-            title = doc.get("uid", "") or Path(file_path).stem
-            content = open(file_path, 'r', encoding='utf-8').read()
+        doc, content = _load_yml_file(file_path)
+        # UID or File Name
+        title = doc.get("uid", "") or Path(file_path).stem
 
-            content_parts = []
-            content_parts.append(f"Type: {doc.get('type', '')} | Name: {doc.get('name', '')} | Package: {doc.get('package', '')} | UID: {doc.get('uid', '')} | Summary: {doc.get('summary', '')}")
-            
-            content_parts.append(_parse_inner_info(doc, 'constructors'))
-            content_parts.append(_parse_inner_info(doc, 'properties'))
-            content_parts.append(_parse_inner_info(doc, 'methods'))
-            content_parts.append(_parse_inner_info(doc, 'fields'))
-            # content_parts.append(_parse_inner_info(doc, 'inheritedProperties'))
-            # content_parts.append(_parse_inner_info(doc, 'inheritedMethods'))
+        content_parts = []
+        content_parts.append(f"Type: {doc.get('type', '')} | Name: {doc.get('name', '')} | Package: {doc.get('package', '')} | UID: {doc.get('uid', '')} | Summary: {doc.get('summary', '')}")
+        
+        content_parts.append(_parse_inner_info(doc, 'constructors'))
+        content_parts.append(_parse_inner_info(doc, 'properties'))
+        content_parts.append(_parse_inner_info(doc, 'methods'))
+        content_parts.append(_parse_inner_info(doc, 'fields'))
+        # content_parts.append(_parse_inner_info(doc, 'inheritedProperties'))
+        # content_parts.append(_parse_inner_info(doc, 'inheritedMethods'))
 
-            if 'extends' in doc:
-                content_parts.append(f"Extends: {doc['extends']}")
-            
-            embedding_content = '\n'.join(content_parts)
-            return {
-                "id": str(uuid.uuid4()),
-                "content_type": "sdk_docs",
-                "title": title,
-                "content": content,
-                "embedding_content": embedding_content
-            }
-            
+        if 'extends' in doc:
+            content_parts.append(f"Extends: {doc['extends']}")
+        
+        embedding_content = '\n'.join(content_parts)
+        return {
+            # Keyed on the source file, so an edited doc replaces its previous version in the index
+            "id": stable_id("sdk_docs", os.path.relpath(file_path, get_project_root()).replace(os.sep, "/"), title),
+            "content_type": "sdk_docs",
+            "title": title,
+            "content": content,
+            "embedding_content": embedding_content
+        }
+        
     except Exception as e:
         print(f"Error processing {file_path}: {str(e)}")
         return None
 
-def process_all_docs(process_fun = process_yml_file, save_file_name = 'azmaps_code_samples.json', add_to_existing = False):
+def process_all_docs(process_fun = process_yml_file, save_file_name = 'azmaps_code_samples.json', add_to_existing = False, incremental = False, workers = None):
     source_folder = os.path.join(get_project_root(), CONSTANTS.AGENT3.AZURE_SDK_DOCS_FOLDER)
-    docs = []
+    dest_file_path = os.path.join(get_project_root(), CONSTANTS.AGENT3.DATA_FOLDER, save_file_name)
+    tasks = []
 
     # Walk through all directories and subdirectories
     for root, dirs, files in os.walk(source_folder):
         for file in files:
             if file.lower().endswith(('.yml')) and 'toc.yml' not in file:
                 source_file = os.path.join(root, file)
-                doc_json = process_fun(source_file)
-                docs.append(doc_json)
+                tasks.append((source_file, (source_file,)))
 
-    dest_file_path = os.path.join(get_project_root(), CONSTANTS.AGENT3.DATA_FOLDER, save_file_name)
-    if add_to_existing:
-        # If file is present, load it and append to it
-        if os.path.exists(dest_file_path):
-            existing_samples = json.load(open(dest_file_path, 'r'))
-            docs.extend(existing_samples)
-        json.dump(docs, open(dest_file_path, 'w'), indent=4)
-        return
-    # If file is present, delete it
-    if os.path.exists(dest_file_path):
-        os.remove(dest_file_path)
-    json.dump(docs, open(dest_file_path, 'w'), indent=4)
\ No newline at end of file
+    if incremental:
+        # Only re-process docs that changed since the last run, and only write index actions for what changed
+        docs = iter_incrementally(tasks, process_fun, dest_file_path, "docs", get_project_root(), workers)
+    else:
+        # Parse files in a process pool, failed files are reported and left out
+        docs = (result.doc for result in process_files(tasks, process_fun, workers) if result.doc is not None)
+
+    # Stream each document to the output as soon as it is produced, .jsonl/.ndjson files get one document per line.
+    # With add_to_existing the documents are appended without reading the existing file.
+    with DocumentWriter(dest_file_path, append=add_to_existing) as writer:
+        writer.write_all(docs)
+    print(f"Wrote {writer.count} docs to {dest_file_path}")
\ No newline at end of file
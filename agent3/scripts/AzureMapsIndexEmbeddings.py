@@ -0,0 +1,48 @@
+from dotenv import load_dotenv
+load_dotenv()
+
+import asyncio
+import os
+import sys
+
+from openai import AsyncAzureOpenAI
+from common.constants import CONSTANTS
+from common.helpers import get_project_root
+from common.embeddings import EmbeddingCache, EmbeddingGenerator, embed_index_file
+
+def create_generator(endpoint = None, api_key = None):
+    """Embedding generator for the embedding deployment, with the local embedding cache"""
+    model = os.getenv('AzureOpenAI_EMBEDDING_DEPLOYMENT', CONSTANTS.AGENT3.EMBEDDING_MODEL)
+    client = AsyncAzureOpenAI(
+        api_key=api_key or os.getenv('AzureOpenAI_API_KEY'),
+        api_version=CONSTANTS.AZURE_OPENAI.API_VERSION,
+        azure_endpoint=endpoint or os.getenv('AzureOpenAI_ENDPOINT'),
+        # Rate limits are retried by the generator, with backoff shared across batches
+        max_retries=0
+    )
+    cache = EmbeddingCache(os.path.join(get_project_root(), CONSTANTS.AGENT3.EMBEDDING_CACHE_FOLDER), model)
+    return EmbeddingGenerator(
+        client, model, cache,
+        batch_size=int(os.getenv('EMBEDDING_BATCH_SIZE', '64')),
+        max_concurrency=int(os.getenv('EMBEDDING_MAX_CONCURRENCY', '4'))
+    )
+
+async def embed_index(save_file_name = 'azmaps_code_samples_docs.json', endpoint = None, api_key = None):
+    """Embed the embedding_content of every document in an index output file, skipping cached texts"""
+    generator = create_generator(endpoint, api_key)
+    try:
+        return await embed_index_file(os.path.join(get_project_root(), CONSTANTS.AGENT3.DATA_FOLDER, save_file_name), generator)
+    finally:
+        await generator.client.close()
+
+if __name__ == '__main__':
+    # Usage: python AzureMapsIndexEmbeddings.py [save_file_name] [--stub]
+    # --stub embeds against a local stub embedding server instead of Azure OpenAI
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    fileName = args[0] if args else 'azmaps_code_samples_docs.json'
+    endpoint = api_key = None
+    if '--stub' in sys.argv[1:]:
+        from StubEmbeddingServer import start_stub_server
+        server = start_stub_server(rate_limit_every=10)
+        endpoint, api_key = f"http://{server.server_address[0]}:{server.server_address[1]}", "stub"
+    asyncio.run(embed_index(fileName, endpoint, api_key))
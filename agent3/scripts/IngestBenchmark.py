@@ -0,0 +1,68 @@
+"""Benchmark of parallel ingestion, files/sec with 1 worker compared with N workers.
+
+Usage: python IngestBenchmark.py [samples|docs] [workers]
+
+Runs the sample or doc processing of the index creation scripts over their source folder.
+Workers defaults to INGEST_WORKERS or one per core.
+"""
+from dotenv import load_dotenv
+load_dotenv()
+
+import os
+import sys
+import time
+
+from common.constants import CONSTANTS
+from common.helpers import get_project_root
+from common.parallel import default_workers, iter_process_files
+from AzureMapsCodeSamplesIndexCreation import process_html_sample
+from AzureMapsDocsIndexCreation import process_yml_file
+
+
+def sample_tasks():
+    source_folder = os.path.join(get_project_root(), CONSTANTS.AGENT3.AZURE_MAPS_CODE_SAMPLES_FOLDER)
+    tasks = []
+    for root, dirs, files in os.walk(source_folder):
+        for file in files:
+            if file.lower().endswith(('.html', '.htm')):
+                source_file = os.path.join(root, file)
+                category = root.split("\\")[-2].replace("-", " ")
+                tasks.append((source_file, (source_file, f"{category}-{file}", category)))
+    return tasks
+
+
+def doc_tasks():
+    source_folder = os.path.join(get_project_root(), CONSTANTS.AGENT3.AZURE_SDK_DOCS_FOLDER)
+    tasks = []
+    for root, dirs, files in os.walk(source_folder):
+        for file in files:
+            if file.lower().endswith('.yml') and 'toc.yml' not in file:
+                source_file = os.path.join(root, file)
+                tasks.append((source_file, (source_file,)))
+    return tasks
+
+
+def run(tasks, process_fun, workers, ordered=True):
+    start = time.perf_counter()
+    results = list(iter_process_files(tasks, process_fun, workers, ordered=ordered))
+    elapsed = time.perf_counter() - start
+    failed = sum(1 for result in results if result.doc is None)
+    return elapsed, failed
+
+
+if __name__ == "__main__":
+    kind = sys.argv[1] if len(sys.argv) > 1 else "docs"
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else default_workers()
+    tasks, process_fun = (sample_tasks(), process_html_sample) if kind == "samples" else (doc_tasks(), process_yml_file)
+    if not tasks:
+        print(f"No {kind} files found")
+        sys.exit(1)
+    print(f"{len(tasks)} {kind} files, {os.cpu_count()} cores")
+
+    baseline = None
+    for label, count, ordered in [("1 worker", 1, True), (f"{workers} workers", workers, True),
+                                  (f"{workers} workers unordered", workers, False)]:
+        elapsed, failed = run(tasks, process_fun, count, ordered)
+        baseline = baseline or elapsed
+        print(f"{label:<24} {len(tasks) / elapsed:8.0f} files/sec  {elapsed:6.2f}s  "
+              f"speedup {baseline / elapsed:4.1f}x  {failed} failed")
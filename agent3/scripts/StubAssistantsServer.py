@@ -0,0 +1,199 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import json
+import re
+import threading
+import time
+import uuid
+
+STUB_REPLY = "Use a BubbleLayer on a DataSource to show your points, sized by a numeric property."
+
+
+class StubAssistantsServer(ThreadingHTTPServer):
+    """Fake Assistants API: threads, messages, runs (polled or streamed), files and assistants.
+
+    Runs are queued for a moment, then in progress, and end with final_status after run_seconds.
+    Counts retrieve calls per run in polls, so callers can check how often they polled.
+    """
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, address, handler, run_seconds=1.0, final_status="completed", upload_latency=0.0):
+        super().__init__(address, handler)
+        self.run_seconds = run_seconds
+        self.final_status = final_status
+        self.upload_latency = upload_latency
+        self.lock = threading.Lock()
+        self.runs = {}
+        self.messages = {}
+        self.files = {}
+        self.polls = {}
+
+
+def _run_object(run, status):
+    now = int(time.time())
+    return {
+        "id": run["id"], "object": "thread.run", "created_at": int(run["created"]), "thread_id": run["thread_id"],
+        "assistant_id": run["assistant_id"], "status": status, "required_action": None,
+        "last_error": {"code": "server_error", "message": "Stub run failed"} if status == "failed" else None,
+        "expires_at": None, "started_at": now, "cancelled_at": None, "failed_at": None, "completed_at": None,
+        "incomplete_details": None, "model": "gpt-4", "instructions": "", "tools": [], "metadata": {},
+        "usage": None, "temperature": 1.0, "top_p": 1.0, "max_prompt_tokens": None, "max_completion_tokens": None,
+        "truncation_strategy": {"type": "auto", "last_messages": None}, "response_format": "auto",
+        "tool_choice": "auto", "parallel_tool_calls": True
+    }
+
+
+def _message_object(thread_id, role, text, message_id=None, run_id=None):
+    return {
+        "id": message_id or f"msg_{uuid.uuid4().hex}", "object": "thread.message", "created_at": int(time.time()),
+        "thread_id": thread_id, "role": role, "status": "completed", "assistant_id": None, "run_id": run_id,
+        "attachments": [], "metadata": {}, "incomplete_details": None, "completed_at": None, "incomplete_at": None,
+        "content": [{"type": "text", "text": {"value": text, "annotations": []}}] if text is not None else []
+    }
+
+
+class StubAssistantsHandler(BaseHTTPRequestHandler):
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length) if length else b""
+        if self.headers.get("Content-Type", "").startswith("application/json") and body:
+            return json.loads(body)
+        return {"raw": body}
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _status(self, run):
+        if run["final"]:
+            return run["final"]
+        elapsed = time.monotonic() - run["started"]
+        if elapsed >= self.server.run_seconds:
+            run["final"] = self.server.final_status
+            if run["final"] == "completed":
+                self.server.messages[run["thread_id"]].append(
+                    _message_object(run["thread_id"], "assistant", STUB_REPLY, run_id=run["id"]))
+            return run["final"]
+        return "queued" if elapsed < self.server.run_seconds / 10 else "in_progress"
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        with self.server.lock:
+            match = re.search(r"/threads/([^/]+)/runs/([^/]+)$", path)
+            if match:
+                run = self.server.runs.get(match.group(2))
+                if not run:
+                    return self._send_json({"error": {"message": "Run not found"}}, 404)
+                self.server.polls[run["id"]] = self.server.polls.get(run["id"], 0) + 1
+                return self._send_json(_run_object(run, self._status(run)))
+            match = re.search(r"/threads/([^/]+)/messages$", path)
+            if match:
+                # Newest first, like the real API
+                data = list(reversed(self.server.messages.get(match.group(1), [])))
+                return self._send_json({"object": "list", "data": data, "first_id": None, "last_id": None, "has_more": False})
+            if path.endswith("/files"):
+                data = [{"id": file_id, "object": "file", "bytes": size, "created_at": 0, "filename": "upload",
+                         "purpose": "assistants", "status": "processed"} for file_id, size in self.server.files.items()]
+                return self._send_json({"object": "list", "data": data, "has_more": False})
+            if path.endswith("/models"):
+                return self._send_json({"object": "list", "data": []})
+        self._send_json({"error": {"message": f"Unknown path {path}"}}, 404)
+
+    def do_POST(self):
+        path = self.path.split("?")[0]
+        request = self._read_json()
+        if path.endswith("/files"):
+            time.sleep(self.server.upload_latency)
+            file_id = f"file-{uuid.uuid4().hex}"
+            with self.server.lock:
+                self.server.files[file_id] = len(request.get("raw", b""))
+            return self._send_json({"id": file_id, "object": "file", "bytes": self.server.files[file_id],
+                                    "created_at": int(time.time()), "filename": "upload", "purpose": "assistants",
+                                    "status": "processed"})
+        if path.endswith("/assistants"):
+            return self._send_json({"id": f"asst_{uuid.uuid4().hex}", "object": "assistant", "created_at": int(time.time()),
+                                    "name": request.get("name"), "model": request.get("model"), "instructions": "",
+                                    "tools": [], "metadata": {}})
+        if path.endswith("/threads"):
+            thread_id = f"thread_{uuid.uuid4().hex}"
+            with self.server.lock:
+                self.server.messages[thread_id] = []
+            return self._send_json({"id": thread_id, "object": "thread", "created_at": int(time.time()), "metadata": {}})
+        match = re.search(r"/threads/([^/]+)/messages$", path)
+        if match:
+            message = _message_object(match.group(1), "user", request["content"])
+            with self.server.lock:
+                self.server.messages.setdefault(match.group(1), []).append(message)
+            return self._send_json(message)
+        match = re.search(r"/threads/([^/]+)/runs/([^/]+)/cancel$", path)
+        if match:
+            with self.server.lock:
+                run = self.server.runs[match.group(2)]
+                run["final"] = run["final"] or "cancelled"
+                return self._send_json(_run_object(run, run["final"]))
+        match = re.search(r"/threads/([^/]+)/runs$", path)
+        if match:
+            run = {"id": f"run_{uuid.uuid4().hex}", "thread_id": match.group(1), "assistant_id": request["assistant_id"],
+                   "created": time.time(), "started": time.monotonic(), "final": None}
+            with self.server.lock:
+                self.server.runs[run["id"]] = run
+                self.server.messages.setdefault(match.group(1), [])
+            if request.get("stream"):
+                return self._send_run_stream(run)
+            return self._send_json(_run_object(run, "queued"))
+        self._send_json({"error": {"message": f"Unknown path {path}"}}, 404)
+
+    def _send_run_stream(self, run):
+        """Send the run lifecycle and the reply as server-sent events, word by word."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+
+        def send(event, data):
+            self.wfile.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        send("thread.run.created", _run_object(run, "queued"))
+        send("thread.run.in_progress", _run_object(run, "in_progress"))
+        final_status = self.server.final_status
+        if final_status == "completed":
+            message = _message_object(run["thread_id"], "assistant", None, run_id=run["id"])
+            send("thread.message.created", message)
+            words = STUB_REPLY.split(" ")
+            for i, word in enumerate(words):
+                time.sleep(self.server.run_seconds / len(words))
+                text = word if i == 0 else " " + word
+                send("thread.message.delta", {"id": message["id"], "object": "thread.message.delta",
+                                              "delta": {"content": [{"index": 0, "type": "text", "text": {"value": text, "annotations": []}}]}})
+            with self.server.lock:
+                self.server.messages[run["thread_id"]].append(
+                    _message_object(run["thread_id"], "assistant", STUB_REPLY, message["id"], run["id"]))
+            send("thread.message.completed", _message_object(run["thread_id"], "assistant", STUB_REPLY, message["id"], run["id"]))
+        else:
+            time.sleep(self.server.run_seconds)
+        with self.server.lock:
+            run["final"] = final_status
+        send(f"thread.run.{final_status}", _run_object(run, final_status))
+        self.wfile.write(b"event: done\ndata: [DONE]\n\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(run_seconds: float = 1.0, final_status: str = "completed", upload_latency: float = 0.0,
+                      host: str = "127.0.0.1", port: int = 0) -> StubAssistantsServer:
+    """Start the stub server on a background thread and return it. Port 0 picks a free port."""
+    server = StubAssistantsServer((host, port), StubAssistantsHandler, run_seconds, final_status, upload_latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    server = start_stub_server(port=8102)
+    print(f"Stub Assistants server listening on http://{server.server_address[0]}:{server.server_address[1]}")
+    threading.Event().wait()
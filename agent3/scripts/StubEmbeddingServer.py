@@ -0,0 +1,78 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import hashlib
+import json
+import threading
+import time
+
+import numpy as np
+
+
+class StubEmbeddingServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+    requests_served = 0
+    rate_limited = 0
+
+
+class StubEmbeddingHandler(BaseHTTPRequestHandler):
+    """Answers any POST with deterministic unit vectors per input text after a fixed delay.
+
+    Every rate_limit_every-th request is rejected with 429 and a retry-after-ms header.
+    """
+    latency = 0.05
+    dimensions = 1536
+    rate_limit_every = 0
+    _lock = threading.Lock()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        with self._lock:
+            self.server.requests_served += 1
+            limited = self.rate_limit_every and self.server.requests_served % self.rate_limit_every == 0
+            self.server.rate_limited += bool(limited)
+        time.sleep(self.latency)
+        if limited:
+            body = json.dumps({"error": {"code": "429", "message": "Rate limit is exceeded."}}).encode("utf-8")
+            self.send_response(429)
+            self.send_header("retry-after-ms", "50")
+        else:
+            texts = request.get("input", [])
+            texts = [texts] if isinstance(texts, str) else texts
+            body = json.dumps({
+                "object": "list",
+                "model": request.get("model", "text-embedding-ada-002"),
+                "data": [{"object": "embedding", "index": i, "embedding": self.embedding(text)}
+                         for i, text in enumerate(texts)],
+                "usage": {"prompt_tokens": len(texts), "total_tokens": len(texts)}
+            }).encode("utf-8")
+            self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    @classmethod
+    def embedding(cls, text):
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(cls.dimensions).astype(np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(latency: float = 0.05, rate_limit_every: int = 0, dimensions: int = 1536,
+                      host: str = "127.0.0.1", port: int = 0) -> StubEmbeddingServer:
+    """Start the stub server on a background thread and return it. Port 0 picks a free port."""
+    handler = type("ConfiguredStubEmbeddingHandler", (StubEmbeddingHandler,),
+                   {"latency": latency, "rate_limit_every": rate_limit_every, "dimensions": dimensions})
+    server = StubEmbeddingServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    server = start_stub_server(port=8101)
+    print(f"Stub embedding server listening on http://{server.server_address[0]}:{server.server_address[1]}")
+    threading.Event().wait()
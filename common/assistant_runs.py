@@ -0,0 +1,150 @@
+import asyncio
+import random
+import time
+from typing import Any, Callable, List, Optional, Sequence, Tuple, Union
+
+import openai
+
+# Statuses after which a run makes no further progress on its own
+TERMINAL_STATUSES = {"completed", "failed", "cancelled", "expired", "incomplete"}
+# The run is paused until the caller submits tool outputs
+ACTION_STATUSES = {"requires_action"}
+
+
+class RunTimeoutError(TimeoutError):
+    def __init__(self, run: Optional[Any], timeout: float):
+        state = f"Run {run.id} still {run.status}" if run is not None else "Run not started"
+        super().__init__(f"{state} after {timeout:.0f}s")
+        self.run = run
+
+
+class RunFailedError(RuntimeError):
+    def __init__(self, run: Any):
+        error = getattr(run, "last_error", None) or getattr(run, "incomplete_details", None)
+        super().__init__(f"Run {run.id} ended {run.status}" + (f": {getattr(error, 'message', None) or error}" if error else ""))
+        self.run = run
+
+
+class Backoff:
+    """Exponential delays with jitter: initial, initial * factor, ... capped at maximum, each scaled by 0.5-1.0"""
+
+    def __init__(self, initial: float = 0.25, maximum: float = 5.0, factor: float = 2.0):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.attempt = 0
+
+    def next_delay(self) -> float:
+        delay = min(self.maximum, self.initial * self.factor ** self.attempt)
+        self.attempt += 1
+        return delay * random.uniform(0.5, 1.0)
+
+
+def check_run(run: Any) -> Any:
+    """Return a completed or requires_action run, raise RunFailedError for any other terminal status"""
+    if run.status in TERMINAL_STATUSES and run.status != "completed":
+        raise RunFailedError(run)
+    return run
+
+
+def wait_for_run(client: openai.AzureOpenAI, thread_id: str, run_id: str, timeout: float = 300.0,
+                 backoff: Optional[Backoff] = None, cancel_on_timeout: bool = True,
+                 deadline: Optional[float] = None) -> Any:
+    """Poll a run with exponential backoff until it is terminal or requires action.
+
+    Raises RunFailedError when the run failed, was cancelled, expired or is incomplete, and
+    RunTimeoutError (after cancelling the run) when it is still going after timeout seconds.
+    deadline, a time.monotonic() value, replaces timeout when the run was started earlier.
+    """
+    backoff = backoff or Backoff()
+    deadline = deadline if deadline is not None else time.monotonic() + timeout
+    while True:
+        run = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id)
+        if run.status in TERMINAL_STATUSES or run.status in ACTION_STATUSES:
+            return check_run(run)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            if cancel_on_timeout:
+                client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+            raise RunTimeoutError(run, timeout)
+        time.sleep(min(backoff.next_delay(), remaining))
+
+
+async def async_wait_for_run(client: openai.AsyncAzureOpenAI, thread_id: str, run_id: str, timeout: float = 300.0,
+                             backoff: Optional[Backoff] = None, cancel_on_timeout: bool = True) -> Any:
+    """Asyncio version of wait_for_run."""
+    backoff = backoff or Backoff()
+    deadline = time.monotonic() + timeout
+    while True:
+        run = await client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id)
+        if run.status in TERMINAL_STATUSES or run.status in ACTION_STATUSES:
+            return check_run(run)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            if cancel_on_timeout:
+                await client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+            raise RunTimeoutError(run, timeout)
+        await asyncio.sleep(min(backoff.next_delay(), remaining))
+
+
+async def wait_for_runs(client: openai.AsyncAzureOpenAI, runs: Sequence[Tuple[str, str]], timeout: float = 300.0,
+                        max_concurrency: int = 32) -> List[Union[Any, Exception]]:
+    """Wait on many (thread_id, run_id) runs at once.
+
+    Returns the final run, or the RunFailedError / RunTimeoutError it raised, in input order.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def wait(thread_id: str, run_id: str):
+        async with semaphore:
+            return await async_wait_for_run(client, thread_id, run_id, timeout=timeout)
+
+    return await asyncio.gather(*(wait(thread_id, run_id) for thread_id, run_id in runs), return_exceptions=True)
+
+
+def stream_run(client: openai.AzureOpenAI, thread_id: str, assistant_id: str, timeout: float = 300.0,
+               on_text: Optional[Callable[[str], None]] = None) -> Any:
+    """Create a run and follow its server-sent events instead of polling.
+
+    Text deltas are passed to on_text as they arrive. Falls back to polling when the endpoint
+    does not support streaming runs. Returns the final run, checked like wait_for_run.
+
+    timeout covers the whole run, streaming and any polling after it: once it has passed the
+    run is cancelled and RunTimeoutError raised, also when the stream stalls and the request
+    itself times out.
+    """
+    deadline = time.monotonic() + timeout
+    run = None
+    try:
+        with client.beta.threads.runs.stream(thread_id=thread_id, assistant_id=assistant_id, timeout=timeout) as stream:
+            for event in stream:
+                run = stream.current_run or run
+                if event.event == "thread.message.delta" and on_text:
+                    for part in event.data.delta.content or []:
+                        if part.type == "text" and part.text and part.text.value:
+                            on_text(part.text.value)
+                if time.monotonic() >= deadline:
+                    break
+            run = stream.current_run or run
+    except (openai.BadRequestError, openai.NotFoundError) as e:
+        print(f"Run streaming not available, polling instead: {str(e)}")
+        run = client.beta.threads.runs.create(thread_id=thread_id, assistant_id=assistant_id)
+        return wait_for_run(client, thread_id, run.id, timeout=timeout, deadline=deadline)
+    except openai.APITimeoutError as e:
+        if run is not None:
+            _cancel_run(client, thread_id, run.id)
+        raise RunTimeoutError(run, timeout) from e
+    if run is None:
+        raise RuntimeError("Run stream ended without a run")
+    if run.status not in TERMINAL_STATUSES and run.status not in ACTION_STATUSES:
+        # Out of time, or the stream closed early and the run may still be going
+        return wait_for_run(client, thread_id, run.id, timeout=timeout, deadline=deadline)
+    return check_run(run)
+
+
+def _cancel_run(client: openai.AzureOpenAI, thread_id: str, run_id: str) -> None:
+    try:
+        client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+    except openai.APIError as e:
+        # The run may have ended meanwhile
+        print(f"Could not cancel run {run_id}: {str(e)}")
@@ -5,6 +5,9 @@ class CONSTANTS:
         DATA_FOLDER = "agent3\data"
         AZURE_MAPS_CODE_SAMPLES_FOLDER = "agent3\AzureMapsCodeSamples\Samples"
         AZURE_SDK_DOCS_FOLDER = "agent3\\azure-iot-docs-sdk-typescript\docs-ref-autogen"
+        YAML_CACHE_FOLDER = "agent3\\data\\yaml_cache"
+        EMBEDDING_CACHE_FOLDER = "agent3\\data\\embedding_cache"
+        EMBEDDING_MODEL = "text-embedding-ada-002"
 
     class AZURE_OPENAI:
         API_VERSION = "2024-08-01-preview"
\ No newline at end of file
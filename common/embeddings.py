@@ -0,0 +1,188 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import openai
+
+from common.export import iter_documents
+
+_KEY_SIZE = 32
+
+
+class EmbeddingCache:
+    """On-disk embedding cache for one model, keyed by the sha256 of the text.
+
+    Stored as two append-only files: keys.bin with 32-byte text hashes and vectors.f32 with the
+    float32 rows in the same order. A torn tail from an interrupted run is ignored on load.
+    Not safe for concurrent writers in several processes.
+    """
+
+    def __init__(self, directory: str, model: str):
+        self.directory = os.path.join(directory, re.sub(r'[^\w.-]', '_', model))
+        os.makedirs(self.directory, exist_ok=True)
+        self._keys_path = os.path.join(self.directory, "keys.bin")
+        self._vectors_path = os.path.join(self.directory, "vectors.f32")
+        self._meta_path = os.path.join(self.directory, "meta.json")
+        self.dimensions: Optional[int] = None
+        self._rows: Dict[bytes, int] = {}
+        self._vectors: Optional[np.memmap] = None
+        self._load()
+
+    @staticmethod
+    def key(text: str) -> bytes:
+        return hashlib.sha256(text.encode("utf-8")).digest()
+
+    def _load(self):
+        if not os.path.exists(self._meta_path):
+            return
+        with open(self._meta_path, 'r', encoding='utf-8') as f:
+            self.dimensions = json.load(f)["dimensions"]
+        for path in (self._keys_path, self._vectors_path):
+            open(path, 'ab').close()
+        with open(self._keys_path, 'rb') as f:
+            keys = f.read()
+        rows = min(len(keys) // _KEY_SIZE, os.path.getsize(self._vectors_path) // (4 * self.dimensions))
+        for row in range(rows):
+            self._rows[keys[row * _KEY_SIZE:(row + 1) * _KEY_SIZE]] = row
+        # Drop a partially written last row so appends stay aligned
+        for path, size in ((self._keys_path, rows * _KEY_SIZE), (self._vectors_path, rows * 4 * self.dimensions)):
+            if os.path.getsize(path) != size:
+                with open(path, 'r+b') as f:
+                    f.truncate(size)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _matrix(self) -> np.memmap:
+        if self._vectors is None:
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode='r',
+                                      shape=(os.path.getsize(self._vectors_path) // (4 * self.dimensions), self.dimensions))
+        return self._vectors
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        rows = [self._rows.get(self.key(text)) for text in texts]
+        if not any(row is not None for row in rows):
+            return [None] * len(texts)
+        matrix = self._matrix()
+        return [None if row is None else np.array(matrix[row]) for row in rows]
+
+    def put_many(self, texts: Sequence[str], vectors: np.ndarray):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if self.dimensions is None:
+            self.dimensions = vectors.shape[1]
+            with open(self._meta_path, 'w', encoding='utf-8') as f:
+                json.dump({"dimensions": self.dimensions}, f)
+        if vectors.shape[1] != self.dimensions:
+            raise ValueError(f"Expected {self.dimensions} dimensions, got {vectors.shape[1]}")
+        keys = [self.key(text) for text in texts]
+        # Release the mapping before the file grows, Windows does not allow extending a mapped file
+        self._vectors = None
+        start = len(self._rows)
+        # Vectors first, a key is only trusted once its row is on disk
+        with open(self._vectors_path, 'ab') as f:
+            f.write(vectors.tobytes())
+        with open(self._keys_path, 'ab') as f:
+            f.write(b"".join(keys))
+        for offset, key in enumerate(keys):
+            self._rows[key] = start + offset
+
+
+class EmbeddingGenerator:
+    """Embed texts in batches, running several batches concurrently with backoff on rate limits.
+
+    Texts already in the cache are never sent again; each batch is cached as soon as it returns.
+    """
+
+    def __init__(self, client: openai.AsyncAzureOpenAI, model: str, cache: Optional[EmbeddingCache] = None,
+                 batch_size: int = 64, max_concurrency: int = 4, max_retries: int = 8,
+                 backoff_base: float = 1.0, backoff_max: float = 60.0):
+        self.client = client
+        self.model = model
+        self.cache = cache
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.stats = {"texts": 0, "cached": 0, "embedded": 0, "requests": 0, "retries": 0}
+
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        """Exponential backoff with jitter, at least as long as the server asks for"""
+        delay = min(self.backoff_max, self.backoff_base * 2 ** attempt) * random.uniform(0.5, 1.0)
+        response = getattr(error, "response", None)
+        if response is not None:
+            try:
+                if "retry-after-ms" in response.headers:
+                    return max(delay, float(response.headers["retry-after-ms"]) / 1000)
+                if "retry-after" in response.headers:
+                    return max(delay, float(response.headers["retry-after"]))
+            except ValueError:
+                pass
+        return delay
+
+    async def _embed_batch(self, batch: List[str]) -> np.ndarray:
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._semaphore:
+                    self.stats["requests"] += 1
+                    response = await self.client.embeddings.create(model=self.model, input=batch)
+                break
+            except (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError) as e:
+                if attempt == self.max_retries:
+                    raise
+                self.stats["retries"] += 1
+                await asyncio.sleep(self._retry_delay(e, attempt))
+        vectors = np.array([item.embedding for item in sorted(response.data, key=lambda item: item.index)],
+                           dtype=np.float32)
+        if self.cache is not None:
+            self.cache.put_many(batch, vectors)
+        return vectors
+
+    async def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """Return one float32 row per text"""
+        unique = list(dict.fromkeys(texts))
+        cached = self.cache.get_many(unique) if self.cache is not None else [None] * len(unique)
+        vectors = {text: vector for text, vector in zip(unique, cached) if vector is not None}
+        missing = [text for text, vector in zip(unique, cached) if vector is None]
+        batches = [missing[i:i + self.batch_size] for i in range(0, len(missing), self.batch_size)]
+        results = await asyncio.gather(*(self._embed_batch(batch) for batch in batches))
+        for batch, batch_vectors in zip(batches, results):
+            vectors.update(zip(batch, batch_vectors))
+
+        self.stats["texts"] += len(texts)
+        self.stats["cached"] += len(unique) - len(missing)
+        self.stats["embedded"] += len(missing)
+        if not texts:
+            return np.zeros((0, self.cache.dimensions if self.cache and self.cache.dimensions else 0), dtype=np.float32)
+        return np.stack([vectors[text] for text in texts])
+
+
+async def embed_index_file(index_file_path: str, generator: EmbeddingGenerator) -> np.ndarray:
+    """Embed the embedding_content of every document in an index output file.
+
+    Writes {index_file}.vectors.npy with one float32 row per document, in file order, and
+    {index_file}.vectors.ids.json with the matching document IDs. Delete actions of an
+    incremental output have nothing to embed and are skipped.
+    """
+    ids, texts = [], []
+    for doc in iter_documents(index_file_path):
+        if doc.get("@search.action") == "delete":
+            continue
+        ids.append(doc["id"])
+        # The embeddings API rejects empty input
+        texts.append(doc.get("embedding_content") or doc.get("title") or doc["id"])
+    start = time.perf_counter()
+    vectors = await generator.embed(texts)
+    np.save(f"{index_file_path}.vectors.npy", vectors)
+    with open(f"{index_file_path}.vectors.ids.json", 'w', encoding='utf-8') as f:
+        json.dump(ids, f)
+    stats = generator.stats
+    print(f"Embedded {len(texts)} documents in {time.perf_counter() - start:.1f}s: {stats['cached']} cached, "
+          f"{stats['embedded']} embedded in {stats['requests']} requests, {stats['retries']} retries")
+    return vectors
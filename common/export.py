@@ -0,0 +1,153 @@
+import json
+import os
+import re
+import sys
+from typing import Any, Dict, Iterable, Iterator, Optional, Sequence, Tuple
+
+_WHITESPACE = re.compile(r'[\s,]*')
+_CHUNK_SIZE = 1 << 16
+
+
+def is_jsonl(path: str) -> bool:
+    return str(path).lower().endswith(('.jsonl', '.ndjson'))
+
+
+class DocumentWriter:
+    """Write index documents one at a time, as a JSON array or as JSONL/NDJSON (one document per line).
+
+    The format follows the file extension unless jsonl is given. With append=True, documents are
+    added to an existing file without reading it: JSONL is opened for append, and a JSON array is
+    truncated at its closing bracket and continued from there.
+    """
+
+    def __init__(self, path: str, append: bool = False, jsonl: Optional[bool] = None):
+        self.path = str(path)
+        self.jsonl = is_jsonl(self.path) if jsonl is None else jsonl
+        self.count = 0
+        exists = append and os.path.exists(self.path) and os.path.getsize(self.path) > 0
+        if self.jsonl:
+            self._file = open(self.path, 'ab' if exists else 'wb')
+            self._separator = b""
+        elif exists:
+            self._file = open(self.path, 'r+b')
+            self._separator = b",\n" if self._reopen_array() else b"\n"
+        else:
+            self._file = open(self.path, 'wb')
+            self._file.write(b"[")
+            self._separator = b"\n"
+
+    def _reopen_array(self) -> bool:
+        """Truncate the file at the closing bracket of its array, returns whether the array has items"""
+        end = self._file.seek(0, os.SEEK_END)
+        tail_start = max(0, end - 4096)
+        self._file.seek(tail_start)
+        tail = self._file.read().rstrip()
+        if not tail.endswith(b"]"):
+            raise ValueError(f"{self.path} does not end with a JSON array")
+        content = tail[:-1].rstrip()
+        self._file.truncate(tail_start + len(content))
+        self._file.seek(0, os.SEEK_END)
+        return not content.endswith(b"[")
+
+    def write(self, doc: Dict[str, Any]):
+        data = json.dumps(doc).encode('utf-8')
+        if self.jsonl:
+            self._file.write(data + b"\n")
+        else:
+            self._file.write(self._separator + data)
+            self._separator = b",\n"
+        self.count += 1
+
+    def write_all(self, docs: Iterable[Dict[str, Any]]) -> int:
+        for doc in docs:
+            self.write(doc)
+        return self.count
+
+    def close(self):
+        if self._file.closed:
+            return
+        if not self.jsonl:
+            self._file.write(b"\n]\n")
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _iter_json_array(f) -> Iterator[Dict[str, Any]]:
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = "", 0, False
+
+    def fill():
+        nonlocal buffer, pos, eof
+        chunk = f.read(_CHUNK_SIZE)
+        eof = not chunk
+        buffer, pos = buffer[pos:] + chunk, 0
+
+    fill()
+    pos = _WHITESPACE.match(buffer, pos).end()
+    if buffer[pos:pos + 1] != "[":
+        raise ValueError("Expected a JSON array of documents")
+    pos += 1
+    while True:
+        pos = _WHITESPACE.match(buffer, pos).end()
+        if pos == len(buffer):
+            if eof:
+                raise ValueError("Unterminated JSON array")
+            fill()
+            continue
+        if buffer[pos] == "]":
+            return
+        try:
+            doc, pos = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # The document continues past the buffer, read more and decode it again
+            if eof:
+                raise
+            fill()
+            continue
+        yield doc
+
+
+def iter_documents(path: str) -> Iterator[Dict[str, Any]]:
+    """Stream documents from a JSON array or JSONL file without loading the whole file"""
+    with open(path, 'r', encoding='utf-8') as f:
+        if is_jsonl(path):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from _iter_json_array(f)
+
+
+def merge_documents(sources: Sequence[str], dest_file_path: str, key: str = "id") -> Tuple[int, int]:
+    """Stream the documents of all sources into dest_file_path, keeping the first document per key.
+
+    Only the keys seen so far are kept in memory. List the newest source first to let it win.
+    Returns the number of documents written and the number of duplicates dropped.
+    """
+    if any(os.path.abspath(source) == os.path.abspath(dest_file_path) for source in sources):
+        raise ValueError("The merge destination cannot be one of its sources")
+    seen = set()
+    duplicates = 0
+    with DocumentWriter(dest_file_path) as writer:
+        for source in sources:
+            for doc in iter_documents(source):
+                if doc.get(key) in seen:
+                    duplicates += 1
+                    continue
+                seen.add(doc.get(key))
+                writer.write(doc)
+    return writer.count, duplicates
+
+
+if __name__ == "__main__":
+    # Usage: python -m common.export merge <dest> <source> [<source> ...]
+    if len(sys.argv) < 4 or sys.argv[1] != "merge":
+        print("Usage: python -m common.export merge <dest.json|dest.jsonl> <source> [<source> ...]")
+        sys.exit(1)
+    written, duplicates = merge_documents(sys.argv[3:], sys.argv[2])
+    print(f"Wrote {written} documents to {sys.argv[2]}, dropped {duplicates} duplicates")
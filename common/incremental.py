@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+from typing import Any, Callable, Dict, Iterator, Optional, Sequence, Tuple
+
+from common.export import DocumentWriter, iter_documents
+from common.parallel import process_files
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def stable_id(*parts: str) -> str:
+    """Deterministic document ID derived from the given parts, valid as an Azure AI Search key."""
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()[:32]
+
+
+def document_hash(doc: Dict[str, Any]) -> str:
+    return content_hash(json.dumps(doc, sort_keys=True).encode("utf-8"))
+
+
+def _load_json(path: str, default: Any) -> Any:
+    if not os.path.exists(path):
+        return default
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def iter_incrementally(tasks: Sequence[Tuple[str, tuple]], process_fun: Callable[..., Optional[Dict[str, Any]]],
+                       dest_file_path: str, kind: str, root: str,
+                       workers: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """Process only the files that changed since the last run and yield Azure AI Search index actions for them.
+
+    tasks holds (source_path, process_fun args) per file, and process_fun must derive document IDs
+    from the file's path or name so an edited file keeps its ID. Yields added and changed documents
+    with "@search.action": "mergeOrUpload", then {"@search.action": "delete", "id": ...} for the
+    documents of removed files. Unchanged documents are not yielded. Next to dest_file_path this keeps:
+      {dest}.{kind}.manifest.json   path relative to root -> mtime, size, file hash, document ID and document hash
+      {dest}.{kind}.docs.jsonl      every current document, for a full rebuild of the index
+    Unchanged files are recognized by mtime and size without reading them; files whose mtime
+    changed are hashed and only re-processed when their content changed. A re-processed document
+    whose content hash did not change is not yielded either. Files that fail keep their previous
+    document and are retried next run. Changed files are processed in parallel with
+    common.parallel.process_files. The bookkeeping files are only written once the generator is exhausted.
+    """
+    manifest_path = f"{dest_file_path}.{kind}.manifest.json"
+    store_path = f"{dest_file_path}.{kind}.docs.jsonl"
+    old_manifest = _load_json(manifest_path, {})
+    new_manifest = {}
+    to_process = []
+
+    keys = {source_path: os.path.relpath(source_path, root).replace(os.sep, "/") for source_path, _ in tasks}
+    for source_path, args in tasks:
+        key = keys[source_path]
+        stat = os.stat(source_path)
+        entry = old_manifest.get(key)
+        if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size:
+            new_manifest[key] = entry
+            continue
+        with open(source_path, 'rb') as f:
+            digest = content_hash(f.read())
+        if entry and entry["hash"] == digest:
+            new_manifest[key] = {**entry, "mtime": stat.st_mtime, "size": stat.st_size}
+            continue
+        new_manifest[key] = {"mtime": stat.st_mtime, "size": stat.st_size, "hash": digest, "id": None, "doc_hash": None}
+        to_process.append((source_path, args))
+
+    written_ids = set()
+    added, changed = [], []
+    with DocumentWriter(store_path + ".tmp", jsonl=True) as store:
+        def process(pending):
+            for source_path, doc, _ in process_files(pending, process_fun, workers):
+                key = keys[source_path]
+                if doc is None:
+                    # Keep the previous document, if any, and retry the file next run
+                    if key in old_manifest:
+                        new_manifest[key] = old_manifest[key]
+                    else:
+                        del new_manifest[key]
+                    continue
+                old = old_manifest.get(key)
+                doc_hash = document_hash(doc)
+                new_manifest[key] = {**new_manifest[key], "id": doc["id"], "doc_hash": doc_hash}
+                written_ids.add(doc["id"])
+                store.write(doc)
+                if old and old.get("id") == doc["id"] and old.get("doc_hash") == doc_hash:
+                    continue
+                (changed if old else added).append(doc["id"])
+                yield {"@search.action": "mergeOrUpload", **doc}
+
+        yield from process(to_process)
+
+        reused_ids = {entry["id"] for entry in new_manifest.values()} - written_ids
+        for doc in (iter_documents(store_path) if os.path.exists(store_path) else ()):
+            if doc["id"] in reused_ids and doc["id"] not in written_ids:
+                written_ids.add(doc["id"])
+                store.write(doc)
+        missing = reused_ids - written_ids
+        if missing:
+            # The document store lost some documents, process their files again
+            yield from process([(source_path, args) for source_path, args in tasks
+                                if keys[source_path] in new_manifest and new_manifest[keys[source_path]]["id"] in missing])
+
+        current_ids = {entry["id"] for entry in new_manifest.values()}
+        deleted = sorted({entry["id"] for entry in old_manifest.values()} - current_ids)
+        for doc_id in deleted:
+            yield {"@search.action": "delete", "id": doc_id}
+    os.replace(store_path + ".tmp", store_path)
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(new_manifest, f)
+
+    print(f"{kind}: {len(added)} added, {len(changed)} changed, {len(deleted)} deleted, "
+          f"{len(written_ids) - len(added) - len(changed)} unchanged")
@@ -0,0 +1,69 @@
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+
+class FileResult(NamedTuple):
+    path: str
+    doc: Optional[Dict[str, Any]]
+    error: Optional[str]
+
+
+def default_workers() -> int:
+    """Worker processes for ingestion, INGEST_WORKERS or one per core"""
+    return int(os.getenv("INGEST_WORKERS", "0")) or os.cpu_count() or 1
+
+
+def _process_task(process_fun: Callable[..., Optional[Dict[str, Any]]], task: Tuple[str, tuple]) -> FileResult:
+    path, args = task
+    try:
+        return FileResult(path, process_fun(*args), None)
+    except Exception:
+        return FileResult(path, None, traceback.format_exc())
+
+
+def _process_chunk(process_fun: Callable[..., Optional[Dict[str, Any]]], chunk: List[Tuple[str, tuple]]) -> List[FileResult]:
+    return [_process_task(process_fun, task) for task in chunk]
+
+
+def iter_process_files(tasks: Sequence[Tuple[str, tuple]], process_fun: Callable[..., Optional[Dict[str, Any]]],
+                       workers: Optional[int] = None, chunksize: Optional[int] = None,
+                       ordered: bool = True) -> Iterator[FileResult]:
+    """Run process_fun(*args) for each (source_path, args) task in a process pool.
+
+    Tasks are sent to the workers in chunks to keep the inter-process overhead low. Results are
+    yielded in task order when ordered is set, otherwise as soon as each chunk completes.
+    Exceptions are captured per file and returned as the error of its FileResult.
+    process_fun must be a module-level function so it can be pickled.
+    """
+    workers = workers or default_workers()
+    if workers <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            yield _process_task(process_fun, task)
+        return
+
+    # A few chunks per worker balances uneven file sizes without paying per-file IPC
+    chunksize = chunksize or max(1, min(64, len(tasks) // (workers * 4)))
+    chunks = [list(tasks[i:i + chunksize]) for i in range(0, len(tasks), chunksize)]
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+        futures = [executor.submit(_process_chunk, process_fun, chunk) for chunk in chunks]
+        for future in (futures if ordered else as_completed(futures)):
+            yield from future.result()
+
+
+def process_files(tasks: Sequence[Tuple[str, tuple]], process_fun: Callable[..., Optional[Dict[str, Any]]],
+                  workers: Optional[int] = None, chunksize: Optional[int] = None,
+                  ordered: bool = True) -> Iterator[FileResult]:
+    """Yield the results of all tasks processed in parallel, printing failed files and a throughput summary"""
+    start = time.perf_counter()
+    processed = failed = 0
+    for result in iter_process_files(tasks, process_fun, workers, chunksize, ordered):
+        if result.error:
+            print(f"Error processing {result.path}:\n{result.error}")
+        processed += 1
+        failed += result.doc is None
+        yield result
+    elapsed = time.perf_counter() - start
+    print(f"Processed {processed} files in {elapsed:.1f}s ({processed / max(elapsed, 1e-9):.0f} files/sec), {failed} failed")
@@ -0,0 +1,111 @@
+"""Micro-benchmark of the sample extraction backends over the Azure Maps sample corpus.
+
+Usage: python benchmark_extract.py [samples_dir] [repeat]
+
+Defaults to ../agent3/AzureMapsCodeSamples/Samples. Compares the original BeautifulSoup
+extraction (when bs4 is installed) with the available html_extract backends, sequentially and
+through the batch worker pool, and checks that every backend returns the BeautifulSoup output,
+on the corpus and on EDGE_CASES.
+"""
+import os
+import sys
+import time
+
+from html_extract import BACKENDS, extract_records
+
+
+def extract_bs4(html_content):
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html_content, 'html.parser')
+    code_snippets = [script.string for script in soup.find_all('script') if script.string]
+    usage_descriptions = []
+    for fieldset in soup.find_all('fieldset'):
+        if fieldset.string:
+            usage_descriptions.append(fieldset.string.strip())
+        else:
+            usage_descriptions.append(fieldset.get_text(strip=True))
+    return '\n'.join(code_snippets), '\n'.join(usage_descriptions)
+
+
+# Markup where a shortcut over the BeautifulSoup tree goes wrong: .string of a fieldset with a
+# single child (even a script or comment) and text in script, style and template left out of get_text()
+EDGE_CASES = [
+    "<fieldset><script>x()</script></fieldset>",
+    "<fieldset>a<br>b<template>t</template></fieldset>",
+    "<fieldset><style>p{}</style></fieldset>",
+    "<fieldset><div><template>t</template></div></fieldset>",
+    "<fieldset> <script>x()</script> </fieldset>",
+    "<fieldset><!-- c --></fieldset>",
+    "<fieldset><p>one</p><!-- c --><p>two</p></fieldset>",
+    "<fieldset><legend> L </legend></fieldset><fieldset>a<fieldset>b</fieldset>c</fieldset>",
+    "<fieldset>x &amp; y<b> z </b></fieldset><script>var a=1;</script><script></script>",
+    "<fieldset><ruby>k<rt>r</rt></ruby></fieldset>",
+    "<template><fieldset>in template</fieldset></template>",
+]
+
+
+def check_edge_cases(backends):
+    """Print and count the EDGE_CASES where a backend differs from BeautifulSoup."""
+    failures = 0
+    for content in EDGE_CASES:
+        expected = extract_bs4(content)
+        for name, extract in backends.items():
+            result = extract(content)
+            if result != expected:
+                failures += 1
+                print(f"{name}: {content!r} gives {result!r}, BeautifulSoup {expected!r}")
+    return failures
+
+
+def load_corpus(samples_dir):
+    documents = []
+    for root, _, files in os.walk(samples_dir):
+        for file in files:
+            if file.lower().endswith(('.html', '.htm')):
+                with open(os.path.join(root, file), 'r', encoding='utf-8', errors='replace') as f:
+                    documents.append(f.read())
+    return documents
+
+
+def time_it(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+if __name__ == "__main__":
+    samples_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join("..", "agent3", "AzureMapsCodeSamples", "Samples")
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    try:
+        import bs4  # noqa: F401
+        has_bs4 = True
+    except ImportError:
+        has_bs4 = False
+    if has_bs4:
+        print(f"{check_edge_cases(BACKENDS)} edge case mismatches")
+    documents = load_corpus(samples_dir)
+    if not documents:
+        print(f"No HTML samples found in {samples_dir}")
+        sys.exit(1)
+    values = [{"recordId": str(i), "data": {"content": content}} for i, content in enumerate(documents)]
+    total_mb = sum(len(content) for content in documents) / 1e6
+    print(f"{len(documents)} samples, {total_mb:.1f} MB")
+
+    backends = dict(BACKENDS)
+    expected = None
+    if has_bs4:
+        backends["bs4"] = extract_bs4
+        expected = [extract_bs4(content) for content in documents]
+
+    for name, extract in backends.items():
+        if expected is not None and name != "bs4":
+            mismatches = sum(extract(content) != result for content, result in zip(documents, expected))
+            if mismatches:
+                print(f"{name}: {mismatches} samples differ from BeautifulSoup")
+        sequential = time_it(lambda: [extract(content) for content in documents], repeat)
+        line = f"{name:>6}: sequential {sequential * 1000:8.1f} ms ({len(documents) / sequential:8.0f} samples/s)"
+        if name in BACKENDS:
+            pooled = time_it(lambda: extract_records(values, backend=name), repeat)
+            line += f", pooled {pooled * 1000:8.1f} ms ({len(documents) / pooled:8.0f} samples/s)"
+        print(line)
@@ -1,7 +1,7 @@
 import logging
 import azure.functions as func
 import json
-from bs4 import BeautifulSoup
+from html_extract import extract_records
 
 app = func.FunctionApp()
 
@@ -14,58 +14,8 @@ def azmaps_sample_extract_code(req: func.HttpRequest) -> func.HttpResponse:
 
         values = body.get('values', [])
         
-        results = []
-        for record in values:
-            # Process each record
-            try:
-                recordId = record['recordId']
-                html_content = record['data']['content']
-                
-                # Parse HTML
-                soup = BeautifulSoup(html_content, 'html.parser')
-                
-                # Extract script content
-                script_tags = soup.find_all('script')
-                code_snippets = []
-                for script in script_tags:
-                    if script.string:
-                        code_snippets.append(script.string)
-                
-                code_snippet = '\n'.join(code_snippets)
-
-                # Extract fieldset content
-                fieldset_tags = soup.find_all('fieldset')
-                usage_descriptions = []
-                for fieldset in fieldset_tags:
-                    if fieldset.string:
-                        usage_descriptions.append(fieldset.string.strip())
-                    else:
-                        # Get all text within fieldset even if nested
-                        usage_descriptions.append(fieldset.get_text(strip=True))
-                
-                usage_description = '\n'.join(usage_descriptions)
-                
-                # Add the record to results
-                results.append({
-                    "recordId": recordId,
-                    "data": {
-                        "code_snippet": code_snippet if code_snippet else "No Azure Maps code found",
-                        "usage_description": usage_description if usage_description else "No usage description found"
-                    },
-                    "errors": None,
-                    "warnings": None
-                })
-                
-            except Exception as error:
-                results.append({
-                    "recordId": recordId,
-                    "data": {
-                        "code_snippet": None,
-                        "usage_description": None
-                    },
-                    "errors": [{"message": str(error)}],
-                    "warnings": None
-                })
+        # Process the records of the batch in parallel
+        results = extract_records(values)
                         
         # Return the results
         return func.HttpResponse(
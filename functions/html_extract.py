@@ -0,0 +1,242 @@
+"""Extraction of sample code and usage descriptions from Azure Maps sample HTML.
+
+The default backend is a streaming tokenizer on top of html.parser that only collects the text
+of <script> and <fieldset> elements instead of building a DOM. It follows the BeautifulSoup
+'html.parser' tree, including .string of single-child fieldsets and leaving script, style and
+template text out of get_text(). An lxml backend can be selected when lxml is installed; it
+applies the same rules, but libxml2 repairs malformed markup its own way, so broken HTML can
+come out differently from BeautifulSoup. benchmark_extract.py checks both against BeautifulSoup.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from typing import Callable, Dict, List, Optional, Tuple
+import os
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+NO_CODE = "No Azure Maps code found"
+NO_USAGE = "No usage description found"
+
+
+# Strings inside these elements are not plain text to BeautifulSoup (Script, Stylesheet,
+# TemplateString, ...), get_text() leaves them out
+_STRING_CONTAINERS = {"script", "style", "template", "rt", "rp"}
+# Closed as soon as they open, like BeautifulSoup's HTML tree builder does
+_VOID_ELEMENTS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "keygen", "link", "menuitem", "meta",
+                  "param", "source", "track", "wbr", "basefont", "bgsound", "command", "frame", "image", "isindex",
+                  "nextid", "spacer"}
+
+
+class _Element:
+    __slots__ = ("name", "children", "string", "in_container", "fieldset")
+
+    def __init__(self, name: str, in_container: bool, fieldset: Optional[int]):
+        self.name = name
+        self.children = 0
+        # What BeautifulSoup's .string would be so far: the only child's string, if there is one child
+        self.string: Optional[str] = None
+        self.in_container = in_container
+        self.fieldset = fieldset
+
+    def add_child(self, string: Optional[str]) -> None:
+        self.children += 1
+        self.string = string if self.children == 1 else None
+
+
+class _SampleTokenizer(HTMLParser):
+    """Collects script bodies and the text of every fieldset in a single pass.
+
+    Keeps only a stack of the open elements, with just enough per element to follow the
+    BeautifulSoup 'html.parser' tree: end tags close up to the matching open element, void
+    elements close at once, adjacent text is one string, and a fieldset with a single string
+    descendant chain reports that string (its .string) whatever element holds it.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.scripts: List[str] = []
+        self.fieldsets: List[Optional[str]] = []
+        self._root = _Element("", False, None)
+        self._open: List[_Element] = []
+        self._text: List[str] = []
+        # Text of each open fieldset, as get_text(strip=True) pieces
+        self._fieldset_parts: Dict[int, List[str]] = {}
+
+    def _parent(self) -> _Element:
+        return self._open[-1] if self._open else self._root
+
+    def _flush_text(self, cdata: bool = False) -> None:
+        if not self._text:
+            return
+        text = "".join(self._text)
+        self._text = []
+        parent = self._parent()
+        parent.add_child(text)
+        stripped = text.strip()
+        # CDATA sections stay text even inside a container
+        if stripped and (cdata or not parent.in_container):
+            for element in self._open:
+                if element.fieldset is not None:
+                    self._fieldset_parts[element.fieldset].append(stripped)
+
+    def handle_starttag(self, tag, attrs):
+        self._flush_text()
+        parent = self._parent()
+        fieldset = None
+        if tag == "fieldset":
+            fieldset = len(self.fieldsets)
+            self.fieldsets.append(None)
+            self._fieldset_parts[fieldset] = []
+        self._open.append(_Element(tag, parent.in_container or tag in _STRING_CONTAINERS, fieldset))
+        if tag in _VOID_ELEMENTS:
+            self._pop(len(self._open) - 1)
+
+    def handle_endtag(self, tag):
+        self._flush_text()
+        for position in range(len(self._open) - 1, -1, -1):
+            if self._open[position].name == tag:
+                self._pop(position)
+                return
+
+    def handle_data(self, data):
+        self._text.append(data)
+
+    def handle_comment(self, data):
+        # A comment is a child string for .string, but not text for get_text()
+        self._flush_text()
+        self._parent().add_child(data)
+
+    def unknown_decl(self, data):
+        self._flush_text()
+        if data.startswith("CDATA["):
+            self.handle_data(data[len("CDATA["):])
+            self._flush_text(cdata=True)
+
+    def close(self):
+        super().close()
+        self._flush_text()
+        self._pop(0)
+
+    def _pop(self, position: int) -> None:
+        """Close the open elements from position up, innermost first."""
+        while len(self._open) > position:
+            element = self._open.pop()
+            string = element.string if element.children == 1 else None
+            if element.name == "script" and string:
+                self.scripts.append(string)
+            if element.fieldset is not None:
+                parts = self._fieldset_parts.pop(element.fieldset)
+                self.fieldsets[element.fieldset] = string.strip() if string else "".join(parts)
+            self._parent().add_child(string)
+
+
+def extract_stream(html_content: str) -> Tuple[str, str]:
+    tokenizer = _SampleTokenizer()
+    tokenizer.feed(html_content)
+    tokenizer.close()
+    code_snippet = "\n".join(tokenizer.scripts)
+    usage_description = "\n".join(tokenizer.fieldsets)
+    return code_snippet, usage_description
+
+
+def _lxml_string(element) -> Optional[str]:
+    """BeautifulSoup's .string of an lxml element: the string of its only child, recursively."""
+    children = [element.text] if element.text else []
+    for child in element:
+        children.append(child)
+        if child.tail:
+            children.append(child.tail)
+    if len(children) != 1:
+        return None
+    child = children[0]
+    if isinstance(child, str):
+        return child
+    if not isinstance(child.tag, str):
+        # Comment or processing instruction
+        return child.text
+    return _lxml_string(child)
+
+
+def _in_string_container(element) -> bool:
+    return element.tag in _STRING_CONTAINERS or any(parent.tag in _STRING_CONTAINERS for parent in element.iterancestors())
+
+
+def extract_lxml(html_content: str) -> Tuple[str, str]:
+    root = lxml.html.fromstring(html_content)
+    code_snippet = "\n".join(script.text for script in root.iter("script") if script.text)
+    usage_descriptions = []
+    for fieldset in root.iter("fieldset"):
+        string = _lxml_string(fieldset)
+        if string:
+            usage_descriptions.append(string.strip())
+            continue
+        parts = []
+        for element in fieldset.iter():
+            if isinstance(element.tag, str) and element.text and not _in_string_container(element):
+                parts.append(element.text.strip())
+            if element is not fieldset and element.tail and not _in_string_container(element.getparent()):
+                parts.append(element.tail.strip())
+        usage_descriptions.append("".join(parts))
+    return code_snippet, "\n".join(usage_descriptions)
+
+
+BACKENDS: Dict[str, Callable[[str], Tuple[str, str]]] = {"stream": extract_stream}
+if lxml is not None:
+    BACKENDS["lxml"] = extract_lxml
+
+
+def get_backend(name: str = None) -> Callable[[str], Tuple[str, str]]:
+    name = name or os.getenv("EXTRACT_BACKEND", "stream")
+    if name not in BACKENDS:
+        raise ValueError(f"Extraction backend '{name}' is not available, choose from {sorted(BACKENDS)}")
+    return BACKENDS[name]
+
+
+def extract_record(record: Dict, extract: Callable[[str], Tuple[str, str]]) -> Dict:
+    """Build the skill output for one input record."""
+    record_id = record.get("recordId")
+    try:
+        code_snippet, usage_description = extract(record["data"]["content"])
+        return {
+            "recordId": record_id,
+            "data": {
+                "code_snippet": code_snippet if code_snippet else NO_CODE,
+                "usage_description": usage_description if usage_description else NO_USAGE
+            },
+            "errors": None,
+            "warnings": None
+        }
+    except Exception as error:
+        return {
+            "recordId": record_id,
+            "data": {
+                "code_snippet": None,
+                "usage_description": None
+            },
+            "errors": [{"message": str(error)}],
+            "warnings": None
+        }
+
+
+_executor = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=int(os.getenv("EXTRACT_WORKERS", str(min(8, (os.cpu_count() or 1) + 2)))))
+    return _executor
+
+
+def extract_records(values: List[Dict], backend: str = None) -> List[Dict]:
+    """Extract all records of a skillset batch through a shared worker pool, keeping their order.
+
+    lxml parses without holding the GIL, so the pool pays off most with that backend.
+    """
+    extract = get_backend(backend)
+    if len(values) <= 1:
+        return [extract_record(record, extract) for record in values]
+    return list(_get_executor().map(lambda record: extract_record(record, extract), values))
@@ -1,12 +1,28 @@
 from pydantic import BaseModel
 from azure.identity import AzureCliCredential, get_bearer_token_provider
-from openai import AzureOpenAI
+from openai import AsyncAzureOpenAI
+import asyncio
+import httpx
 import os, re
-import json
 import uuid
 import logging
 from datetime import datetime
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple, AsyncIterator
+
+from ResponseStreamParser import ResponseBlockParser
+from ConversationStore import ConversationStore
+from ChatJournal import JournalConversationBackend
+from HistoryManager import HistoryManager
+from DataSampler import sample_columns, sample_data
+from DataProfiler import DataProfiler, format_profile
+from TemplateRegistry import TemplateRegistry, Template
+from CompletionCache import CompletionCache
+from LocalSearch import LocalSearch
+from DatasetStore import DatasetStore
+from ColumnarStore import ColumnarStore, ColumnarDataset
+from VectorTiles import TileServer
+from SpatialIndex import feature_collection
+from TrajectoryAnalytics import trajectory_insights, format_insights
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -15,17 +31,44 @@ class ChatMessage(BaseModel):
     userInput: str
     fileContents: Optional[List[str]] = None
     fileNames: Optional[List[str]] = None
+    datasetIds: Optional[List[str]] = None
     useAiSearch: Optional[bool] = False
+    chatId: Optional[str] = None
 
 class ChatAssistant:
     def __init__(self):
         """Initialize the ChatAssistant with necessary configurations and setup."""
         self._create_directories()
         self._setup_logging()
-        self._setup_response_blocks()
         self.client = self._initialize_azure_openai()
-        self.current_conversation = None
-        self.conversation_id = None  # For storage/logging only
+        self._completion_semaphore = asyncio.Semaphore(int(os.getenv("OPENAI_MAX_CONCURRENT_REQUESTS", "16")))
+        self.conversations = ConversationStore(
+            max_sessions=int(os.getenv("CHAT_SESSION_MAX", "1000")),
+            ttl_seconds=float(os.getenv("CHAT_SESSION_TTL_SECONDS", "3600")),
+            backend=JournalConversationBackend("chat_histories") if os.getenv("CHAT_HISTORY_PERSIST", "True") == "True" else None
+        )
+        self.templates = TemplateRegistry(os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates"))
+        self.profiler = DataProfiler(time_budget=float(os.getenv("PROFILE_TIME_BUDGET_SECONDS", "5")))
+        self.history_manager = HistoryManager(token_budget=int(os.getenv("HISTORY_TOKEN_BUDGET", "5000")))
+        self.completion_cache = CompletionCache(
+            "cache/completions.sqlite",
+            max_memory_entries=int(os.getenv("COMPLETION_CACHE_MEMORY_ENTRIES", "256")),
+            max_disk_bytes=int(os.getenv("COMPLETION_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+            ttl_seconds=float(os.getenv("COMPLETION_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+        ) if os.getenv("COMPLETION_CACHE", "True") == "True" else None
+        self.local_search = self._initialize_local_search()
+        max_upload_bytes = os.getenv("DATASET_MAX_BYTES")
+        self.datasets = DatasetStore("data/datasets", max_bytes=int(max_upload_bytes) if max_upload_bytes else None)
+        self.columns = ColumnarStore("cache/columns", max_open=int(os.getenv("COLUMNAR_MAX_OPEN_DATASETS", "32")))
+        self.tiles = TileServer(
+            max_tiles=int(os.getenv("TILE_CACHE_SIZE", "2048")),
+            max_points=int(os.getenv("TILE_MAX_POINTS", "1000")),
+            cluster_pixels=float(os.getenv("TILE_CLUSTER_PIXELS", "40")),
+            simplify_pixels=float(os.getenv("TILE_SIMPLIFY_PIXELS", "1"))
+        )
+        self.tile_threshold_bytes = int(os.getenv("TILE_THRESHOLD_BYTES", str(10 * 1024 * 1024)))
+        self.insights_wait_seconds = float(os.getenv("TRAJECTORY_INSIGHTS_WAIT_SECONDS", "10"))
+        self._background_tasks = set()
         self.logger.info("Chat Assistant initialized successfully")
 
     def _setup_logging(self) -> None:
@@ -41,91 +84,267 @@ class ChatAssistant:
         self.logger = logging.getLogger("azmaps-geo-assistant")
         self.logger.info("Initialized logging")
 
-    def _setup_response_blocks(self) -> None:
-        """Initialize the response blocks dictionary with None values."""
-        self.response_blocks = {
-            'html': None,
-            'followup': None,
-            'explanation': None
-        }
-
     def _create_directories(self) -> None:
         """Create necessary directories for storing generated files and logs."""
-        directories = ["generated_maps", "chat_histories", "logs"]
+        directories = ["generated_maps", "chat_histories", "logs", "cache", "data/datasets"]
         for directory in directories:
             os.makedirs(directory, exist_ok=True)
 
-    def _initialize_azure_openai(self) -> AzureOpenAI:
-        """Initialize and return Azure OpenAI client with appropriate credentials."""
+    def _initialize_azure_openai(self) -> AsyncAzureOpenAI:
+        """Initialize and return an async Azure OpenAI client backed by a shared, bounded connection pool."""
         try:
-            token_provider = get_bearer_token_provider(
-                AzureCliCredential(),
-                "https://cognitiveservices.azure.com/.default"
-            )
-            client = AzureOpenAI(
-                api_version=os.getenv("AZURE_OPENAI_VERSION"),
-                azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-                azure_ad_token_provider=token_provider
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=int(os.getenv("OPENAI_MAX_CONNECTIONS", "32")),
+                    max_keepalive_connections=int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "16")),
+                    keepalive_expiry=30.0
+                ),
+                timeout=httpx.Timeout(float(os.getenv("OPENAI_TIMEOUT_SECONDS", "120")), connect=10.0)
             )
+            client_kwargs = {
+                "api_version": os.getenv("AZURE_OPENAI_VERSION"),
+                "azure_endpoint": os.getenv("AZURE_OPENAI_ENDPOINT"),
+                "http_client": http_client
+            }
+            if os.getenv("AZURE_OPENAI_API_KEY"):
+                client_kwargs["api_key"] = os.getenv("AZURE_OPENAI_API_KEY")
+            else:
+                token_provider = get_bearer_token_provider(
+                    AzureCliCredential(),
+                    "https://cognitiveservices.azure.com/.default"
+                )
+
+                async def async_token_provider() -> str:
+                    # The CLI credential shells out to `az`, keep that off the event loop
+                    return await asyncio.to_thread(token_provider)
+
+                client_kwargs["azure_ad_token_provider"] = async_token_provider
+            client = AsyncAzureOpenAI(**client_kwargs)
             self.logger.debug("Successfully initialized Azure OpenAI client")
             return client
         except Exception as e:
             self.logger.error(f"Failed to initialize Azure OpenAI client: {str(e)}")
             raise
 
-    def _sample_data(self, file_content: str) -> str:
-        """Sample the first 5 items from different file types."""
+    def _initialize_local_search(self) -> Optional[LocalSearch]:
+        """Load the in-process retrieval engine when LOCAL_SEARCH_INDEX names an embedded index file."""
+        index_path = os.getenv("LOCAL_SEARCH_INDEX")
+        if not index_path:
+            return None
         try:
-            data = json.loads(file_content)
-            
-            # Handle GeoJSON
-            if isinstance(data, dict) and data.get('type') == 'FeatureCollection':
-                if 'features' in data:
-                    data['features'] = data['features'][:5]
-                return json.dumps(data, indent=2)
-            
-            # Handle regular JSON array of objects
-            elif isinstance(data, list):
-                return json.dumps(data[:5], indent=2)
-            
-            # Handle CSV-like content
-            elif isinstance(file_content, str) and '\n' in file_content:
-                lines = file_content.split('\n')
-                # Keep header + first 5 data lines
-                sampled_lines = lines[:6] if len(lines) > 6 else lines
-                return '\n'.join(sampled_lines)
-            
-            # Return as is if none of the above
-            return file_content
-            
-        except json.JSONDecodeError:
-            # If not valid JSON, treat as CSV/text
-            lines = file_content.split('\n')
-            sampled_lines = lines[:6] if len(lines) > 6 else lines
-            return '\n'.join(sampled_lines)
+            return LocalSearch(
+                index_path,
+                self.client,
+                embedding_model=os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT", "text-embedding-ada-002"),
+                top_k=int(os.getenv("LOCAL_SEARCH_TOP_K", "3")),
+                max_document_chars=int(os.getenv("LOCAL_SEARCH_MAX_DOCUMENT_CHARS", "6000")),
+                use_hnsw=os.getenv("LOCAL_SEARCH_HNSW", "False") == "True",
+                mode=os.getenv("LOCAL_SEARCH_MODE", "hybrid")
+            )
+        except Exception as e:
+            self.logger.error(f"Failed to load local search index, using Azure AI Search: {str(e)}")
+            return None
+
+    async def aclose(self) -> None:
+        """Close the pooled HTTP connections held by the OpenAI client and flush the chat journal."""
+        await self.client.close()
+        if self.conversations.backend:
+            self.conversations.backend.close()
+        if self.completion_cache:
+            self.completion_cache.close()
+
+    def _sample_data(self, dataset: Dict[str, Any], columns: Optional[ColumnarDataset] = None) -> str:
+        """Sample the first 5 items, from the columnar copy when given, otherwise from the start of the file."""
+        try:
+            if columns is not None:
+                return sample_columns(columns, max_items=5)
+            with self.datasets.open(dataset) as f:
+                return sample_data(f, max_items=5)
         except Exception as e:
             self.logger.error(f"Error sampling data: {str(e)}")
-            return file_content
+            return ""
+
+    def _summarize_data(self, dataset: Dict[str, Any], columns: Optional[ColumnarDataset] = None) -> str:
+        """Summarize a stored dataset for the prompt: a whole-file profile, or the first 5 items as a fallback.
+
+        Both are read from the columnar copy when given. Otherwise the file is profiled in chunks
+        within the profiler's time budget, it is never held in memory whole.
+        """
+        if os.getenv("PROMPT_DATA_SUMMARY", "profile") == "profile":
+            try:
+                if columns is not None:
+                    return format_profile(self.profiler.profile_columns(columns))
+                with self.datasets.open(dataset) as f:
+                    return format_profile(self.profiler.profile(f))
+            except Exception as e:
+                self.logger.error(f"Error profiling data, falling back to sampling: {str(e)}")
+        return self._sample_data(dataset, columns)
+
+    async def _prompt_summary(self, dataset: Dict[str, Any]) -> str:
+        """Dataset summary for the first prompt, from the columnar copy when it is ready within the profiler's time budget."""
+        columns = None
+        try:
+            columns = await asyncio.wait_for(self.dataset_columns(dataset["datasetId"]), self.profiler.time_budget)
+        except asyncio.TimeoutError:
+            self.logger.info(f"Dataset {dataset['datasetId']} not converted yet, profiling the file instead")
+        except Exception as e:
+            self.logger.error(f"Error converting dataset {dataset['datasetId']}, profiling the file instead: {str(e)}")
+        # Profiling is CPU-bound, keep it off the event loop
+        return await asyncio.to_thread(self._summarize_data, dataset, columns)
+
+    async def dataset_columns(self, dataset_id: str) -> ColumnarDataset:
+        """Return the memory-mapped columns of a dataset, converting the uploaded file on first use."""
+        dataset = self.datasets.get(dataset_id)
+        if dataset is None:
+            raise ValueError(f"Unknown dataset {dataset_id}")
+
+        def load() -> ColumnarDataset:
+            with self.datasets.open(dataset) as f:
+                return self.columns.get(dataset_id, f)
+
+        return await asyncio.to_thread(load)
+
+    async def dataset_tile(self, dataset_id: str, z: int, x: int, y: int, method: str = "grid") -> bytes:
+        """Return one GeoJSON tile of a dataset, from the tile cache when possible."""
+        tile = self.tiles.cached(dataset_id, z, x, y, method)
+        if tile is not None:
+            return tile
+        columns = await self.dataset_columns(dataset_id)
+        return await asyncio.to_thread(self.tiles.tile, dataset_id, columns, z, x, y, method)
+
+    async def query_dataset(self, dataset_id: str, query: str, limit: int, **params: float) -> Dict[str, Any]:
+        """Run a bbox, radius or nearest query on a dataset's spatial index and return the matches as GeoJSON.
+
+        bbox takes west/south/east/north, radius lon/lat/meters and nearest lon/lat/k. At most
+        limit features are returned, "matched" counts them all.
+        """
+        columns = await self.dataset_columns(dataset_id)
+
+        def run() -> Dict[str, Any]:
+            index = columns.spatial_index()
+            distances = None
+            if query == "bbox":
+                rows, _, _ = index.bbox(params["west"], params["south"], params["east"], params["north"])
+            elif query == "radius":
+                rows, distances = index.radius(params["lon"], params["lat"], params["meters"])
+            elif query == "nearest":
+                rows, distances = index.nearest(params["lon"], params["lat"], int(params["k"]))
+            else:
+                raise ValueError(f"Unknown query {query}")
+            return feature_collection(columns, rows[:limit], None if distances is None else distances[:limit], len(rows))
+
+        return await asyncio.to_thread(run)
+
+    async def dataset_trajectories(self, dataset_id: str) -> Optional[Dict[str, Any]]:
+        """Return the vehicle track insights of a dataset, or None when it has no time column to track by."""
+        columns = await self.dataset_columns(dataset_id)
+        return await asyncio.to_thread(trajectory_insights, columns)
+
+    async def _prompt_insights(self, dataset_id: str) -> str:
+        """Trajectory insights for the first prompt, left out when they are not ready within insights_wait_seconds."""
+        if os.getenv("PROMPT_TRAJECTORY_INSIGHTS", "True") != "True":
+            return ""
+        try:
+            insights = await asyncio.wait_for(self.dataset_trajectories(dataset_id), self.insights_wait_seconds)
+        except asyncio.TimeoutError:
+            self.logger.info(f"Trajectory insights of dataset {dataset_id} not ready, leaving them out of the prompt")
+            return ""
+        except Exception as e:
+            self.logger.error(f"Error analyzing trajectories of dataset {dataset_id}: {str(e)}")
+            return ""
+        return format_insights(insights) if insights else ""
+
+    def prepare_dataset(self, dataset_id: str) -> None:
+        """Start converting a dataset to columns and indexing it in the background, so later requests find it ready."""
+        async def convert():
+            try:
+                columns = await self.dataset_columns(dataset_id)
+                await asyncio.to_thread(columns.spatial_index)
+            except Exception as e:
+                self.logger.error(f"Failed to convert dataset {dataset_id}: {str(e)}")
+
+        task = asyncio.create_task(convert())
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def _resolve_datasets(self, request: ChatMessage) -> List[Dict[str, Any]]:
+        """Look up the datasets of a first message, storing inline fileContents as datasets too."""
+        if request.datasetIds:
+            datasets = [self.datasets.get(dataset_id) for dataset_id in request.datasetIds]
+            missing = [dataset_id for dataset_id, dataset in zip(request.datasetIds, datasets) if dataset is None]
+            if missing:
+                raise ValueError(f"Unknown dataset {', '.join(missing)}")
+            return datasets
+        return await asyncio.gather(*(asyncio.to_thread(self.datasets.save_text, name, content)
+                                      for content, name in zip(request.fileContents, request.fileNames)))
 
     async def process_message(self, request: ChatMessage) -> Dict[str, Any]:
         """Process incoming chat messages and manage conversation flow."""
-        # If this is the first message (with file content)
-        if request.fileContents and request.fileNames:
-            self.conversation_id = str(uuid.uuid4())  # Generate ID for storage only
-            self.logger.info(f"{self.conversation_id}: Starting new conversation")
+        conversation, is_new = await self._resolve_conversation(request)
+        chat_id = conversation["chatId"]
+        
+        async with self.conversations.lock(chat_id):
+            if not is_new:
+                self._append_user_message(conversation, request.userInput)
+            try:
+                response = await self._process_chat(conversation, request.useAiSearch)
+                self._save_chat_history(conversation)  # Save after each message for analysis
+                return response
+            except Exception as e:
+                self.logger.error(f"{chat_id}: Error: {str(e)}")
+                raise
+
+    async def process_message_stream(self, request: ChatMessage) -> AsyncIterator[Dict[str, Any]]:
+        """Resolve the conversation and return an async iterator of streamed response events.
+
+        Conversation errors (e.g. no active conversation) are raised here, before any event is sent.
+        """
+        conversation, is_new = await self._resolve_conversation(request)
+
+        async def events() -> AsyncIterator[Dict[str, Any]]:
+            async with self.conversations.lock(conversation["chatId"]):
+                if not is_new:
+                    self._append_user_message(conversation, request.userInput)
+                async for event in self._process_chat_stream(conversation, request.useAiSearch):
+                    yield event
+
+        return events()
+
+    async def _resolve_conversation(self, request: ChatMessage) -> Tuple[Dict[str, Any], bool]:
+        """Start a new conversation for a message with datasets or files, otherwise look up the one named by chatId.
+
+        Returns the conversation and whether it was just created.
+        """
+        # If this is the first message (with uploaded datasets or inline file content)
+        if request.datasetIds or (request.fileContents and request.fileNames):
+            datasets = await self._resolve_datasets(request)
+            for dataset in datasets:
+                self.prepare_dataset(dataset["datasetId"])
+            chat_id = str(uuid.uuid4())
+            self.logger.info(f"{chat_id}: Starting new conversation")
             
-            # Process each file content
+            # Summarize each dataset and compute its trajectory insights, both from the columnar copy
+            summaries, insights = await asyncio.gather(
+                asyncio.gather(*(self._prompt_summary(dataset) for dataset in datasets)),
+                asyncio.gather(*(self._prompt_insights(dataset["datasetId"]) for dataset in datasets))
+            )
+            system_prompt = self._get_system_prompt(chat_id, request.useAiSearch)
+            file_names = [dataset["fileName"] for dataset in datasets]
             file_contents_str = ""
-            for i, (content, name) in enumerate(zip(request.fileContents, request.fileNames), 1):
-                sampled_content = self._sample_data(content)
-                file_contents_str += f"\nFile {i} ({name}):\n{sampled_content}\n"
+            for i, (summary, insight, name, dataset) in enumerate(zip(summaries, insights, file_names, datasets), 1):
+                file_contents_str += f"\nFile {i} ({name}):\n{summary}\n"
+                if insight:
+                    file_contents_str += f"Trajectory insights (precomputed over all rows):\n{insight}\n"
+                if dataset["bytes"] >= self.tile_threshold_bytes:
+                    file_contents_str += (f"LARGE DATASET ({dataset['bytes'] / 1024 / 1024:.0f} MB): load File {i} "
+                                          f"through the tile endpoint USER_TILE_URL_{i}, not USER_FILE_NAME_{i}.\n")
             
-            self.current_conversation = {
-                "chatId": self.conversation_id,
+            conversation = {
+                "chatId": chat_id,
                 "history": [
                     {
                         "role": "system",
-                        "content": self._get_system_prompt(request.useAiSearch)
+                        "content": system_prompt.content
                     },
                     {
                         "role": "user",
@@ -133,112 +352,222 @@ class ChatAssistant:
                     }
                 ],
                 "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "fileNames": request.fileNames,
-                "useAiSearch": request.useAiSearch
+                "fileNames": file_names,
+                "datasets": [{"datasetId": dataset["datasetId"], "storedName": dataset["storedName"]} for dataset in datasets],
+                "useAiSearch": request.useAiSearch,
+                "promptId": system_prompt.prompt_id
             }
-        else:
-            if not self.current_conversation:
-                self.logger.error("No active conversation")
-                raise ValueError("No active conversation")
-            
-            self.current_conversation["history"].append({
-                "role": "user",
-                "content": request.userInput
-            })
+            self.conversations.put(conversation)
+            return conversation, True
         
-        try:
-            response = await self._process_chat(request.useAiSearch)
-            self._save_chat_history()  # Save after each message for analysis
-            return response
-        except Exception as e:
-            self.logger.error(f"{self.conversation_id}: Error: {str(e)}")
-            raise
+        conversation = await self.conversations.get(request.chatId) if request.chatId else None
+        if not conversation:
+            self.logger.error(f"{request.chatId}: No active conversation")
+            raise ValueError("No active conversation")
+        return conversation, False
 
-    def _extract_response_blocks(self, response: str) -> None:
+    def _append_user_message(self, conversation: Dict[str, Any], user_input: str) -> None:
+        """Append a follow-up user message to the conversation history."""
+        conversation["history"].append({
+            "role": "user",
+            "content": user_input
+        })
+
+    def _extract_response_blocks(self, response: str) -> Dict[str, Optional[str]]:
         """Extract different blocks from the model's response."""
+        response_blocks = {
+            'html': None,
+            'followup': None,
+            'explanation': None
+        }
+        
         # Extract complete HTML
         html_match = re.search(r'```(.*?)```', response, re.DOTALL)
         if html_match:
-            self.response_blocks['html'] = html_match.group(1).strip()
+            response_blocks['html'] = html_match.group(1).strip()
         
         # Extract Follow-up
         followup_match = re.search(r'<follow-up>(.*?)</follow-up>', response, re.DOTALL)
         if followup_match:
-            self.response_blocks['followup'] = followup_match.group(1).strip()
+            response_blocks['followup'] = followup_match.group(1).strip()
             
         # Extract explanation (everything outside the blocks)
         explanation = response
         # Remove all tagged blocks
         explanation = re.sub(r'```.*?```', '', explanation, flags=re.DOTALL)
         explanation = re.sub(r'<follow-up>.*?</follow-up>', '', explanation, flags=re.DOTALL)
-        self.response_blocks['explanation'] = explanation.strip()
+        response_blocks['explanation'] = explanation.strip()
+        return response_blocks
 
-    async def _process_chat(self, use_ai_search: bool = False) -> Dict[str, Any]:
+    def _completion_params(self, messages: List[Dict[str, Any]], use_ai_search: bool = False) -> Dict[str, Any]:
+        """Build the chat completion request parameters."""
+        params = {
+            "model": "gpt-4",
+            "temperature": 0.2,
+            "presence_penalty": 0.1,
+            "frequency_penalty": 0.1,
+            "max_tokens": 3000,
+            "top_p": 1.0,
+            "messages": messages
+        }
+        # With local search the retrieved documents are already in the messages
+        if use_ai_search and not self.local_search:
+            params["extra_body"] = {
+                "data_sources": [
+                    {
+                        "type": "azure_search",
+                        "parameters": {
+                            "endpoint": os.getenv("AZURE_AI_SEARCH_ENDPOINT"),
+                            "index_name": os.getenv("AZURE_AI_SEARCH_INDEX")
+                        }
+                    }
+                ]
+            }
+        return params
+
+    async def _create_completion(self, messages: List[Dict[str, Any]], use_ai_search: bool = False, **kwargs) -> Any:
+        """Send a chat completion request, bounded by the configured concurrency limit."""
+        params = self._completion_params(messages, use_ai_search)
+        params.update(kwargs)
+        async with self._completion_semaphore:
+            return await self.client.chat.completions.create(**params)
+
+    async def _complete(self, messages: List[Dict[str, Any]], use_ai_search: bool = False) -> str:
+        """Return the completion text, from the completion cache when the same request was seen before."""
+        cache_key = CompletionCache.key(self._completion_params(messages, use_ai_search)) if self.completion_cache else None
+        if cache_key:
+            cached = await self.completion_cache.aget(cache_key)
+            if cached is not None:
+                self.logger.debug(f"Completion cache hit {cache_key}")
+                return cached
+        
+        response = await self._create_completion(messages, use_ai_search)
+        content = response.choices[0].message.content
+        if cache_key and response.choices[0].finish_reason == "stop":
+            await self.completion_cache.aput(cache_key, content)
+        return content
+
+    async def _stream_completion(self, messages: List[Dict[str, Any]], use_ai_search: bool = False) -> AsyncIterator[str]:
+        """Stream a chat completion as text deltas. The concurrency slot is held until the stream ends.
+
+        A cached completion is replayed as a single delta.
+        """
+        params = self._completion_params(messages, use_ai_search)
+        cache_key = CompletionCache.key(params) if self.completion_cache else None
+        if cache_key:
+            cached = await self.completion_cache.aget(cache_key)
+            if cached is not None:
+                self.logger.debug(f"Completion cache hit {cache_key}")
+                yield cached
+                return
+        
+        parts = []
+        finish_reason = None
+        async with self._completion_semaphore:
+            stream = await self.client.chat.completions.create(stream=True, **params)
+            async for chunk in stream:
+                # Azure sends chunks without choices (e.g. content filter results)
+                if not chunk.choices:
+                    continue
+                finish_reason = chunk.choices[0].finish_reason or finish_reason
+                if chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+        if cache_key and finish_reason == "stop":
+            await self.completion_cache.aput(cache_key, "".join(parts))
+
+    async def _prompt_messages(self, conversation: Dict[str, Any], use_ai_search: bool = False) -> List[Dict[str, Any]]:
+        """Build the prompt from the history, with the locally retrieved documents before the latest user message."""
+        messages = self.history_manager.build_prompt(conversation["history"])
+        if not (use_ai_search and self.local_search):
+            return messages
+        # Search with the user's query only, not the file summaries of the first message
+        query = messages[-1]["content"].rsplit("User query: ", 1)[-1]
+        documents = await self.local_search.search(query)
+        self.logger.debug(f"{conversation['chatId']}: Retrieved {[doc['title'] for doc in documents]}")
+        context = {"role": "system", "content": self.local_search.format_context(documents)}
+        return messages[:-1] + [context, messages[-1]]
+
+    async def _process_chat(self, conversation: Dict[str, Any], use_ai_search: bool = False) -> Dict[str, Any]:
         """Process chat messages through Azure OpenAI and handle the response."""
         try:
-            if use_ai_search:
-                response = self.client.chat.completions.create(
-                    model="gpt-4",
-                    temperature=0.2,
-                    presence_penalty= 0.1,
-                    frequency_penalty= 0.1,
-                    max_tokens=3000,
-                    top_p=1.0,
-                    extra_body={  
-                        "data_sources": [  
-                            {  
-                                "type": "azure_search",  
-                                "parameters": {  
-                                    "endpoint": os.getenv("AZURE_AI_SEARCH_ENDPOINT"),  
-                                    "index_name": os.getenv("AZURE_AI_SEARCH_INDEX")
-                                }  
-                            }  
-                        ]  
-                    },
-                    messages=self.current_conversation["history"]
-                )
-            else:
-                response = self.client.chat.completions.create(
-                    model="gpt-4",
-                    temperature=0.2,
-                    presence_penalty= 0.1,
-                    frequency_penalty= 0.1,
-                    max_tokens=3000,
-                    top_p=1.0,
-                    messages=self.current_conversation["history"]
-                )
-            
-            assistant_response = response.choices[0].message.content
-            self._update_conversation_history(assistant_response)
+            assistant_response = await self._complete(await self._prompt_messages(conversation, use_ai_search), use_ai_search)
+            self._update_conversation_history(conversation, assistant_response)
             
             # Extract response blocks
-            self._extract_response_blocks(assistant_response)
+            response_blocks = self._extract_response_blocks(assistant_response)
             
-            if self.response_blocks['html']:
+            if response_blocks['html']:
                 # Process and save the HTML response
-                return self._handle_html_response(self.response_blocks['html'])
+                return self._handle_html_response(conversation, response_blocks)
             
             return {
+                "chatId": conversation["chatId"],
                 "text": "No code returned",
-                "additionalText": self.response_blocks['explanation'],
-                "followup": self.response_blocks['followup'],
+                "additionalText": response_blocks['explanation'],
+                "followup": response_blocks['followup'],
                 "mapHtml": None
             }
         except Exception as e:
-            self.logger.error(f"{self.conversation_id}: Processing error: {str(e)}")
+            self.logger.error(f"{conversation['chatId']}: Processing error: {str(e)}")
             raise
 
-    def _update_conversation_history(self, response: str) -> None:
+    async def _process_chat_stream(self, conversation: Dict[str, Any], use_ai_search: bool = False) -> AsyncIterator[Dict[str, Any]]:
+        """Stream a chat turn as events: explanation deltas, the map HTML once its block closes,
+        the follow-up block, and a final 'done' event carrying the same fields as the
+        non-streaming response (without the already sent map HTML)."""
+        parser = ResponseBlockParser()
+        response_parts = []
+        map_sent = False
+        try:
+            messages = await self._prompt_messages(conversation, use_ai_search)
+            async for delta in self._stream_completion(messages, use_ai_search):
+                response_parts.append(delta)
+                for event in parser.feed(delta):
+                    if event["type"] == "html":
+                        map_sent = True
+                        yield {"type": "map", "mapHtml": self._render_map_html(conversation, event["content"])}
+                    else:
+                        yield event
+            for event in parser.finish():
+                yield event
+            
+            self._update_conversation_history(conversation, "".join(response_parts))
+            self._save_chat_history(conversation)
+            
+            yield {
+                "type": "done",
+                "chatId": conversation["chatId"],
+                "text": "I've generated a map visualization. You can see it on the right panel." if map_sent else "No code returned",
+                "additionalText": parser.explanation,
+                "followup": parser.followup,
+                "mapHtml": None
+            }
+        except Exception as e:
+            self.logger.error(f"{conversation['chatId']}: Streaming error: {str(e)}")
+            raise
+
+    def _update_conversation_history(self, conversation: Dict[str, Any], response: str) -> None:
         """Update the conversation history with the assistant's response."""
-        self.current_conversation["history"].append({
+        conversation["history"].append({
             "role": "assistant",
             "content": response
         })
 
-    def _handle_html_response(self, html_content: str) -> Dict[str, Any]:
-        """Process and save the generated HTML content with necessary replacements."""
+    def _handle_html_response(self, conversation: Dict[str, Any], response_blocks: Dict[str, Optional[str]]) -> Dict[str, Any]:
+        """Process and save the generated HTML content and build the chat response."""
+        return {
+            "chatId": conversation["chatId"],
+            "text": "I've generated a map visualization. You can see it on the right panel.",
+            "additionalText": response_blocks['explanation'],
+            "followup": response_blocks['followup'],
+            "mapHtml": self._render_map_html(conversation, response_blocks['html'])
+        }
+
+    def _render_map_html(self, conversation: Dict[str, Any], html_content: str) -> str:
+        """Apply placeholder replacements to the generated HTML, save it and return it."""
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        base_filename = f"generated_maps/map_{self.conversation_id}_{timestamp}"
+        base_filename = f"generated_maps/map_{conversation['chatId']}_{timestamp}"
         
         # Replace placeholder with Azure Maps subscription key
         processed_html = html_content.replace(
@@ -246,38 +575,44 @@ class ChatAssistant:
             os.getenv("AZURE_MAPS_SUB_KEY")
         )
 
-        # Replace placeholder USER_FILE_NAME_X with user file names
-        for i, filename in enumerate(self.current_conversation["fileNames"], 1):
-            processed_html = processed_html.replace(
-                f"USER_FILE_NAME_{i}",
-                f"http://127.0.0.1:8000/data/data_sample/{filename}"
-            )
-        processed_html = processed_html.replace(
-                f"USER_FILE_NAME",
-                f"http://127.0.0.1:8000/data/data_sample/{self.current_conversation['fileNames'][0]}"
-            )
+        # Replace placeholder USER_FILE_NAME_X with the URLs the uploaded datasets are served at
+        base_url = os.getenv("DATA_BASE_URL", "http://127.0.0.1:8000").rstrip("/")
+        if conversation.get("datasets"):
+            urls = [f"{base_url}/data/datasets/{dataset['storedName']}" for dataset in conversation["datasets"]]
+        else:
+            # Conversations saved before datasets were stored
+            urls = [f"{base_url}/data/data_sample/{filename}" for filename in conversation["fileNames"]]
+        # Highest index first so USER_FILE_NAME_1 does not clobber the start of USER_FILE_NAME_10
+        for i, url in reversed(list(enumerate(urls, 1))):
+            processed_html = processed_html.replace(f"USER_FILE_NAME_{i}", url)
+        processed_html = processed_html.replace("USER_FILE_NAME", urls[0])
+
+        # Tile URL templates for large datasets, the map code fills in {z}/{x}/{y}
+        tile_urls = [f"{base_url}/api/datasets/{dataset['datasetId']}/tiles/{{z}}/{{x}}/{{y}}.json"
+                     for dataset in conversation.get("datasets", [])]
+        for i, url in reversed(list(enumerate(tile_urls, 1))):
+            processed_html = processed_html.replace(f"USER_TILE_URL_{i}", url)
+        if tile_urls:
+            processed_html = processed_html.replace("USER_TILE_URL", tile_urls[0])
         
         # Save HTML
         with open(f"{base_filename}.html", "w") as f:
             f.write(processed_html)
-            
-        return {
-            "text": "I've generated a map visualization. You can see it on the right panel.",
-            "additionalText": self.response_blocks['explanation'],
-            "followup": self.response_blocks['followup'],
-            "mapHtml": processed_html
-        }
+        
+        return processed_html
+
+    def _save_chat_history(self, conversation: Dict[str, Any]) -> None:
+        """Append the new messages of this turn to the chat history journal."""
+        self.conversations.save(conversation)
 
-    def _save_chat_history(self) -> None:
-        """Save the current conversation history to a JSON file."""
-        if self.conversation_id:
-            filepath = f"chat_histories/chat_{self.conversation_id}.json"
-            with open(filepath, "w") as f:
-                json.dump(self.current_conversation, f)
+    def _get_system_prompt(self, chat_id: str, use_ai_search: bool = False) -> Template:
+        """Get the system prompt template based on AI search usage.
 
-    def _get_system_prompt(self, use_ai_search: bool = False) -> str:
-        """Get the appropriate system prompt based on AI search usage."""
+        SYSTEM_PROMPT_VARIANTS / SYSTEM_PROMPT_WITH_INDEX_VARIANTS can list several template names
+        (comma separated, e.g. archived prompts) to A/B test; each chat sticks to one variant.
+        """
         if use_ai_search:
-            return open('./templates/system_prompt_with_index.txt', 'r').read()
+            variants = os.getenv("SYSTEM_PROMPT_WITH_INDEX_VARIANTS", "system_prompt_with_index")
         else:
-            return open('./templates/system_prompt.txt', 'r').read()
+            variants = os.getenv("SYSTEM_PROMPT_VARIANTS", "system_prompt")
+        return self.templates.choose([name.strip() for name in variants.split(",") if name.strip()], chat_id)
@@ -0,0 +1,45 @@
+"""Throughput benchmark for ChatAssistant completions against a local stub OpenAI server.
+
+Usage: python ChatBenchmark.py [requests] [latency_seconds]
+"""
+import asyncio
+import os
+import sys
+import time
+
+from StubOpenAIServer import start_stub_server
+
+
+async def run_benchmark(num_requests: int, latency: float) -> None:
+    server = start_stub_server(latency=latency)
+    host, port = server.server_address[:2]
+    os.environ["AZURE_OPENAI_ENDPOINT"] = f"http://{host}:{port}"
+    os.environ["AZURE_OPENAI_API_KEY"] = "stub"
+    os.environ.setdefault("AZURE_OPENAI_VERSION", "2024-08-01-preview")
+
+    from ChatAssistant import ChatAssistant
+    assistant = ChatAssistant()
+    messages = [{"role": "user", "content": "Show my data on a map"}]
+
+    try:
+        start = time.perf_counter()
+        for _ in range(num_requests):
+            await assistant._create_completion(messages)
+        sequential = time.perf_counter() - start
+
+        start = time.perf_counter()
+        await asyncio.gather(*(assistant._create_completion(messages) for _ in range(num_requests)))
+        concurrent = time.perf_counter() - start
+    finally:
+        await assistant.aclose()
+        server.shutdown()
+
+    print(f"{num_requests} requests, {latency:.2f}s stub latency")
+    print(f"sequential: {sequential:.2f}s ({num_requests / sequential:.1f} req/s)")
+    print(f"concurrent: {concurrent:.2f}s ({num_requests / concurrent:.1f} req/s)")
+
+
+if __name__ == "__main__":
+    num_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+    asyncio.run(run_benchmark(num_requests, latency))
@@ -0,0 +1,179 @@
+"""Append-only JSONL journal for chat histories.
+
+Each conversation is stored in chat_histories/chat_{chatId}.jsonl as a sequence of records:
+    {"type": "meta", ...}                  conversation fields except the history
+    {"type": "messages", "messages": [...]} messages appended during one turn
+    {"type": "snapshot", "conversation": {...}} full conversation, written by compaction
+
+Usage:
+    python ChatJournal.py show <chatId>
+    python ChatJournal.py compact [<chatId> ...]   (all journals when no ID is given)
+
+Compaction rewrites the file in place, so run it while the server is not writing to those chats.
+"""
+from typing import Dict, Any, Optional, List
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+
+from ConversationStore import DiskConversationBackend
+
+logger = logging.getLogger("azmaps-geo-assistant")
+
+
+def read_journal(path: str) -> Optional[Dict[str, Any]]:
+    """Replay a journal file into a conversation dict."""
+    if not os.path.exists(path):
+        return None
+    conversation = None
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A torn final line from a crash mid-write; everything before it is intact
+                logger.warning(f"Skipping unreadable journal record in {path}")
+                continue
+            if record["type"] == "snapshot":
+                conversation = record["conversation"]
+            elif record["type"] == "meta":
+                conversation = {key: value for key, value in record.items() if key != "type"}
+                conversation["history"] = []
+            elif record["type"] == "messages" and conversation is not None:
+                conversation["history"].extend(record["messages"])
+    return conversation
+
+
+def compact_journal(path: str) -> None:
+    """Rewrite a journal as a single snapshot record."""
+    conversation = read_journal(path)
+    if conversation is None:
+        return
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"type": "snapshot", "conversation": conversation}) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class ChatJournal:
+    """Appends journal records from a background thread.
+
+    append() only enqueues, so the request path never waits on disk. The writer drains
+    everything queued, appends it grouped by file and fsyncs once per batch.
+    """
+
+    def __init__(self, directory: str = "chat_histories"):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._queue: "queue.Queue" = queue.Queue()
+        self._writer = threading.Thread(target=self._run, name="chat-journal-writer", daemon=True)
+        self._writer.start()
+
+    def path(self, chat_id: str) -> str:
+        return os.path.join(self.directory, f"chat_{chat_id}.jsonl")
+
+    def append(self, chat_id: str, record: Dict[str, Any]) -> None:
+        self._queue.put((chat_id, record))
+
+    def flush(self) -> None:
+        """Block until every queued record is on disk."""
+        self._queue.join()
+
+    def close(self) -> None:
+        self.flush()
+        self._queue.put(None)
+        self._writer.join()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            try:
+                self._write_batch([item for item in batch if item is not None])
+            except Exception as e:
+                logger.error(f"Failed to write chat journal batch: {str(e)}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _write_batch(self, batch: List[Any]) -> None:
+        lines_by_chat: Dict[str, List[str]] = {}
+        for chat_id, record in batch:
+            lines_by_chat.setdefault(chat_id, []).append(json.dumps(record) + "\n")
+        for chat_id, lines in lines_by_chat.items():
+            with open(self.path(chat_id), "a", encoding="utf-8") as f:
+                f.write("".join(lines))
+                f.flush()
+                os.fsync(f.fileno())
+
+
+class JournalConversationBackend:
+    """ConversationStore backend that appends each turn to a ChatJournal.
+
+    Conversations saved by the older one-file-per-chat format are still readable.
+    """
+
+    def __init__(self, directory: str = "chat_histories"):
+        self.journal = ChatJournal(directory)
+        self._legacy = DiskConversationBackend(directory)
+        # Number of history messages already journaled per chat
+        self._journaled: Dict[str, int] = {}
+
+    def load(self, chat_id: str) -> Optional[Dict[str, Any]]:
+        # Make sure a session evicted moments ago is fully on disk before reading it back; this
+        # waits on the writer, so ConversationStore calls it from a worker thread
+        self.journal.flush()
+        conversation = read_journal(self.journal.path(chat_id)) or self._legacy.load(chat_id)
+        if conversation is not None:
+            self._journaled[chat_id] = len(conversation["history"])
+        return conversation
+
+    def save(self, conversation: Dict[str, Any]) -> None:
+        chat_id = conversation["chatId"]
+        if chat_id not in self._journaled:
+            meta = {key: value for key, value in conversation.items() if key != "history"}
+            self.journal.append(chat_id, {"type": "meta", **meta})
+            self._journaled[chat_id] = 0
+        new_messages = conversation["history"][self._journaled[chat_id]:]
+        if new_messages:
+            self.journal.append(chat_id, {"type": "messages", "messages": new_messages})
+            self._journaled[chat_id] = len(conversation["history"])
+
+    def forget(self, chat_id: str) -> None:
+        # A later save starts over with a meta record, which replay treats as a fresh history
+        self._journaled.pop(chat_id, None)
+
+    def close(self) -> None:
+        self.journal.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in ("show", "compact"):
+        print(__doc__)
+        sys.exit(1)
+    directory = os.getenv("CHAT_HISTORY_DIR", "chat_histories")
+    command, chat_ids = sys.argv[1], sys.argv[2:]
+    if command == "show":
+        for chat_id in chat_ids:
+            print(json.dumps(read_journal(os.path.join(directory, f"chat_{chat_id}.jsonl")), indent=2))
+    else:
+        paths = [os.path.join(directory, f"chat_{chat_id}.jsonl") for chat_id in chat_ids] or [
+            os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".jsonl")
+        ]
+        for path in paths:
+            compact_journal(path)
+            print(f"Compacted {path}")
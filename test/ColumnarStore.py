@@ -0,0 +1,567 @@
+from collections import OrderedDict
+from typing import Any, Dict, IO, List, Optional, Tuple
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from DataSampler import iter_records
+from DataProfiler import LAT_NAMES, LON_NAMES, TIME_HINTS, _first_char
+from SpatialIndex import SpatialIndex
+
+logger = logging.getLogger("azmaps-geo-assistant")
+
+SCHEMA_VERSION = 2
+BATCH_SIZE = 50_000
+GEOMETRY_TYPES = ["None", "Point", "LineString", "Polygon", "MultiPoint", "MultiLineString", "MultiPolygon",
+                  "GeometryCollection"]
+_GEOMETRY_CODES = {name: code for code, name in enumerate(GEOMETRY_TYPES)}
+# What each geometry part is; a polygon is an outer ring followed by its holes
+PART_POINT, PART_LINE, PART_OUTER_RING, PART_HOLE = range(4)
+_ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}")
+
+
+def _append_parts(geometry: Dict[str, Any], xs: List[float], ys: List[float], part_sizes: List[int],
+                  part_kinds: List[int]) -> None:
+    """Flatten a GeoJSON geometry into vertex lists; every point, line and ring becomes one part."""
+    geometry_type = geometry.get("type")
+    coordinates = geometry.get("coordinates")
+    if geometry_type == "Point":
+        parts = [(PART_POINT, [coordinates])] if coordinates else []
+    elif geometry_type == "MultiPoint":
+        parts = [(PART_POINT, [point]) for point in coordinates or []]
+    elif geometry_type == "LineString":
+        parts = [(PART_LINE, coordinates or [])]
+    elif geometry_type == "MultiLineString":
+        parts = [(PART_LINE, line) for line in coordinates or []]
+    elif geometry_type == "Polygon":
+        parts = [(PART_HOLE if i else PART_OUTER_RING, ring) for i, ring in enumerate(coordinates or [])]
+    elif geometry_type == "MultiPolygon":
+        parts = [(PART_HOLE if i else PART_OUTER_RING, ring) for polygon in coordinates or []
+                 for i, ring in enumerate(polygon)]
+    elif geometry_type == "GeometryCollection":
+        for child in geometry.get("geometries") or []:
+            _append_parts(child, xs, ys, part_sizes, part_kinds)
+        return
+    else:
+        return
+    for kind, part in parts:
+        xs.extend(vertex[0] for vertex in part)
+        ys.extend(vertex[1] for vertex in part)
+        part_sizes.append(len(part))
+        part_kinds.append(kind)
+
+
+def _to_text(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return str(value)
+
+
+class _ColumnBuilder:
+    """Typed values of one property column, collected a batch at a time and merged at the end."""
+
+    def __init__(self, name: str, rows_before: int):
+        self.name = name
+        self.batches: List[Tuple[str, Any]] = [("null", rows_before)] if rows_before else []
+        self.categories: Dict[str, int] = {}
+
+    def add_nulls(self, count: int) -> None:
+        self.batches.append(("null", count))
+
+    def add(self, values: pd.Series) -> None:
+        non_null = values.notna()
+        if not non_null.any():
+            return self.add_nulls(len(values))
+        present = values[non_null]
+        if pd.api.types.is_bool_dtype(present) or (isinstance(present.iloc[0], bool) and present.map(type).eq(bool).all()):
+            codes = np.full(len(values), -1, dtype=np.int8)
+            codes[non_null.to_numpy()] = present.astype(bool).to_numpy(dtype=np.int8)
+            return self.batches.append(("bool", codes))
+        if pd.api.types.is_numeric_dtype(values):
+            numbers = values
+        elif pd.to_numeric(present.head(1_000), errors="coerce").notna().all():
+            # Only text columns whose first values all parse are converted whole, parsing is slow
+            numbers = pd.to_numeric(values, errors="coerce")
+        else:
+            numbers = None
+        if numbers is not None and numbers.notna().sum() == non_null.sum():
+            if pd.api.types.is_integer_dtype(numbers):
+                return self.batches.append(("integer", numbers.to_numpy(dtype=np.int64)))
+            return self.batches.append(("number", numbers.to_numpy(dtype=np.float64)))
+        strings = values.astype(object).where(non_null, None)
+        if pd.api.types.infer_dtype(present, skipna=True) != "string":
+            strings = strings.map(_to_text)
+        if any(hint in self.name.lower() for hint in TIME_HINTS) or strings[non_null].head(1_000).str.match(_ISO_DATE).mean() >= 0.95:
+            times = pd.to_datetime(strings, errors="coerce", utc=True, format="ISO8601")
+            if times.notna().sum() >= 0.95 * non_null.sum():
+                return self.batches.append(("datetime", times.dt.tz_convert(None).to_numpy(dtype="datetime64[ms]")))
+        self.batches.append(("string", self._encode(strings)))
+
+    def _encode(self, values: pd.Series) -> np.ndarray:
+        """Dictionary-encode strings into int32 codes, -1 for null, with one category list per column."""
+        local_codes, uniques = pd.factorize(values, use_na_sentinel=True)
+        lookup = np.fromiter((self.categories.setdefault(value, len(self.categories)) for value in uniques),
+                             dtype=np.int32, count=len(uniques))
+        codes = np.full(len(values), -1, dtype=np.int32)
+        valid = local_codes >= 0
+        codes[valid] = lookup[local_codes[valid]]
+        return codes
+
+    def finish(self) -> Tuple[str, np.ndarray, Optional[List[str]]]:
+        """Return (type, values, categories) with a single type for the whole column."""
+        kinds = {kind for kind, _ in self.batches if kind != "null"}
+        has_nulls = any(kind == "null" for kind, _ in self.batches)
+        if kinds == {"integer"} and not has_nulls:
+            return "integer", np.concatenate([values for _, values in self.batches]), None
+        if kinds and kinds <= {"integer", "number"}:
+            return "number", self._merge(np.float64, np.nan), None
+        if kinds == {"bool"}:
+            return "bool", self._merge(np.int8, -1), None
+        if kinds == {"datetime"}:
+            return "datetime", self._merge("datetime64[ms]", np.datetime64("NaT")), None
+        if len(kinds) > 1:
+            # Mixed types across batches, keep everything as text
+            self.batches = [(kind, values) if kind in ("null", "string") else
+                            ("string", self._encode(self._to_strings(kind, values))) for kind, values in self.batches]
+        return "string", self._merge(np.int32, -1), list(self.categories)
+
+    def _to_strings(self, kind: str, values: np.ndarray) -> pd.Series:
+        if kind == "datetime":
+            strings = pd.Series(pd.to_datetime(values)).dt.strftime("%Y-%m-%dT%H:%M:%S")
+            return strings.where(~np.isnat(values), None)
+        if kind == "bool":
+            return pd.Series(np.where(values < 0, None, np.where(values > 0, "true", "false")).astype(object))
+        series = pd.Series(values).astype(object)
+        return series.where(pd.notna(series), None).map(_to_text)
+
+    def _merge(self, dtype, null) -> np.ndarray:
+        return np.concatenate([np.full(values, null, dtype=dtype) if kind == "null" else values.astype(dtype)
+                               for kind, values in self.batches])
+
+
+class _DatasetConverter:
+    """Builds the column files of one dataset, a batch of records at a time."""
+
+    def __init__(self, batch_size: int):
+        self.batch_size = batch_size
+        self.rows = 0
+        self.columns: Dict[str, _ColumnBuilder] = {}
+        self.xs: List[np.ndarray] = []
+        self.ys: List[np.ndarray] = []
+        self.part_sizes: List[np.ndarray] = []
+        self.part_kinds: List[np.ndarray] = []
+        self.feature_parts: List[np.ndarray] = []
+        self.geometry_types: List[np.ndarray] = []
+        self.points_only = True
+
+    def convert(self, source: IO[str]) -> str:
+        if _first_char(source) in ("{", "["):
+            return self._convert_json(source)
+        return self._convert_csv(source)
+
+    def _convert_json(self, source: IO[str]) -> str:
+        data_format = "JSON"
+        properties: List[Dict[str, Any]] = []
+        geometries: List[Any] = []
+        has_features = False
+        for record in iter_records(source):
+            if isinstance(record, dict) and record.get("type") == "Feature":
+                data_format = "GeoJSON"
+                has_features = True
+                properties.append(record.get("properties") or {})
+                geometries.append(record.get("geometry"))
+            else:
+                properties.append(record if isinstance(record, dict) else {"value": record})
+                # No geometry, so rows stay aligned in arrays that mix features and plain records
+                geometries.append(None)
+            if len(properties) >= self.batch_size:
+                self._add_json_batch(properties, geometries if has_features else [])
+                properties, geometries, has_features = [], [], False
+        if properties:
+            self._add_json_batch(properties, geometries if has_features else [])
+        return data_format
+
+    def _add_json_batch(self, properties: List[Dict[str, Any]], geometries: List[Any]) -> None:
+        frame = pd.DataFrame.from_records(properties, index=pd.RangeIndex(len(properties)))
+        if geometries:
+            self._add_geometries(geometries)
+        else:
+            self._add_lat_lon(frame)
+        self._add_columns(frame)
+
+    def _convert_csv(self, source: IO[str]) -> str:
+        for frame in pd.read_csv(source, chunksize=self.batch_size, low_memory=False):
+            self._add_lat_lon(frame)
+            self._add_columns(frame)
+        return "CSV"
+
+    def _add_columns(self, frame: pd.DataFrame) -> None:
+        for name in frame.columns:
+            key = str(name)
+            if key not in self.columns:
+                self.columns[key] = _ColumnBuilder(key, self.rows)
+            self.columns[key].add(frame[name])
+        present = {str(name) for name in frame.columns}
+        for name, column in self.columns.items():
+            if name not in present:
+                column.add_nulls(len(frame))
+        self.rows += len(frame)
+
+    def _add_geometries(self, geometries: List[Any]) -> None:
+        types = np.zeros(len(geometries), dtype=np.int8)
+        if all(geometry and geometry.get("type") == "Point" and len(geometry.get("coordinates") or ()) >= 2
+               for geometry in geometries):
+            # Fast path for point data, the common case for tracking files
+            coordinates = np.array([geometry["coordinates"][:2] for geometry in geometries], dtype=np.float64)
+            types[:] = _GEOMETRY_CODES["Point"]
+            self._add_points(coordinates[:, 0], coordinates[:, 1], types)
+            return
+        self.points_only = False
+        xs, ys, part_sizes, part_kinds = [], [], [], []
+        feature_parts = np.zeros(len(geometries), dtype=np.int64)
+        for i, geometry in enumerate(geometries):
+            if not geometry:
+                continue
+            types[i] = _GEOMETRY_CODES.get(geometry.get("type"), 0)
+            parts_before = len(part_sizes)
+            _append_parts(geometry, xs, ys, part_sizes, part_kinds)
+            feature_parts[i] = len(part_sizes) - parts_before
+        self._add_vertices(np.array(xs, dtype=np.float64), np.array(ys, dtype=np.float64),
+                           np.array(part_sizes, dtype=np.int64), np.array(part_kinds, dtype=np.int8), feature_parts, types)
+
+    def _add_lat_lon(self, frame: pd.DataFrame) -> None:
+        lat = next((c for c in frame.columns if str(c).lower() in LAT_NAMES), None)
+        lon = next((c for c in frame.columns if str(c).lower() in LON_NAMES), None)
+        if lat is None or lon is None:
+            self.points_only = False
+            self._add_vertices(np.empty(0), np.empty(0), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int8),
+                               np.zeros(len(frame), dtype=np.int64), np.zeros(len(frame), dtype=np.int8))
+            return
+        lats = pd.to_numeric(frame[lat], errors="coerce").to_numpy(dtype=np.float64)
+        lons = pd.to_numeric(frame[lon], errors="coerce").to_numpy(dtype=np.float64)
+        # Rows without a valid position keep NaN coordinates, so rows and vertices stay aligned
+        types = np.where(np.isnan(lats) | np.isnan(lons), 0, _GEOMETRY_CODES["Point"]).astype(np.int8)
+        self._add_points(lons, lats, types)
+
+    def _add_points(self, xs: np.ndarray, ys: np.ndarray, types: np.ndarray) -> None:
+        ones = np.ones(len(xs), dtype=np.int64)
+        self._add_vertices(xs, ys, ones, np.full(len(xs), PART_POINT, dtype=np.int8), ones, types)
+
+    def _add_vertices(self, xs: np.ndarray, ys: np.ndarray, part_sizes: np.ndarray, part_kinds: np.ndarray,
+                      feature_parts: np.ndarray, types: np.ndarray) -> None:
+        self.xs.append(xs)
+        self.ys.append(ys)
+        self.part_sizes.append(part_sizes)
+        self.part_kinds.append(part_kinds)
+        self.feature_parts.append(feature_parts)
+        self.geometry_types.append(types)
+
+    def write(self, directory: str, data_format: str) -> Dict[str, Any]:
+        x = np.concatenate(self.xs) if self.xs else np.empty(0)
+        y = np.concatenate(self.ys) if self.ys else np.empty(0)
+        geometry_types = np.concatenate(self.geometry_types) if self.geometry_types else np.empty(0, dtype=np.int8)
+        np.save(os.path.join(directory, "x.npy"), x)
+        np.save(os.path.join(directory, "y.npy"), y)
+        np.save(os.path.join(directory, "geometry_types.npy"), geometry_types)
+        if not self.points_only:
+            # Points-only datasets have one part of one vertex per feature, their offsets are implied
+            for name, sizes in (("part_offsets", self.part_sizes), ("feature_offsets", self.feature_parts)):
+                offsets = np.zeros(sum(len(s) for s in sizes) + 1, dtype=np.int64)
+                if len(offsets) > 1:
+                    np.cumsum(np.concatenate(sizes), out=offsets[1:])
+                np.save(os.path.join(directory, f"{name}.npy"), offsets)
+            np.save(os.path.join(directory, "part_kinds.npy"), np.concatenate(self.part_kinds))
+
+        columns = []
+        for i, (name, builder) in enumerate(self.columns.items()):
+            column_type, values, categories = builder.finish()
+            np.save(os.path.join(directory, f"column_{i}.npy"), values)
+            entry = {"name": name, "type": column_type, "file": f"column_{i}.npy"}
+            if categories is not None:
+                entry["categories"] = f"column_{i}.categories.json"
+                with open(os.path.join(directory, entry["categories"]), "w", encoding="utf-8") as f:
+                    json.dump(categories, f)
+            columns.append(entry)
+
+        valid = ~(np.isnan(x) | np.isnan(y))
+        schema = {
+            "version": SCHEMA_VERSION,
+            "format": data_format,
+            "features": self.rows,
+            "vertices": len(x),
+            "pointsOnly": self.points_only,
+            "bbox": [float(x[valid].min()), float(y[valid].min()), float(x[valid].max()), float(y[valid].max())] if valid.any() else None,
+            "geometryTypes": {GEOMETRY_TYPES[code]: count for code, count in
+                              enumerate(np.bincount(geometry_types, minlength=len(GEOMETRY_TYPES)).tolist()) if count},
+            "columns": columns
+        }
+        with open(os.path.join(directory, "schema.json"), "w", encoding="utf-8") as f:
+            json.dump(schema, f)
+        return schema
+
+
+class ColumnarDataset:
+    """Memory-mapped columns of a converted dataset.
+
+    Geometry is stored as float64 vertex columns x (longitude) and y (latitude). Each feature
+    has one or more parts (a point, a line or a ring, see part_kinds): feature_offsets index into
+    part_offsets, which index into the vertices. Properties are typed columns: integer/number (NaN for null),
+    bool (int8, -1 for null), datetime (datetime64[ms], NaT) and string (int32 codes into a
+    category list, -1 for null).
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, "schema.json"), "r", encoding="utf-8") as f:
+            self.schema = json.load(f)
+        self._columns = {column["name"]: column for column in self.schema["columns"]}
+        self._arrays: Dict[str, np.ndarray] = {}
+        self._categories: Dict[str, List[str]] = {}
+        self._spatial_index: Optional[SpatialIndex] = None
+        self._spatial_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self.schema["features"]
+
+    def _array(self, file_name: str) -> np.ndarray:
+        array = self._arrays.get(file_name)
+        if array is None:
+            path = os.path.join(self.directory, file_name)
+            # np.load cannot memory-map an empty file body, those are tiny anyway
+            array = np.load(path, mmap_mode="r") if os.path.getsize(path) > 128 else np.load(path)
+            self._arrays[file_name] = array
+        return array
+
+    @property
+    def x(self) -> np.ndarray:
+        return self._array("x.npy")
+
+    @property
+    def y(self) -> np.ndarray:
+        return self._array("y.npy")
+
+    @property
+    def geometry_types(self) -> np.ndarray:
+        return self._array("geometry_types.npy")
+
+    @property
+    def part_offsets(self) -> np.ndarray:
+        if self.schema["pointsOnly"]:
+            return np.arange(self.schema["vertices"] + 1, dtype=np.int64)
+        return self._array("part_offsets.npy")
+
+    @property
+    def feature_offsets(self) -> np.ndarray:
+        if self.schema["pointsOnly"]:
+            return np.arange(len(self) + 1, dtype=np.int64)
+        return self._array("feature_offsets.npy")
+
+    @property
+    def part_kinds(self) -> np.ndarray:
+        if self.schema["pointsOnly"]:
+            return np.zeros(self.schema["vertices"], dtype=np.int8)
+        return self._array("part_kinds.npy")
+
+    @property
+    def column_names(self) -> List[str]:
+        return list(self._columns)
+
+    def column_type(self, name: str) -> str:
+        return self._columns[name]["type"]
+
+    def column(self, name: str) -> np.ndarray:
+        """Raw column values, string columns as their int32 codes."""
+        return self._array(self._columns[name]["file"])
+
+    def categories(self, name: str) -> List[str]:
+        if name not in self._categories:
+            with open(os.path.join(self.directory, self._columns[name]["categories"]), "r", encoding="utf-8") as f:
+                self._categories[name] = json.load(f)
+        return self._categories[name]
+
+    def feature_points(self) -> Tuple[np.ndarray, np.ndarray]:
+        """One position per feature: the point itself, or the centre of the feature's bounding box.
+
+        Features without geometry get NaN.
+        """
+        if self.schema["pointsOnly"]:
+            return self.x, self.y
+        vertex_starts = self.part_offsets[self.feature_offsets]
+        counts = np.diff(vertex_starts)
+        result = []
+        for values in (self.x, self.y):
+            centre = np.full(len(self), np.nan)
+            has_vertices = counts > 0
+            if has_vertices.any():
+                starts = vertex_starts[:-1][has_vertices]
+                centre[has_vertices] = (np.minimum.reduceat(values, starts) + np.maximum.reduceat(values, starts)) / 2
+            result.append(centre)
+        return result[0], result[1]
+
+    def geometries(self, rows: np.ndarray, keep: Optional[np.ndarray] = None) -> List[Optional[Dict[str, Any]]]:
+        """Rebuild the GeoJSON geometries of some rows.
+
+        keep is an optional boolean mask over all vertices (e.g. from simplification); parts left
+        with too few vertices to draw are dropped.
+        """
+        geometry_types = self.geometry_types
+        feature_offsets = self.feature_offsets
+        part_offsets = self.part_offsets
+        part_kinds = self.part_kinds
+        result = []
+        for row in np.asarray(rows, dtype=np.int64).tolist():
+            geometry_type = GEOMETRY_TYPES[int(geometry_types[row])]
+            points, lines, polygons = [], [], []
+            for part in range(feature_offsets[row], feature_offsets[row + 1]):
+                start, end = part_offsets[part], part_offsets[part + 1]
+                kind = part_kinds[part]
+                index = np.arange(start, end)
+                if keep is not None and kind != PART_POINT:
+                    index = index[keep[start:end]]
+                coordinates = np.column_stack([self.x[index], self.y[index]]).tolist()
+                if kind == PART_POINT:
+                    points.extend(coordinates)
+                elif kind == PART_LINE and len(coordinates) >= 2:
+                    lines.append(coordinates)
+                elif kind == PART_OUTER_RING:
+                    polygons.append([coordinates] if len(coordinates) >= 4 else None)
+                elif kind == PART_HOLE and polygons and polygons[-1] is not None and len(coordinates) >= 4:
+                    polygons[-1].append(coordinates)
+            polygons = [polygon for polygon in polygons if polygon is not None]
+            if geometry_type == "Point" and points:
+                result.append({"type": "Point", "coordinates": points[0]})
+            elif geometry_type == "MultiPoint" and points:
+                result.append({"type": "MultiPoint", "coordinates": points})
+            elif geometry_type == "LineString" and lines:
+                result.append({"type": "LineString", "coordinates": lines[0]})
+            elif geometry_type == "MultiLineString" and lines:
+                result.append({"type": "MultiLineString", "coordinates": lines})
+            elif geometry_type == "Polygon" and polygons:
+                result.append({"type": "Polygon", "coordinates": polygons[0]})
+            elif geometry_type == "MultiPolygon" and polygons:
+                result.append({"type": "MultiPolygon", "coordinates": polygons})
+            elif geometry_type == "GeometryCollection" and (points or lines or polygons):
+                result.append({"type": "GeometryCollection", "geometries":
+                               [{"type": "Point", "coordinates": point} for point in points] +
+                               [{"type": "LineString", "coordinates": line} for line in lines] +
+                               [{"type": "Polygon", "coordinates": polygon} for polygon in polygons]})
+            else:
+                result.append(None)
+        return result
+
+    def spatial_index(self) -> SpatialIndex:
+        """Grid index over feature_points(), built on first use and saved beside the columns."""
+        with self._spatial_lock:
+            if self._spatial_index is None:
+                index = SpatialIndex.load(self.directory)
+                if index is None:
+                    start = time.perf_counter()
+                    index = SpatialIndex.build(*self.feature_points())
+                    index.save(self.directory)
+                    logger.info(f"Built spatial index over {len(index)} features of {self.directory} "
+                                f"in {time.perf_counter() - start:.2f}s")
+                self._spatial_index = index
+            return self._spatial_index
+
+    def records(self, rows: np.ndarray, columns: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Decode the property values of some rows back into plain dicts."""
+        rows = np.asarray(rows, dtype=np.int64)
+        decoded = {}
+        for name in columns or self.column_names:
+            values = np.asarray(self.column(name)[rows])
+            column_type = self.column_type(name)
+            if column_type == "string":
+                categories = self.categories(name)
+                decoded[name] = [categories[code] if code >= 0 else None for code in values.tolist()]
+            elif column_type == "bool":
+                decoded[name] = [None if value < 0 else bool(value) for value in values.tolist()]
+            elif column_type == "datetime":
+                decoded[name] = [None if np.isnat(value) else str(value) + "Z" for value in values]
+            elif column_type == "number":
+                decoded[name] = [None if np.isnan(value) else value for value in values.tolist()]
+            else:
+                decoded[name] = values.tolist()
+        return [{name: decoded[name][i] for name in decoded} for i in range(len(rows))]
+
+
+class ColumnarStore:
+    """Columnar copies of uploaded datasets, built once per dataset ID under {directory}/{datasetId}.
+
+    Dataset IDs are content hashes, so a built copy never goes stale. Opened datasets are kept
+    in a small LRU; their columns are memory-mapped and load lazily.
+    """
+
+    def __init__(self, directory: str = "cache/columns", max_open: int = 32, batch_size: int = BATCH_SIZE):
+        self.directory = directory
+        self.max_open = max_open
+        self.batch_size = batch_size
+        os.makedirs(directory, exist_ok=True)
+        self._open: "OrderedDict[str, ColumnarDataset]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._build_locks: Dict[str, threading.Lock] = {}
+
+    def _path(self, dataset_id: str) -> str:
+        return os.path.join(self.directory, dataset_id)
+
+    def _load(self, dataset_id: str) -> Optional[ColumnarDataset]:
+        with self._lock:
+            dataset = self._open.get(dataset_id)
+            if dataset is not None:
+                self._open.move_to_end(dataset_id)
+                return dataset
+        try:
+            dataset = ColumnarDataset(self._path(dataset_id))
+        except FileNotFoundError:
+            return None
+        if dataset.schema.get("version") != SCHEMA_VERSION:
+            return None
+        with self._lock:
+            self._open[dataset_id] = dataset
+            if len(self._open) > self.max_open:
+                self._open.popitem(last=False)
+        return dataset
+
+    def cached(self, dataset_id: str) -> Optional[ColumnarDataset]:
+        """Return the columnar copy of a dataset if it has been converted, without converting it."""
+        return self._load(dataset_id)
+
+    def get(self, dataset_id: str, source: IO[str]) -> ColumnarDataset:
+        """Return the columnar copy of a dataset, converting the source text the first time.
+
+        Blocking, run it off the event loop. Raises ValueError for data that cannot be parsed.
+        """
+        dataset = self._load(dataset_id)
+        if dataset is not None:
+            return dataset
+        with self._lock:
+            build_lock = self._build_locks.setdefault(dataset_id, threading.Lock())
+        with build_lock:
+            dataset = self._load(dataset_id)
+            if dataset is not None:
+                return dataset
+            start = time.perf_counter()
+            temp_path = f"{self._path(dataset_id)}.tmp-{uuid.uuid4().hex}"
+            os.makedirs(temp_path)
+            try:
+                converter = _DatasetConverter(self.batch_size)
+                schema = converter.write(temp_path, converter.convert(source))
+                if os.path.exists(self._path(dataset_id)):
+                    # Left over from an older schema version
+                    shutil.rmtree(self._path(dataset_id))
+                os.replace(temp_path, self._path(dataset_id))
+            except Exception as e:
+                shutil.rmtree(temp_path, ignore_errors=True)
+                raise ValueError(f"Could not convert dataset {dataset_id}: {str(e)}") from e
+            logger.info(f"Converted dataset {dataset_id} to {len(schema['columns'])} columns, {schema['features']} "
+                        f"features in {time.perf_counter() - start:.2f}s")
+            return self._load(dataset_id)
@@ -0,0 +1,75 @@
+"""Convert GeoJSON with long tracks and mixed records to columns and compare them with the input.
+
+Covers a FeatureCollection whose single LineString is 100k points (about 2.5 MB) and one of
+300k points (over the 4 MB value limit of sampling), and a JSON array mixing Features with
+plain records. Exits with status 1 when any conversion fails or differs.
+
+Usage: python ColumnarStoreCheck.py
+"""
+import io
+import json
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from ColumnarStore import ColumnarStore
+from DataSampler import MAX_VALUE_CHARS
+
+
+def _track(points: int) -> str:
+    rng = np.random.default_rng(points)
+    coordinates = np.round(np.cumsum(rng.normal(scale=1e-4, size=(points, 2)), axis=0) + [4.9, 52.3], 6)
+    feature = {"type": "Feature", "geometry": {"type": "LineString", "coordinates": coordinates.tolist()},
+               "properties": {"vehicle": "bus-1"}}
+    return json.dumps({"type": "FeatureCollection", "features": [feature]})
+
+
+def check_track(store: ColumnarStore, points: int) -> list:
+    """Return the failures of converting one track of the given number of points."""
+    text = _track(points)
+    start = time.perf_counter()
+    try:
+        dataset = store.get(f"track{points}", io.StringIO(text))
+    except ValueError as e:
+        return [f"{points} points ({len(text):,} chars): {str(e)}"]
+    print(f"{points} points ({len(text):,} chars, value limit of sampling {MAX_VALUE_CHARS:,}): "
+          f"converted in {time.perf_counter() - start:.2f}s")
+    expected = json.loads(text)["features"][0]
+    failures = []
+    if dataset.schema["vertices"] != points:
+        failures.append(f"{points} points: {dataset.schema['vertices']} vertices")
+    if dataset.geometries([0])[0] != expected["geometry"] or dataset.records([0])[0] != expected["properties"]:
+        failures.append(f"{points} points: feature differs after conversion")
+    return failures
+
+
+def check_mixed(store: ColumnarStore) -> list:
+    records = [{"type": "Feature", "geometry": {"type": "Point", "coordinates": [1.0, 2.0]}, "properties": {"a": 1}},
+               {"a": 2},
+               {"type": "Feature", "geometry": {"type": "LineString", "coordinates": [[0.0, 0.0], [1.0, 1.0]]}, "properties": {"a": 3}}]
+    try:
+        dataset = store.get("mixed", io.StringIO(json.dumps(records)))
+    except ValueError as e:
+        return [f"mixed array: {str(e)}"]
+    geometries = dataset.geometries([0, 1, 2])
+    if geometries != [records[0]["geometry"], None, records[2]["geometry"]]:
+        return [f"mixed array: geometries {geometries}"]
+    if [record["a"] for record in dataset.records([0, 1, 2])] != [1, 2, 3]:
+        return ["mixed array: properties differ"]
+    return []
+
+
+def main() -> int:
+    with tempfile.TemporaryDirectory() as directory:
+        store = ColumnarStore(directory)
+        failures = check_track(store, 100_000) + check_track(store, 300_000) + check_mixed(store)
+    for failure in failures:
+        print(failure)
+    print(f"{len(failures)} failures")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
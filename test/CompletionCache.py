@@ -0,0 +1,120 @@
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger("azmaps-geo-assistant")
+
+
+class CompletionCache:
+    """Two-tier cache of chat completion texts keyed by a hash of the request.
+
+    An in-memory LRU sits in front of a SQLite table. Entries expire after ttl_seconds; the
+    disk tier is trimmed to max_disk_bytes by evicting the least recently used entries.
+    """
+
+    def __init__(self, path: str = "cache/completions.sqlite", max_memory_entries: int = 256,
+                 max_disk_bytes: int = 256 * 1024 * 1024, ttl_seconds: float = 7 * 24 * 3600):
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl_seconds = ttl_seconds
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS completions (
+                key TEXT PRIMARY KEY,
+                content TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS completions_accessed ON completions (accessed)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS completions_created ON completions (created)")
+        self._db.commit()
+        self._disk_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+        self.stats = {"memoryHits": 0, "diskHits": 0, "misses": 0, "evictions": 0}
+
+    @staticmethod
+    def key(params: Dict[str, Any]) -> str:
+        """Hash the model parameters and the normalized message history."""
+        normalized = dict(params)
+        normalized["messages"] = [
+            {"role": message["role"], "content": " ".join((message["content"] or "").split())}
+            for message in params["messages"]
+        ]
+        return hashlib.sha256(json.dumps(normalized, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[1] <= self.ttl_seconds:
+                self._memory.move_to_end(key)
+                self.stats["memoryHits"] += 1
+                return entry[0]
+            row = self._db.execute("SELECT content, created FROM completions WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                self.stats["misses"] += 1
+                return None
+            self._db.execute("UPDATE completions SET accessed = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            self._remember(key, row[0], row[1])
+            self.stats["diskHits"] += 1
+            return row[0]
+
+    def put(self, key: str, content: str) -> None:
+        now = time.time()
+        size = len(content.encode("utf-8"))
+        with self._lock:
+            self._remember(key, content, now)
+            previous = self._db.execute("SELECT size FROM completions WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO completions (key, content, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, content, size, now, now)
+            )
+            self._disk_bytes += size - (previous[0] if previous else 0)
+            self._evict_disk(now)
+            self._db.commit()
+
+    async def aget(self, key: str) -> Optional[str]:
+        return await asyncio.to_thread(self.get, key)
+
+    async def aput(self, key: str, content: str) -> None:
+        await asyncio.to_thread(self.put, key, content)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def _remember(self, key: str, content: str, created: float) -> None:
+        self._memory[key] = (content, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self, now: float) -> None:
+        expired = self._db.execute(
+            "DELETE FROM completions WHERE created < ? RETURNING size", (now - self.ttl_seconds,)
+        ).fetchall()
+        self._disk_bytes -= sum(size for (size,) in expired)
+        self.stats["evictions"] += len(expired)
+        while self._disk_bytes > self.max_disk_bytes:
+            oldest = self._db.execute(
+                "SELECT key, size FROM completions ORDER BY accessed LIMIT 64"
+            ).fetchall()
+            if not oldest:
+                break
+            for key, size in oldest:
+                if self._disk_bytes <= self.max_disk_bytes:
+                    break
+                self._db.execute("DELETE FROM completions WHERE key = ?", (key,))
+                self._memory.pop(key, None)
+                self._disk_bytes -= size
+                self.stats["evictions"] += 1
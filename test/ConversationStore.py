@@ -0,0 +1,125 @@
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+import asyncio
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger("azmaps-geo-assistant")
+
+
+class DiskConversationBackend:
+    """Persist conversations as chat_histories/chat_{chatId}.json files."""
+
+    def __init__(self, directory: str = "chat_histories"):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, chat_id: str) -> str:
+        return os.path.join(self.directory, f"chat_{chat_id}.json")
+
+    def load(self, chat_id: str) -> Optional[Dict[str, Any]]:
+        path = self._path(chat_id)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r") as f:
+            return json.load(f)
+
+    def save(self, conversation: Dict[str, Any]) -> None:
+        with open(self._path(conversation["chatId"]), "w") as f:
+            json.dump(conversation, f)
+
+    def forget(self, chat_id: str) -> None:
+        """Drop any per-session state once the conversation leaves memory."""
+
+
+class ConversationStore:
+    """Session-keyed conversation store: an in-memory LRU with TTL eviction over an optional disk backend.
+
+    Evicted sessions stay on disk and are loaded back lazily on their next request. Without a
+    backend, evicted sessions are gone.
+    """
+
+    def __init__(self, max_sessions: int = 1000, ttl_seconds: float = 3600,
+                 backend: Optional[DiskConversationBackend] = None):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.backend = backend
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._last_access: Dict[str, float] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    async def get(self, chat_id: str) -> Optional[Dict[str, Any]]:
+        """Return the conversation for chat_id, loading it from the backend if it is not in memory.
+
+        Backend reads run in a worker thread so they do not block the event loop.
+        """
+        self._evict_expired()
+        conversation = self._sessions.get(chat_id)
+        if conversation is None and self.backend:
+            conversation = await asyncio.to_thread(self.backend.load, chat_id)
+            # Another request may have loaded it while this one was reading
+            if chat_id in self._sessions:
+                conversation = self._sessions[chat_id]
+            elif conversation is not None:
+                logger.info(f"{chat_id}: Loaded conversation from disk")
+                self._sessions[chat_id] = conversation
+        if conversation is not None:
+            self._touch(chat_id)
+            self._evict_overflow()
+        return conversation
+
+    def put(self, conversation: Dict[str, Any]) -> None:
+        """Add or replace a conversation in memory."""
+        chat_id = conversation["chatId"]
+        self._sessions[chat_id] = conversation
+        self._touch(chat_id)
+        self._evict_expired()
+        self._evict_overflow()
+
+    def save(self, conversation: Dict[str, Any]) -> None:
+        """Write a conversation through to the backend, if one is configured."""
+        if self.backend:
+            self.backend.save(conversation)
+
+    def lock(self, chat_id: str) -> asyncio.Lock:
+        """Per-session lock so turns of one conversation run one at a time."""
+        if chat_id not in self._locks:
+            self._locks[chat_id] = asyncio.Lock()
+        return self._locks[chat_id]
+
+    def _touch(self, chat_id: str) -> None:
+        self._sessions.move_to_end(chat_id)
+        self._last_access[chat_id] = time.monotonic()
+
+    def _evict(self, chat_id: str) -> None:
+        self._sessions.pop(chat_id, None)
+        self._last_access.pop(chat_id, None)
+        self._locks.pop(chat_id, None)
+        if self.backend:
+            self.backend.forget(chat_id)
+        logger.debug(f"{chat_id}: Evicted conversation from memory")
+
+    def _is_busy(self, chat_id: str) -> bool:
+        lock = self._locks.get(chat_id)
+        return lock is not None and lock.locked()
+
+    def _evict_expired(self) -> None:
+        deadline = time.monotonic() - self.ttl_seconds
+        # Sessions are ordered by last access, so stop at the first one still alive
+        for chat_id in list(self._sessions):
+            if self._last_access[chat_id] > deadline:
+                break
+            if not self._is_busy(chat_id):
+                self._evict(chat_id)
+
+    def _evict_overflow(self) -> None:
+        for chat_id in list(self._sessions):
+            if len(self._sessions) <= self.max_sessions:
+                break
+            if not self._is_busy(chat_id):
+                self._evict(chat_id)
@@ -0,0 +1,353 @@
+from collections import Counter
+from typing import Dict, Any, List, Optional, Union, IO
+import io
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+from DataSampler import iter_records
+
+BATCH_SIZE = 50_000
+# Values kept per numeric column to estimate quantiles
+RESERVOIR_SIZE = 10_000
+# Distinct string values tracked per column before the rarest are dropped
+MAX_TRACKED_VALUES = 1_000
+
+LAT_NAMES = {"lat", "latitude", "y"}
+LON_NAMES = {"lon", "lng", "long", "longitude", "x"}
+TIME_HINTS = ("time", "date", "timestamp")
+
+
+class _ColumnStats:
+    """Running statistics of one column, updated a batch at a time."""
+
+    def __init__(self, name: str, rng: np.random.Generator):
+        self.name = name
+        self.kind: Optional[str] = None  # number | datetime | string
+        self.count = 0
+        self.nulls = 0
+        self.min = None
+        self.max = None
+        self.seen = 0
+        self.sample = np.empty(0)
+        self.values: Counter = Counter()
+        self._rng = rng
+
+    def update(self, column: pd.Series) -> None:
+        non_null = column.dropna()
+        self.count += len(column)
+        self.nulls += len(column) - len(non_null)
+        if non_null.empty:
+            return
+        if self.kind is None:
+            self.kind = self._detect_kind(non_null)
+
+        if self.kind == "number":
+            values = pd.to_numeric(non_null, errors="coerce").to_numpy(dtype=float)
+            values = values[~np.isnan(values)]
+            if len(values):
+                self._update_range(values.min(), values.max())
+                self._update_sample(values)
+        elif self.kind == "datetime":
+            # Parse before comparing: strings with different offsets or precision do not sort chronologically
+            times = pd.to_datetime(non_null.astype(str), errors="coerce", utc=True, format="ISO8601").dropna()
+            if len(times):
+                self._update_range(times.min(), times.max())
+        else:
+            self.values.update(non_null.astype(str).value_counts().to_dict())
+            if len(self.values) > MAX_TRACKED_VALUES:
+                self.values = Counter(dict(self.values.most_common(MAX_TRACKED_VALUES // 2)))
+
+    def _detect_kind(self, values: pd.Series) -> str:
+        probe = values.head(1_000)
+        if pd.api.types.is_bool_dtype(probe):
+            return "string"
+        if pd.to_numeric(probe, errors="coerce").notna().mean() >= 0.95:
+            return "number"
+        if not pd.api.types.is_numeric_dtype(probe) and (any(hint in self.name.lower() for hint in TIME_HINTS) or probe.astype(str).str.match(r"^\d{4}-\d{2}-\d{2}").mean() >= 0.95):
+            if pd.to_datetime(probe, errors="coerce", utc=True, format="ISO8601").notna().mean() >= 0.95:
+                return "datetime"
+        return "string"
+
+    def _update_range(self, low, high) -> None:
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+
+    def _update_sample(self, values: np.ndarray) -> None:
+        """Vectorized reservoir sampling, so quantiles cover the whole file in fixed memory."""
+        room = RESERVOIR_SIZE - len(self.sample)
+        if room > 0:
+            self.sample = np.concatenate([self.sample, values[:room]])
+            self.seen += min(room, len(values))
+            values = values[room:]
+        if len(values):
+            positions = np.arange(self.seen + 1, self.seen + len(values) + 1)
+            accepted = values[self._rng.random(len(values)) < RESERVOIR_SIZE / positions]
+            self.sample[self._rng.integers(0, RESERVOIR_SIZE, size=len(accepted))] = accepted
+            self.seen += len(values)
+
+    def summary(self) -> Dict[str, Any]:
+        result = {"type": self.kind or "empty", "nulls": int(self.nulls)}
+        if self.kind == "number" and self.min is not None:
+            p25, p50, p75 = np.quantile(self.sample, [0.25, 0.5, 0.75])
+            result.update({"min": float(self.min), "p25": float(p25), "median": float(p50), "p75": float(p75), "max": float(self.max)})
+        elif self.kind == "datetime" and self.min is not None:
+            result.update({"min": self.min.isoformat(), "max": self.max.isoformat()})
+        elif self.kind == "string":
+            result.update({
+                "distinct": len(self.values),
+                "distinctIsLowerBound": len(self.values) >= MAX_TRACKED_VALUES // 2,
+                "top": self.values.most_common(5)
+            })
+        return result
+
+
+class DataProfiler:
+    """Single-pass profiler for uploaded GeoJSON, JSON and CSV data.
+
+    Records are processed in batches with pandas/NumPy. Profiling stops when the time budget
+    runs out, and the result then says how many records it covers. A dataset already converted
+    to columns (see ColumnarStore) is profiled from those instead, whole and exactly.
+    """
+
+    def __init__(self, time_budget: float = 5.0, batch_size: int = BATCH_SIZE):
+        self.time_budget = time_budget
+        self.batch_size = batch_size
+
+    def profile(self, source: Union[str, IO[str]]) -> Dict[str, Any]:
+        self._deadline = time.monotonic() + self.time_budget
+        self._rng = np.random.default_rng(0)
+        self._columns: Dict[str, _ColumnStats] = {}
+        self._records = 0
+        self._partial = False
+        self._bbox = [np.inf, np.inf, -np.inf, -np.inf]
+        self._geometry_types: Counter = Counter()
+
+        if _first_char(source) in ("{", "["):
+            data_format = self._profile_json(source)
+        else:
+            data_format = self._profile_csv(io.StringIO(source) if isinstance(source, str) else source)
+
+        time_columns = [name for name, stats in self._columns.items() if stats.kind == "datetime" and stats.min is not None]
+        return {
+            "format": data_format,
+            "records": self._records,
+            "partial": self._partial,
+            "bbox": [float(v) for v in self._bbox] if np.isfinite(self._bbox).all() else None,
+            "geometryTypes": dict(self._geometry_types),
+            "timeRange": {
+                "field": time_columns[0],
+                "start": self._columns[time_columns[0]].min.isoformat(),
+                "end": self._columns[time_columns[0]].max.isoformat()
+            } if time_columns else None,
+            "fields": {name: stats.summary() for name, stats in self._columns.items()}
+        }
+
+    def profile_columns(self, dataset: Any) -> Dict[str, Any]:
+        """Profile a ColumnarStore.ColumnarDataset with whole-column NumPy reductions, no records are parsed."""
+        schema = dataset.schema
+        fields = {}
+        for name in dataset.column_names:
+            fields[name] = _column_summary(np.asarray(dataset.column(name)), dataset.column_type(name),
+                                           dataset.categories(name) if dataset.column_type(name) == "string" else None)
+        if schema["format"] == "GeoJSON":
+            geometry_types = dict(schema["geometryTypes"])
+        else:
+            points = schema["geometryTypes"].get("Point", 0)
+            geometry_types = {"Point (lat/lon fields)": points} if points else {}
+        time_field = next((name for name, field in fields.items() if field["type"] == "datetime" and "min" in field), None)
+        return {
+            "format": schema["format"],
+            "records": len(dataset),
+            "partial": False,
+            "bbox": schema["bbox"],
+            "geometryTypes": geometry_types,
+            "timeRange": {
+                "field": time_field,
+                "start": fields[time_field]["min"],
+                "end": fields[time_field]["max"]
+            } if time_field else None,
+            "fields": fields
+        }
+
+    def _out_of_time(self) -> bool:
+        if time.monotonic() > self._deadline:
+            self._partial = True
+        return self._partial
+
+    def _profile_json(self, fp) -> str:
+        data_format = "JSON"
+        properties: List[Dict[str, Any]] = []
+        geometries: List[Any] = []
+        for record in iter_records(fp):
+            if isinstance(record, dict) and record.get("type") == "Feature":
+                data_format = "GeoJSON"
+                properties.append(record.get("properties") or {})
+                geometries.append(record.get("geometry"))
+            else:
+                properties.append(record if isinstance(record, dict) else {"value": record})
+            if len(properties) >= self.batch_size:
+                self._update_json_batch(properties, geometries)
+                properties, geometries = [], []
+                if self._out_of_time():
+                    break
+        if properties:
+            self._update_json_batch(properties, geometries)
+        return data_format
+
+    def _update_json_batch(self, properties: List[Dict[str, Any]], geometries: List[Any]) -> None:
+        frame = pd.DataFrame.from_records(properties)
+        self._update_columns(frame)
+        if geometries:
+            self._update_geometries(geometries)
+        else:
+            self._update_lat_lon(frame)
+
+    def _profile_csv(self, fp) -> str:
+        for frame in pd.read_csv(fp, chunksize=self.batch_size, low_memory=False):
+            self._update_columns(frame)
+            self._update_lat_lon(frame)
+            if self._out_of_time():
+                break
+        return "CSV"
+
+    def _update_columns(self, frame: pd.DataFrame) -> None:
+        self._records += len(frame)
+        for name in frame.columns:
+            if name not in self._columns:
+                self._columns[name] = _ColumnStats(str(name), self._rng)
+                # Records before this batch did not have the field
+                self._columns[name].count = self._columns[name].nulls = self._records - len(frame)
+            self._columns[name].update(frame[name])
+        for name, stats in self._columns.items():
+            if name not in frame.columns:
+                stats.count += len(frame)
+                stats.nulls += len(frame)
+
+    def _update_lat_lon(self, frame: pd.DataFrame) -> None:
+        lat = next((c for c in frame.columns if str(c).lower() in LAT_NAMES), None)
+        lon = next((c for c in frame.columns if str(c).lower() in LON_NAMES), None)
+        if lat is None or lon is None:
+            return
+        lats = pd.to_numeric(frame[lat], errors="coerce").to_numpy(dtype=float)
+        lons = pd.to_numeric(frame[lon], errors="coerce").to_numpy(dtype=float)
+        valid = ~(np.isnan(lats) | np.isnan(lons))
+        self._geometry_types["Point (lat/lon fields)"] += int(valid.sum())
+        if valid.any():
+            self._extend_bbox(lons[valid], lats[valid])
+
+    def _update_geometries(self, geometries: List[Any]) -> None:
+        point_coordinates = []
+        other_coordinates = []
+        for geometry in geometries:
+            if not geometry:
+                self._geometry_types["None"] += 1
+                continue
+            geometry_type = geometry.get("type")
+            self._geometry_types[geometry_type] += 1
+            if geometry_type == "Point":
+                point_coordinates.append(geometry["coordinates"][:2])
+            else:
+                _flatten_coordinates(geometry, other_coordinates)
+        for coordinates in (point_coordinates, other_coordinates):
+            if coordinates:
+                array = np.asarray(coordinates, dtype=float)
+                self._extend_bbox(array[:, 0], array[:, 1])
+
+    def _extend_bbox(self, lons: np.ndarray, lats: np.ndarray) -> None:
+        self._bbox = [
+            min(self._bbox[0], np.nanmin(lons)), min(self._bbox[1], np.nanmin(lats)),
+            max(self._bbox[2], np.nanmax(lons)), max(self._bbox[3], np.nanmax(lats))
+        ]
+
+
+def _column_summary(values: np.ndarray, column_type: str, categories: Optional[List[str]]) -> Dict[str, Any]:
+    """Field summary of one typed column, in the same shape as _ColumnStats.summary()."""
+    if column_type in ("integer", "number"):
+        values = values.astype(np.float64, copy=False)
+        present = values[~np.isnan(values)]
+        result = {"type": "number", "nulls": int(len(values) - len(present))}
+        if len(present):
+            low, p25, p50, p75, high = np.quantile(present, [0, 0.25, 0.5, 0.75, 1])
+            result.update({"min": float(low), "p25": float(p25), "median": float(p50), "p75": float(p75), "max": float(high)})
+        return result
+    if column_type == "datetime":
+        present = values[~np.isnat(values)]
+        result = {"type": "datetime", "nulls": int(len(values) - len(present))}
+        if len(present):
+            result.update({"min": pd.Timestamp(present.min(), tz="UTC").isoformat(),
+                           "max": pd.Timestamp(present.max(), tz="UTC").isoformat()})
+        return result
+    # Strings are int32 codes into categories, bools int8; both are -1 for null
+    counts = np.bincount(values[values >= 0].astype(np.int64), minlength=len(categories) if categories else 2)
+    nulls = int(len(values) - counts.sum())
+    if not counts.any():
+        return {"type": "empty", "nulls": nulls}
+    labels = categories if categories is not None else ["False", "True"]
+    order = np.argsort(-counts, kind="stable")[:5]
+    return {
+        "type": "string",
+        "nulls": nulls,
+        "distinct": int(np.count_nonzero(counts)),
+        "distinctIsLowerBound": False,
+        "top": [(labels[i], int(counts[i])) for i in order.tolist() if counts[i]]
+    }
+
+
+def _first_char(source: Union[str, IO[str]]) -> str:
+    """First non-whitespace character, leaving a file source at its original position."""
+    if isinstance(source, str):
+        match = re.search(r"[^\s\ufeff]", source)
+        return match.group() if match else ""
+    start = source.tell()
+    head = source.read(4096).lstrip(" \t\r\n\ufeff")[:1]
+    source.seek(start)
+    return head
+
+
+def _flatten_coordinates(geometry: Dict[str, Any], out: List[List[float]]) -> None:
+    if geometry.get("type") == "GeometryCollection":
+        for child in geometry.get("geometries", []):
+            _flatten_coordinates(child, out)
+        return
+    stack = [geometry.get("coordinates")]
+    while stack:
+        item = stack.pop()
+        if not item:
+            continue
+        if isinstance(item[0], (int, float)):
+            out.append(item[:2])
+        else:
+            stack.extend(item)
+
+
+def _format_number(value: float) -> str:
+    return f"{value:.6g}"
+
+
+def format_profile(profile: Dict[str, Any]) -> str:
+    """Render a profile as the compact text block used in the prompt."""
+    coverage = "partial profile, time budget reached" if profile["partial"] else "all records profiled"
+    lines = [f"Format: {profile['format']}, {profile['records']:,} records ({coverage})"]
+    if profile["bbox"]:
+        lines.append("Bounding box [minLon, minLat, maxLon, maxLat]: [" + ", ".join(_format_number(v) for v in profile["bbox"]) + "]")
+    if profile["geometryTypes"]:
+        lines.append("Geometry types: " + ", ".join(f"{name}: {count:,}" for name, count in profile["geometryTypes"].items()))
+    if profile["timeRange"]:
+        time_range = profile["timeRange"]
+        lines.append(f"Time range ({time_range['field']}): {time_range['start']} to {time_range['end']}")
+    lines.append("Fields:")
+    for name, field in profile["fields"].items():
+        details = [f"nulls {field['nulls']:,}"]
+        if field["type"] == "number" and "min" in field:
+            details = [f"{key} {_format_number(field[key])}" for key in ("min", "p25", "median", "p75", "max")] + details
+        elif field["type"] == "datetime" and "min" in field:
+            details = [f"from {field['min']}", f"to {field['max']}"] + details
+        elif field["type"] == "string":
+            distinct = f"{field['distinct']:,}{'+' if field['distinctIsLowerBound'] else ''} distinct"
+            top = ", ".join(f"{value!r} ({count:,})" for value, count in field["top"])
+            details = [distinct, f"top: {top}"] + details
+        lines.append(f"- {name} ({field['type']}): " + ", ".join(details))
+    return "\n".join(lines)
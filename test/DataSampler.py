@@ -0,0 +1,278 @@
+from itertools import islice
+from typing import Any, Iterator, List, Optional, Union, IO
+import json
+import re
+
+CHUNK_SIZE = 64 * 1024
+# How much of the start of the file is kept for the plain-text fallback
+HEAD_CHARS = 64 * 1024
+# Largest single JSON value (e.g. one feature) sampling is willing to hold in memory
+MAX_VALUE_CHARS = 4 * 1024 * 1024
+
+_NON_WHITESPACE = re.compile(r'[^ \t\r\n\ufeff]')
+_DECODER = json.JSONDecoder()
+
+
+class _ValueTooLarge(ValueError):
+    pass
+
+
+class _StringSource:
+    """File-like view over an in-memory string that hands out slices instead of copying it whole."""
+
+    def __init__(self, text: str):
+        self._text = text
+        self._pos = 0
+
+    def read(self, size: int) -> str:
+        chunk = self._text[self._pos:self._pos + size]
+        self._pos += len(chunk)
+        return chunk
+
+
+class _TextScanner:
+    """Chunked reader that can pull single raw JSON values or lines off the front of a text stream.
+
+    Only the value being scanned is kept in the buffer, so memory is bounded by the chunk size
+    plus the largest value read, independent of the total size of the stream.
+    """
+
+    def __init__(self, fp: IO[str], chunk_size: int = CHUNK_SIZE):
+        self._fp = fp
+        self._chunk_size = chunk_size
+        self._buf = ""
+        self._pos = 0
+        self._mark = None
+        self._eof = False
+        self.head = ""
+
+    def _fill(self, size: Optional[int] = None) -> bool:
+        if self._eof:
+            return False
+        chunk = self._fp.read(size or self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        if len(self.head) < HEAD_CHARS:
+            self.head += chunk[:HEAD_CHARS - len(self.head)]
+        keep = self._pos if self._mark is None else self._mark
+        self._buf = self._buf[keep:] + chunk
+        self._pos -= keep
+        if self._mark is not None:
+            self._mark -= keep
+        return True
+
+    def first_char(self) -> str:
+        """First non-whitespace character of the stream, without consuming anything."""
+        start = self._pos
+        while True:
+            match = _NON_WHITESPACE.search(self._buf, start)
+            if match is not None:
+                return match.group()
+            start = len(self._buf) - self._pos
+            if not self._fill():
+                return ""
+            start += self._pos
+
+    def peek(self) -> str:
+        """Skip whitespace and return the next character ('' at end of stream)."""
+        while True:
+            match = _NON_WHITESPACE.search(self._buf, self._pos)
+            if match is not None:
+                self._pos = match.start()
+                return match.group()
+            self._pos = len(self._buf)
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise ValueError(f"Expected '{char}'")
+        self._pos += 1
+
+    def read_value(self, max_chars: Optional[int] = MAX_VALUE_CHARS) -> Any:
+        """Read and decode the next complete JSON value, pulling in more chunks until it is whole.
+
+        Raises ValueError for a value longer than max_chars, None reads values of any size.
+        """
+        if not self.peek():
+            raise ValueError("Unexpected end of data")
+        self._mark = self._pos
+        try:
+            while True:
+                try:
+                    value, end = _DECODER.raw_decode(self._buf, self._pos)
+                    # A value ending exactly at the buffer end may be a number cut by the chunk boundary
+                    if end < len(self._buf) or self._eof:
+                        self._pos = end
+                        return value
+                except json.JSONDecodeError:
+                    if self._eof:
+                        raise
+                if max_chars is not None and len(self._buf) - self._mark > max_chars:
+                    raise _ValueTooLarge(f"JSON value larger than {max_chars} characters")
+                # Double what is read of a large value each time, so it is decoded a few times, not once per
+                # chunk, without reading past max_chars
+                size = max(self._chunk_size, len(self._buf) - self._mark)
+                if max_chars is not None:
+                    size = max(1, min(size, max_chars + 1 - (len(self._buf) - self._mark)))
+                self._fill(size)
+        finally:
+            self._mark = None
+
+    def iter_array_items(self, max_chars: Optional[int] = MAX_VALUE_CHARS) -> Iterator[Any]:
+        """Yield the values of the array starting at the current position, one at a time."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.expect("]")
+            return
+        while True:
+            yield self.read_value(max_chars)
+            char = self.peek()
+            if char not in ",]":
+                raise ValueError("Expected ',' or ']'")
+            self.expect(char)
+            if char == "]":
+                return
+
+    def read_array_items(self, max_items: int) -> List[Any]:
+        """Read up to max_items values from the array starting at the current position."""
+        return list(islice(self.iter_array_items(), max_items))
+
+    def read_lines(self, max_lines: int) -> List[str]:
+        lines = []
+        while len(lines) < max_lines:
+            idx = self._buf.find("\n", self._pos)
+            if idx >= 0:
+                lines.append(self._buf[self._pos:idx])
+                self._pos = idx + 1
+            elif not self._fill():
+                if self._pos < len(self._buf):
+                    lines.append(self._buf[self._pos:])
+                    self._pos = len(self._buf)
+                break
+        return lines
+
+    def head_lines(self, max_lines: int) -> str:
+        """First lines of the stream, for content that is treated as plain text after all."""
+        while self.head.count("\n") < max_lines and len(self.head) < HEAD_CHARS and self._fill():
+            pass
+        return "\n".join(self.head.split("\n")[:max_lines])
+
+
+def _sample_object(scanner: _TextScanner, max_items: int) -> Optional[str]:
+    """Sample a stream that starts with a JSON object: a FeatureCollection, NDJSON or a single object."""
+    scanner.expect("{")
+    members = {}
+    complete = scanner.peek() == "}"
+    while not complete:
+        key = scanner.read_value()
+        scanner.expect(":")
+        if key == "features" and scanner.peek() == "[":
+            # Stop as soon as the sampled features are read, the rest of the file is never touched
+            members["features"] = scanner.read_array_items(max_items)
+            if members.get("type", "FeatureCollection") == "FeatureCollection":
+                return json.dumps(members, indent=2)
+            break
+        members[key] = scanner.read_value()
+        char = scanner.peek()
+        if char not in ",}":
+            raise ValueError("Expected ',' or '}'")
+        complete = char == "}"
+        scanner.expect(char)
+    if complete and members.get("type") == "FeatureCollection" and "features" in members:
+        return json.dumps(members, indent=2)
+
+    if complete and scanner.peek() == "{":
+        # Newline-delimited JSON: one object per record
+        records = [members]
+        while len(records) < max_items and scanner.peek() == "{":
+            records.append(scanner.read_value())
+        return "\n".join(json.dumps(record) for record in records)
+
+    # Any other single JSON object, show its first lines like plain text
+    return None
+
+
+def sample_data(source: Union[str, IO[str]], max_items: int = 5) -> str:
+    """Sample the first max_items records of GeoJSON, JSON array, NDJSON or CSV content.
+
+    Reads the source incrementally and stops after the sampled records, so time and memory do
+    not depend on the size of the file. Accepts a string or a text file object.
+    """
+    scanner = _TextScanner(_StringSource(source) if isinstance(source, str) else source)
+    first = scanner.first_char()
+    try:
+        if first == "[":
+            return json.dumps(scanner.read_array_items(max_items), indent=2)
+        if first == "{":
+            sampled = _sample_object(scanner, max_items)
+            if sampled is not None:
+                return sampled
+            return scanner.head_lines(max_items + 1)
+    except ValueError:
+        # Not valid JSON after all (or a single huge value), treat it as CSV/text
+        return scanner.head_lines(max_items + 1)
+
+    # CSV/text: header + first data lines
+    return "\n".join(scanner.read_lines(max_items + 1))
+
+
+def sample_columns(dataset: Any, max_items: int = 5) -> str:
+    """Sample the first max_items records of a ColumnarStore.ColumnarDataset, laid out like sample_data()."""
+    rows = list(range(min(max_items, len(dataset))))
+    records = dataset.records(rows)
+    if dataset.schema["format"] == "GeoJSON":
+        features = [{"type": "Feature", "geometry": geometry, "properties": properties}
+                    for geometry, properties in zip(dataset.geometries(rows), records)]
+        return json.dumps({"type": "FeatureCollection", "features": features}, indent=2)
+    if dataset.schema["format"] == "JSON":
+        return json.dumps(records, indent=2)
+    # CSV: header + first data lines
+    lines = [",".join(_csv_value(name) for name in dataset.column_names)]
+    lines.extend(",".join(_csv_value(record[name]) for name in dataset.column_names) for record in records)
+    return "\n".join(lines)
+
+
+def _csv_value(value: Any) -> str:
+    if value is None:
+        return ""
+    text = str(value).lower() if isinstance(value, bool) else str(value)
+    if any(char in text for char in ',"\n'):
+        return '"' + text.replace('"', '""') + '"'
+    return text
+
+
+def iter_records(source: Union[str, IO[str]], max_value_chars: Optional[int] = None) -> Iterator[Any]:
+    """Yield every record of JSON content: the features of a FeatureCollection, the items of an
+    array, or the objects of NDJSON. Raises ValueError for content that is not JSON.
+
+    Records of any size are read unless max_value_chars is given; unlike sampling, every record
+    is needed, so a single large feature such as a long GPS track must not fail the whole file.
+    """
+    scanner = _TextScanner(_StringSource(source) if isinstance(source, str) else source)
+    first = scanner.first_char()
+    if first == "[":
+        yield from scanner.iter_array_items(max_value_chars)
+        return
+    if first != "{":
+        raise ValueError("Content is not JSON")
+
+    scanner.expect("{")
+    members = {}
+    complete = scanner.peek() == "}"
+    while not complete:
+        key = scanner.read_value()
+        scanner.expect(":")
+        if key == "features" and scanner.peek() == "[":
+            yield from scanner.iter_array_items(max_value_chars)
+            return
+        members[key] = scanner.read_value(max_value_chars)
+        char = scanner.peek()
+        if char not in ",}":
+            raise ValueError("Expected ',' or '}'")
+        complete = char == "}"
+        scanner.expect(char)
+    yield members
+    while scanner.peek() == "{":
+        yield scanner.read_value(max_value_chars)
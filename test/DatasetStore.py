@@ -0,0 +1,116 @@
+from typing import Any, AsyncIterable, Dict, IO, Optional
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+import uuid
+
+logger = logging.getLogger("azmaps-geo-assistant")
+
+_DATASET_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+class DatasetStore:
+    """Uploaded data files, stored once under a content-hashed dataset ID.
+
+    Each dataset is written as {directory}/{datasetId}{ext} with a {datasetId}.json metadata file.
+    Uploads are streamed to a temporary file while hashing, so memory stays bounded by the chunk
+    size; a second upload of the same bytes is dropped and resolves to the existing dataset.
+    """
+
+    def __init__(self, directory: str = "data/datasets", max_bytes: Optional[int] = None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def _extension(file_name: str) -> str:
+        ext = os.path.splitext(os.path.basename(file_name or ""))[1].lower()
+        return ext if re.fullmatch(r"\.[a-z0-9]{1,10}", ext) else ""
+
+    def _meta_path(self, dataset_id: str) -> str:
+        return os.path.join(self.directory, f"{dataset_id}.json")
+
+    def get(self, dataset_id: str) -> Optional[Dict[str, Any]]:
+        """Return the metadata of a dataset, or None when it does not exist."""
+        if not _DATASET_ID.match(dataset_id or ""):
+            return None
+        try:
+            with open(self._meta_path(dataset_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def path(self, dataset: Dict[str, Any]) -> str:
+        return os.path.join(self.directory, dataset["storedName"])
+
+    def open(self, dataset: Dict[str, Any]) -> IO[str]:
+        """Open a dataset as text, for the sampler and profiler which read it in chunks."""
+        return open(self.path(dataset), "r", encoding="utf-8-sig", errors="replace")
+
+    def _new_temp_path(self) -> str:
+        return os.path.join(self.directory, f".upload-{uuid.uuid4().hex}.tmp")
+
+    def _commit(self, temp_path: str, digest: str, size: int, file_name: str) -> Dict[str, Any]:
+        """Move a fully written upload into place, or drop it when the content is already stored."""
+        dataset_id = digest[:32]
+        existing = self.get(dataset_id)
+        if existing and os.path.exists(self.path(existing)):
+            os.remove(temp_path)
+            return {**existing, "deduplicated": True}
+        dataset = {
+            "datasetId": dataset_id,
+            "fileName": os.path.basename(file_name or "") or f"{dataset_id}{self._extension(file_name)}",
+            "storedName": f"{dataset_id}{self._extension(file_name)}",
+            "bytes": size,
+            "sha256": digest,
+            "created": time.strftime("%Y-%m-%d %H:%M:%S")
+        }
+        os.replace(temp_path, self.path(dataset))
+        # Metadata last, a dataset is only visible once its file is in place
+        temp_meta = self._new_temp_path()
+        with open(temp_meta, "w", encoding="utf-8") as f:
+            json.dump(dataset, f)
+        os.replace(temp_meta, self._meta_path(dataset_id))
+        logger.info(f"Stored dataset {dataset_id} ({dataset['fileName']}, {size} bytes)")
+        return {**dataset, "deduplicated": False}
+
+    async def save_stream(self, file_name: str, chunks: AsyncIterable[bytes]) -> Dict[str, Any]:
+        """Write an upload to disk chunk by chunk and return its metadata.
+
+        Raises ValueError when the upload is empty or larger than max_bytes.
+        """
+        temp_path = self._new_temp_path()
+        sha = hashlib.sha256()
+        size = 0
+        try:
+            with open(temp_path, "wb") as f:
+                async for chunk in chunks:
+                    if not chunk:
+                        continue
+                    size += len(chunk)
+                    if self.max_bytes is not None and size > self.max_bytes:
+                        raise ValueError(f"Upload is larger than {self.max_bytes} bytes")
+                    sha.update(chunk)
+                    # Disk writes off the event loop, other requests keep being served during a large upload
+                    await asyncio.to_thread(f.write, chunk)
+            if not size:
+                raise ValueError("Upload is empty")
+            return self._commit(temp_path, sha.hexdigest(), size, file_name)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def save_text(self, file_name: str, content: str) -> Dict[str, Any]:
+        """Store file content sent inline in a chat message."""
+        data = content.encode("utf-8")
+        if not data:
+            raise ValueError("Upload is empty")
+        temp_path = self._new_temp_path()
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        return self._commit(temp_path, hashlib.sha256(data).hexdigest(), len(data), file_name)
@@ -0,0 +1,108 @@
+from functools import lru_cache
+from typing import Dict, Any, List
+import logging
+import re
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.encoding_for_model("gpt-4")
+except Exception:
+    # tiktoken is optional, fall back to the usual ~4 characters per token estimate
+    _ENCODING = None
+
+logger = logging.getLogger("azmaps-geo-assistant")
+
+CODE_BLOCK_PATTERN = re.compile(r'```.*?```', re.DOTALL)
+CODE_BLOCK_PLACEHOLDER = "[Map HTML from an earlier response omitted, the latest version is included later in the conversation]"
+# Per-message overhead of the chat format (role and separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str) -> int:
+    """Count tokens in text with tiktoken when available, otherwise estimate them."""
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return (len(text) + 3) // 4
+
+
+def count_message_tokens(messages: List[Dict[str, Any]]) -> int:
+    return sum(MESSAGE_OVERHEAD_TOKENS + count_tokens(message["content"] or "") for message in messages)
+
+
+class HistoryManager:
+    """Build a token-bounded prompt from a conversation history.
+
+    The stored history is never modified. For the prompt, only the latest assistant message
+    that contains generated HTML keeps its code; older code blocks are collapsed into a
+    placeholder. If the prompt is still over budget, the oldest assistant/user turns after the
+    initial file message are dropped, except the one with the latest generated HTML.
+    """
+
+    def __init__(self, token_budget: int = 5000):
+        self.token_budget = token_budget
+        self.stats = {
+            "prompts": 0,
+            "tokensBefore": 0,
+            "tokensAfter": 0,
+            "tokensSaved": 0,
+            "turnsDropped": 0
+        }
+
+    def build_prompt(self, history: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        tokens_before = count_message_tokens(history)
+        messages = self._collapse_old_code(history)
+
+        # The system prompt and the first user message (file contents) are always kept. The rest
+        # is split into turns that each start with an assistant message and run up to the next
+        # one, so dropping whole turns keeps user and assistant messages alternating
+        head, rest = messages[:2], messages[2:]
+        turns: List[List[Dict[str, Any]]] = []
+        for message in rest:
+            if message["role"] == "assistant" or not turns:
+                turns.append([])
+            turns[-1].append(message)
+        # Never dropped: the latest turn (it ends with the user's new message) and the turn
+        # holding the latest generated HTML
+        protected = {len(turns) - 1}
+        for i in range(len(turns) - 1, -1, -1):
+            if any(message["role"] == "assistant" and "```" in (message["content"] or "") for message in turns[i]):
+                protected.add(i)
+                break
+        turn_tokens = [count_message_tokens(turn) for turn in turns]
+        total = count_message_tokens(head) + sum(turn_tokens)
+        dropped = set()
+        for i in range(len(turns)):
+            if total <= self.token_budget:
+                break
+            if i not in protected:
+                dropped.add(i)
+                total -= turn_tokens[i]
+        turns_dropped = len(dropped)
+        messages = head + [message for i, turn in enumerate(turns) if i not in dropped for message in turn]
+
+        tokens_after = count_message_tokens(messages)
+        self.stats["prompts"] += 1
+        self.stats["tokensBefore"] += tokens_before
+        self.stats["tokensAfter"] += tokens_after
+        self.stats["tokensSaved"] += tokens_before - tokens_after
+        self.stats["turnsDropped"] += turns_dropped
+        logger.debug(f"Prompt tokens: {tokens_before} -> {tokens_after} ({turns_dropped} turns dropped)")
+        if tokens_after > self.token_budget:
+            logger.warning(f"Prompt is {tokens_after} tokens, over the {self.token_budget} token budget")
+        return messages
+
+    @staticmethod
+    def _collapse_old_code(history: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        latest_code_index = None
+        for i in range(len(history) - 1, -1, -1):
+            if history[i]["role"] == "assistant" and "```" in (history[i]["content"] or ""):
+                latest_code_index = i
+                break
+
+        messages = []
+        for i, message in enumerate(history):
+            if message["role"] == "assistant" and i != latest_code_index and "```" in (message["content"] or ""):
+                message = {**message, "content": CODE_BLOCK_PATTERN.sub(CODE_BLOCK_PLACEHOLDER, message["content"])}
+            messages.append(message)
+        return messages
@@ -0,0 +1,128 @@
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Sequence, Tuple
+import json
+import re
+
+import numpy as np
+
+_WORD = re.compile(r"[A-Za-z_$][\w$]*(?:\.[A-Za-z_$][\w$]*)*|\d+")
+_CAMEL_PART = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased terms that keep SDK identifiers matchable as a whole and by their parts.
+
+    'atlas.layer.BubbleLayer' yields the dotted name, each segment ('bubblelayer') and the
+    camel-case words of each segment ('bubble', 'layer').
+    """
+    terms = []
+    for match in _WORD.finditer(text or ""):
+        word = match.group()
+        segments = word.split(".")
+        if len(segments) > 1:
+            terms.append(word.lower())
+        for segment in segments:
+            terms.append(segment.lower())
+            parts = _CAMEL_PART.findall(segment)
+            if len(parts) > 1:
+                terms.extend(part.lower() for part in parts)
+    return terms
+
+
+class LexicalIndex:
+    """BM25 inverted index with array-backed postings (CSR layout: offsets, doc ids, term frequencies).
+
+    Title terms are weighted by title_weight, a simple BM25F. Saved as an .npz of the arrays plus
+    the vocabulary, which loads without re-tokenizing the corpus.
+    """
+
+    def __init__(self, vocabulary: Dict[str, int], offsets: np.ndarray, doc_ids: np.ndarray, tfs: np.ndarray,
+                 doc_lengths: np.ndarray, k1: float = 1.2, b: float = 0.75):
+        self.vocabulary = vocabulary
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+        self.num_docs = len(doc_lengths)
+        self.average_length = float(doc_lengths.mean()) if self.num_docs else 0.0
+        document_frequencies = np.diff(offsets).astype(np.float32)
+        self.idf = np.log1p((self.num_docs - document_frequencies + 0.5) / (document_frequencies + 0.5))
+        # Per-document part of the BM25 denominator, computed once
+        self._length_norm = (k1 * (1 - b + b * doc_lengths / max(self.average_length, 1e-9))).astype(np.float32)
+
+    @classmethod
+    def build(cls, documents: Iterable[Tuple[str, str]], title_weight: float = 2.0, **kwargs) -> "LexicalIndex":
+        """Index (title, text) pairs, in document order."""
+        postings: Dict[str, List[Tuple[int, float]]] = defaultdict(list)
+        doc_lengths = []
+        for doc_id, (title, text) in enumerate(documents):
+            counts = Counter()
+            for term in tokenize(title):
+                counts[term] += title_weight
+            for term in tokenize(text):
+                counts[term] += 1
+            for term, tf in counts.items():
+                postings[term].append((doc_id, tf))
+            doc_lengths.append(sum(counts.values()))
+
+        terms = sorted(postings)
+        sizes = np.fromiter((len(postings[term]) for term in terms), dtype=np.int64, count=len(terms))
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=offsets[1:])
+        doc_ids = np.empty(offsets[-1], dtype=np.int32)
+        tfs = np.empty(offsets[-1], dtype=np.float32)
+        for term_id, term in enumerate(terms):
+            entries = np.asarray(postings[term], dtype=np.float64)
+            doc_ids[offsets[term_id]:offsets[term_id + 1]] = entries[:, 0]
+            tfs[offsets[term_id]:offsets[term_id + 1]] = entries[:, 1]
+        vocabulary = {term: term_id for term_id, term in enumerate(terms)}
+        return cls(vocabulary, offsets, doc_ids, tfs, np.asarray(doc_lengths, dtype=np.float32), **kwargs)
+
+    def save(self, path: str) -> None:
+        with open(path, "wb") as f:
+            np.savez(f, offsets=self.offsets, doc_ids=self.doc_ids, tfs=self.tfs, doc_lengths=self.doc_lengths,
+                     terms=np.array(json.dumps(sorted(self.vocabulary, key=self.vocabulary.get))),
+                     parameters=np.array([self.k1, self.b]))
+
+    @classmethod
+    def load(cls, path: str) -> "LexicalIndex":
+        with np.load(path) as data:
+            terms = json.loads(str(data["terms"]))
+            k1, b = data["parameters"].tolist()
+            return cls({term: term_id for term_id, term in enumerate(terms)}, data["offsets"], data["doc_ids"],
+                       data["tfs"], data["doc_lengths"], k1=k1, b=b)
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every document for the query."""
+        scores = np.zeros(self.num_docs, dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            doc_ids = self.doc_ids[start:end]
+            tfs = self.tfs[start:end]
+            # A term has at most one posting per document, so fancy-index accumulation is safe
+            scores[doc_ids] += self.idf[term_id] * tfs * (self.k1 + 1) / (tfs + self._length_norm[doc_ids])
+        return scores
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[int, float]]:
+        """Return (row, score) of the top-k documents with a positive score, best first."""
+        scores = self.scores(query)
+        k = min(k, self.num_docs)
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(row), float(scores[row])) for row in top if scores[row] > 0]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = 60) -> List[Tuple[int, float]]:
+    """Fuse ranked lists of rows: each row scores the sum of 1 / (k + rank) over the lists it appears in."""
+    fused: Dict[int, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, row in enumerate(ranking, 1):
+            fused[row] += 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: -item[1])
@@ -0,0 +1,214 @@
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+from DataSampler import iter_records
+from LexicalIndex import LexicalIndex, reciprocal_rank_fusion
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+logger = logging.getLogger("azmaps-geo-assistant")
+
+INDEX_TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "agent3", "templates",
+                              "azmaps-code-samples-docs-index.json")
+# Defaults of the hnsw-1 algorithm in the index template, used when the template is not available
+DEFAULT_HNSW_PARAMETERS = {"m": 4, "efConstruction": 400, "efSearch": 500, "metric": "cosine"}
+
+
+def load_hnsw_parameters(template_path: str = INDEX_TEMPLATE, algorithm: str = "hnsw-1") -> Dict[str, Any]:
+    """Read the HNSW parameters of an algorithm from an Azure AI Search index template."""
+    try:
+        with open(template_path, "r", encoding="utf-8") as f:
+            template = json.load(f)
+        for entry in template["vectorSearch"]["algorithms"]:
+            if entry["name"] == algorithm:
+                return {**DEFAULT_HNSW_PARAMETERS, **entry["hnswParameters"]}
+    except (OSError, KeyError, ValueError) as e:
+        logger.warning(f"Could not read HNSW parameters from {template_path}: {str(e)}")
+    return dict(DEFAULT_HNSW_PARAMETERS)
+
+
+class VectorIndex:
+    """Cosine top-k over a memory-mapped float32 matrix, exact with NumPy or approximate with HNSW.
+
+    The HNSW graph is built with the index template parameters and saved next to the vectors,
+    it is rebuilt when the vectors file is newer.
+    """
+
+    def __init__(self, vectors_path: str, use_hnsw: bool = False, block_rows: int = 65536):
+        self.vectors = np.load(vectors_path, mmap_mode="r")
+        if self.vectors.dtype != np.float32 or self.vectors.ndim != 2:
+            raise ValueError(f"{vectors_path} is not a float32 matrix")
+        self.block_rows = block_rows
+        norms = np.empty(len(self.vectors), dtype=np.float32)
+        for start in range(0, len(self.vectors), block_rows):
+            norms[start:start + block_rows] = np.linalg.norm(self.vectors[start:start + block_rows], axis=1)
+        self._inverse_norms = 1.0 / np.maximum(norms, 1e-12)
+        self.hnsw = None
+        if use_hnsw:
+            if hnswlib is None:
+                logger.warning("hnswlib is not installed, falling back to exact search")
+            else:
+                self.hnsw = self._load_hnsw(vectors_path, load_hnsw_parameters())
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    def _load_hnsw(self, vectors_path: str, parameters: Dict[str, Any]):
+        space = {"cosine": "cosine", "dotProduct": "ip", "euclidean": "l2"}.get(parameters["metric"], "cosine")
+        index = hnswlib.Index(space=space, dim=self.vectors.shape[1])
+        graph_path = f"{vectors_path}.hnsw.bin"
+        if os.path.exists(graph_path) and os.path.getmtime(graph_path) >= os.path.getmtime(vectors_path):
+            index.load_index(graph_path, max_elements=len(self.vectors))
+        else:
+            index.init_index(max_elements=len(self.vectors), ef_construction=parameters["efConstruction"], M=parameters["m"])
+            for start in range(0, len(self.vectors), self.block_rows):
+                block = np.asarray(self.vectors[start:start + self.block_rows])
+                index.add_items(block, np.arange(start, start + len(block)))
+            index.save_index(graph_path)
+        index.set_ef(parameters["efSearch"])
+        return index
+
+    def search_many(self, queries: np.ndarray, k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (rows, scores) of shape (queries, k), best match first."""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        k = min(k, len(self.vectors))
+        if k == 0:
+            return np.empty((len(queries), 0), dtype=np.int64), np.empty((len(queries), 0), dtype=np.float32)
+        if self.hnsw is not None:
+            rows, distances = self.hnsw.knn_query(queries, k=k)
+            return rows.astype(np.int64), 1.0 - distances
+
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        # Score the matrix in row blocks and keep a running top-k, memory stays bounded by the block size
+        for start in range(0, len(self.vectors), self.block_rows):
+            block = self.vectors[start:start + self.block_rows]
+            scores = (queries @ block.T) * self._inverse_norms[start:start + len(block)]
+            block_k = min(k, scores.shape[1])
+            top = np.argpartition(-scores, block_k - 1, axis=1)[:, :block_k]
+            best_rows = np.concatenate([best_rows, top + start], axis=1)
+            best_scores = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+            if best_rows.shape[1] > k:
+                keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+        order = np.argsort(-best_scores, axis=1)
+        return np.take_along_axis(best_rows, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+    def search(self, query: np.ndarray, k: int = 5) -> List[Tuple[int, float]]:
+        rows, scores = self.search_many(query[None, :], k)
+        return list(zip(rows[0].tolist(), scores[0].tolist()))
+
+
+class LocalSearch:
+    """In-process retrieval over the documents written by the agent3 index scripts.
+
+    Reads the index output file and, unless mode is "lexical", the {index_file}.vectors.npy /
+    .vectors.ids.json written by its embedding stage. mode "hybrid" fuses the vector ranking with
+    a BM25 ranking over title and embedding_content by reciprocal rank fusion; the BM25 index is
+    saved as {index_file}.bm25.npz. Queries are embedded with the embedding deployment and cached,
+    the top-k documents are formatted for the prompt in place of the azure_search data source.
+    """
+
+    def __init__(self, index_path: str, client: Any, embedding_model: str, top_k: int = 3,
+                 max_document_chars: int = 6000, use_hnsw: bool = False, query_cache_size: int = 1024,
+                 mode: str = "hybrid", candidates: int = 50):
+        if mode not in ("vector", "lexical", "hybrid"):
+            raise ValueError(f"Unknown local search mode {mode}")
+        self.client = client
+        self.embedding_model = embedding_model
+        self.top_k = top_k
+        self.max_document_chars = max_document_chars
+        self.mode = mode
+        self.candidates = candidates
+
+        lexical_path = f"{index_path}.bm25.npz"
+        rebuild_lexical = mode != "vector" and (
+            not os.path.exists(lexical_path) or os.path.getmtime(lexical_path) < os.path.getmtime(index_path))
+        lexical_fields = []
+        self.documents = []
+        with open(index_path, "r", encoding="utf-8") as f:
+            for record in iter_records(f):
+                self.documents.append({
+                    "id": record["id"],
+                    "content_type": record.get("content_type", ""),
+                    "title": record.get("title", ""),
+                    "content": record.get("content", "")
+                })
+                if rebuild_lexical:
+                    lexical_fields.append((record.get("title", ""), record.get("embedding_content", "")))
+
+        self.index = None
+        if mode != "lexical":
+            self.index = VectorIndex(f"{index_path}.vectors.npy", use_hnsw=use_hnsw)
+            with open(f"{index_path}.vectors.ids.json", "r", encoding="utf-8") as f:
+                ids = json.load(f)
+            if [doc["id"] for doc in self.documents] != ids or len(ids) != len(self.index):
+                raise ValueError(f"Vectors of {index_path} are out of date, run the embedding stage again")
+        self.lexical = None
+        if mode != "vector":
+            if rebuild_lexical:
+                self.lexical = LexicalIndex.build(lexical_fields)
+                self.lexical.save(lexical_path)
+            else:
+                self.lexical = LexicalIndex.load(lexical_path)
+
+        self._query_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.query_cache_size = query_cache_size
+        self.stats = {"queries": 0, "queryCacheHits": 0, "embedSeconds": 0.0, "searchSeconds": 0.0}
+        logger.info(f"Local search loaded {len(self.documents)} documents from {index_path}, {mode} mode"
+                    f"{' with HNSW' if self.index is not None and self.index.hnsw is not None else ''}")
+
+    async def _embed_query(self, text: str) -> np.ndarray:
+        vector = self._query_cache.get(text)
+        if vector is not None:
+            self._query_cache.move_to_end(text)
+            self.stats["queryCacheHits"] += 1
+            return vector
+        start = time.perf_counter()
+        response = await self.client.embeddings.create(model=self.embedding_model, input=[text])
+        self.stats["embedSeconds"] += time.perf_counter() - start
+        vector = np.asarray(response.data[0].embedding, dtype=np.float32)
+        self._query_cache[text] = vector
+        if len(self._query_cache) > self.query_cache_size:
+            self._query_cache.popitem(last=False)
+        return vector
+
+    async def search(self, query: str, k: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Return the top-k documents for a query, each with its cosine, BM25 or fused score."""
+        k = k or self.top_k
+        vector = await self._embed_query(query) if self.index is not None else None
+        start = time.perf_counter()
+        if self.mode == "vector":
+            ranked = self.index.search(vector, k)
+        elif self.mode == "lexical":
+            ranked = self.lexical.search(query, k)
+        else:
+            candidates = max(k, self.candidates)
+            rankings = [[row for row, _ in self.index.search(vector, candidates)],
+                        [row for row, _ in self.lexical.search(query, candidates)]]
+            ranked = reciprocal_rank_fusion(rankings)[:k]
+        results = [{**self.documents[row], "score": score} for row, score in ranked]
+        self.stats["searchSeconds"] += time.perf_counter() - start
+        self.stats["queries"] += 1
+        return results
+
+    def format_context(self, documents: Sequence[Dict[str, Any]]) -> str:
+        """Format retrieved documents as a system message for the prompt."""
+        parts = ["RETRIEVED DOCUMENTS (most relevant SDK documentation and code samples for this request):"]
+        for i, doc in enumerate(documents, 1):
+            content = doc["content"]
+            if len(content) > self.max_document_chars:
+                content = content[:self.max_document_chars] + "\n[truncated]"
+            parts.append(f"[{i}] {doc['title']} (content_type: {doc['content_type']})\n{content}")
+        return "\n\n".join(parts)
@@ -0,0 +1,92 @@
+from typing import Dict, Any, List, Optional
+
+CODE_FENCE = "```"
+FOLLOWUP_OPEN = "<follow-up>"
+FOLLOWUP_CLOSE = "</follow-up>"
+
+
+class ResponseBlockParser:
+    """Incrementally split a streamed model response into explanation, HTML and follow-up blocks.
+
+    Mirrors ChatAssistant._extract_response_blocks: the first fenced block is the HTML, the first
+    <follow-up> block is the follow-up, and everything outside the blocks is the explanation.
+    Explanation text is released as soon as it cannot be the start of a block marker.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._state = "text"  # text | code | followup
+        self._scan_from = 0
+        self._explanation_parts: List[str] = []
+        self.html: Optional[str] = None
+        self.followup: Optional[str] = None
+
+    @property
+    def explanation(self) -> str:
+        return "".join(self._explanation_parts).strip()
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """Consume a chunk of response text and return the events it completes."""
+        self._buffer += chunk
+        events = []
+        while True:
+            if self._state == "text":
+                code_idx = self._buffer.find(CODE_FENCE)
+                followup_idx = self._buffer.find(FOLLOWUP_OPEN)
+                if code_idx < 0 and followup_idx < 0:
+                    # Hold back a tail that could still grow into a block marker
+                    safe = len(self._buffer) - self._partial_marker_length(self._buffer)
+                    self._emit_text(self._buffer[:safe], events)
+                    self._buffer = self._buffer[safe:]
+                    break
+                if followup_idx < 0 or 0 <= code_idx < followup_idx:
+                    self._emit_text(self._buffer[:code_idx], events)
+                    self._buffer = self._buffer[code_idx + len(CODE_FENCE):]
+                    self._state = "code"
+                else:
+                    self._emit_text(self._buffer[:followup_idx], events)
+                    self._buffer = self._buffer[followup_idx + len(FOLLOWUP_OPEN):]
+                    self._state = "followup"
+                self._scan_from = 0
+            else:
+                marker = CODE_FENCE if self._state == "code" else FOLLOWUP_CLOSE
+                end_idx = self._buffer.find(marker, self._scan_from)
+                if end_idx < 0:
+                    self._scan_from = max(0, len(self._buffer) - len(marker) + 1)
+                    break
+                block = self._buffer[:end_idx].strip()
+                self._buffer = self._buffer[end_idx + len(marker):]
+                if self._state == "code" and self.html is None:
+                    self.html = block
+                    events.append({"type": "html", "content": block})
+                elif self._state == "followup" and self.followup is None:
+                    self.followup = block
+                    events.append({"type": "followup", "text": block})
+                self._state = "text"
+        return events
+
+    def finish(self) -> List[Dict[str, Any]]:
+        """Flush remaining text. An unterminated block is treated as explanation, like the regex path."""
+        events = []
+        if self._state == "code":
+            self._buffer = CODE_FENCE + self._buffer
+        elif self._state == "followup":
+            self._buffer = FOLLOWUP_OPEN + self._buffer
+        self._emit_text(self._buffer, events)
+        self._buffer = ""
+        self._state = "text"
+        return events
+
+    def _emit_text(self, text: str, events: List[Dict[str, Any]]) -> None:
+        if text:
+            self._explanation_parts.append(text)
+            events.append({"type": "explanation", "text": text})
+
+    @staticmethod
+    def _partial_marker_length(text: str) -> int:
+        """Length of the longest suffix of text that is a proper prefix of a block marker."""
+        for length in range(min(len(text), len(FOLLOWUP_OPEN) - 1), 0, -1):
+            suffix = text[-length:]
+            if CODE_FENCE.startswith(suffix) or FOLLOWUP_OPEN.startswith(suffix):
+                return length
+        return 0
@@ -0,0 +1,172 @@
+from typing import Any, Dict, List, Optional, Tuple
+import json
+import math
+import os
+import uuid
+
+import numpy as np
+
+EARTH_RADIUS_METERS = 6_371_008.8
+METERS_PER_DEGREE = EARTH_RADIUS_METERS * math.pi / 180
+
+
+def haversine(lon1, lat1, lon2, lat2) -> np.ndarray:
+    """Great-circle distance in meters, element-wise over arrays (or scalars) in degrees."""
+    lon1, lat1, lon2, lat2 = (np.radians(value) for value in (lon1, lat1, lon2, lat2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class SpatialIndex:
+    """Uniform grid index over one position per feature, kept in NumPy arrays.
+
+    Entries are sorted by grid cell (row-major), with offsets giving each cell's range (CSR
+    layout) and the sorted positions stored alongside the feature rows, so a query reads a few
+    contiguous slices. The grid is sized for about target_per_cell entries per cell and saved as
+    .npy files that load memory-mapped.
+    """
+
+    FILES = ("spatial_rows.npy", "spatial_x.npy", "spatial_y.npy", "spatial_offsets.npy")
+
+    def __init__(self, grid: Dict[str, Any], rows: np.ndarray, x: np.ndarray, y: np.ndarray, offsets: np.ndarray):
+        self.grid = grid
+        self.rows = rows
+        self.x = x
+        self.y = y
+        self.offsets = offsets
+        self.west, self.south = grid["west"], grid["south"]
+        self.cell_width, self.cell_height = grid["cellWidth"], grid["cellHeight"]
+        self.columns, self.rows_of_cells = grid["columns"], grid["rowsOfCells"]
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    @classmethod
+    def build(cls, x: np.ndarray, y: np.ndarray, target_per_cell: int = 32, max_cells_per_side: int = 4096) -> "SpatialIndex":
+        """Index positions by row number; rows with a NaN coordinate are left out."""
+        x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+        rows = np.flatnonzero(~(np.isnan(x) | np.isnan(y)))
+        x, y = x[rows], y[rows]
+        if len(rows):
+            west, south, east, north = x.min(), y.min(), x.max(), y.max()
+        else:
+            west = south = east = north = 0.0
+        width, height = max(east - west, 1e-9), max(north - south, 1e-9)
+        cells = max(1, len(rows) // target_per_cell)
+        columns = int(min(max_cells_per_side, max(1, math.ceil(math.sqrt(cells * width / height)))))
+        rows_of_cells = int(min(max_cells_per_side, max(1, math.ceil(cells / columns))))
+        grid = {"west": float(west), "south": float(south), "cellWidth": width / columns * (1 + 1e-12),
+                "cellHeight": height / rows_of_cells * (1 + 1e-12), "columns": columns, "rowsOfCells": rows_of_cells}
+        index = cls(grid, rows, x, y, np.zeros(columns * rows_of_cells + 1, dtype=np.int64))
+        cell = index._cell_y(y) * columns + index._cell_x(x)
+        order = np.argsort(cell, kind="stable")
+        np.cumsum(np.bincount(cell, minlength=columns * rows_of_cells), out=index.offsets[1:])
+        index.rows, index.x, index.y = rows[order].astype(np.int64), x[order], y[order]
+        return index
+
+    def save(self, directory: str) -> None:
+        """Write the index beside a dataset's columns; spatial.json goes last and marks it complete."""
+        for name, array in zip(self.FILES, (self.rows, self.x, self.y, self.offsets)):
+            temp_path = os.path.join(directory, f".{uuid.uuid4().hex}.tmp.npy")
+            np.save(temp_path, array)
+            os.replace(temp_path, os.path.join(directory, name))
+        temp_path = os.path.join(directory, f".{uuid.uuid4().hex}.tmp.json")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.grid, f)
+        os.replace(temp_path, os.path.join(directory, "spatial.json"))
+
+    @classmethod
+    def load(cls, directory: str) -> Optional["SpatialIndex"]:
+        try:
+            with open(os.path.join(directory, "spatial.json"), "r", encoding="utf-8") as f:
+                grid = json.load(f)
+        except FileNotFoundError:
+            return None
+        arrays = [np.load(os.path.join(directory, name), mmap_mode="r") for name in cls.FILES]
+        return cls(grid, *arrays)
+
+    def _cell_x(self, lon) -> np.ndarray:
+        return np.clip(np.floor((np.asarray(lon) - self.west) / self.cell_width), 0, self.columns - 1).astype(np.int64)
+
+    def _cell_y(self, lat) -> np.ndarray:
+        return np.clip(np.floor((np.asarray(lat) - self.south) / self.cell_height), 0, self.rows_of_cells - 1).astype(np.int64)
+
+    def _gather(self, column0: int, row0: int, column1: int, row1: int) -> np.ndarray:
+        """Positions in the sorted arrays of every entry in a rectangle of cells (inclusive)."""
+        cell_rows = np.arange(row0, row1 + 1)
+        starts = self.offsets[cell_rows * self.columns + column0]
+        lengths = self.offsets[cell_rows * self.columns + column1 + 1] - starts
+        return np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+
+    def _bbox_positions(self, west: float, south: float, east: float, north: float) -> np.ndarray:
+        if not len(self.rows) or south > north:
+            return np.empty(0, dtype=np.int64)
+        if west > east:
+            # Crosses the antimeridian
+            return np.concatenate([self._bbox_positions(west, south, 180.0, north),
+                                   self._bbox_positions(-180.0, south, east, north)])
+        positions = self._gather(int(self._cell_x(west)), int(self._cell_y(south)), int(self._cell_x(east)), int(self._cell_y(north)))
+        x, y = self.x[positions], self.y[positions]
+        return positions[(x >= west) & (x <= east) & (y >= south) & (y <= north)]
+
+    def bbox(self, west: float, south: float, east: float, north: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(rows, x, y) of the entries inside a bounding box in degrees, edges included."""
+        positions = self._bbox_positions(west, south, east, north)
+        return np.asarray(self.rows[positions]), np.asarray(self.x[positions]), np.asarray(self.y[positions])
+
+    def _radius_positions(self, lon: float, lat: float, meters: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Positions in the sorted arrays and distances of the entries within a radius, unordered."""
+        delta_lat = meters / METERS_PER_DEGREE
+        south, north = lat - delta_lat, lat + delta_lat
+        widest = math.cos(math.radians(min(89.9, max(abs(south), abs(north)))))
+        delta_lon = meters / (METERS_PER_DEGREE * widest)
+        if delta_lon >= 180 or north >= 90 or south <= -90:
+            west, east = -180.0, 180.0
+        else:
+            west, east = (lon - delta_lon + 180) % 360 - 180, (lon + delta_lon + 180) % 360 - 180
+        positions = self._bbox_positions(west, max(south, -90.0), east, min(north, 90.0))
+        distances = haversine(lon, lat, self.x[positions], self.y[positions])
+        within = distances <= meters
+        return positions[within], distances[within]
+
+    def radius(self, lon: float, lat: float, meters: float) -> Tuple[np.ndarray, np.ndarray]:
+        """(rows, distances in meters) of the entries within a radius, nearest first."""
+        positions, distances = self._radius_positions(lon, lat, meters)
+        order = np.argsort(distances, kind="stable")
+        return np.asarray(self.rows[positions[order]]), distances[order]
+
+    def nearest(self, lon: float, lat: float, k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        """(rows, distances in meters) of the k nearest entries, nearest first.
+
+        Runs radius searches with a growing radius until one holds k entries; those are then
+        exactly the k nearest, across the antimeridian and the poles too.
+        """
+        k = min(k, len(self.rows))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        # Start from the radius that holds k entries at the grid's average density
+        cell_meters = METERS_PER_DEGREE ** 2 * self.cell_height * self.cell_width * max(0.01, math.cos(math.radians(lat)))
+        density = len(self.rows) / (cell_meters * self.columns * self.rows_of_cells)
+        meters = max(1.0, math.sqrt(k / (math.pi * density)))
+        # Beyond half the earth's circumference every entry is within the radius
+        everything = math.pi * EARTH_RADIUS_METERS * 1.01
+        while True:
+            positions, distances = self._radius_positions(lon, lat, meters)
+            if len(positions) >= k or meters >= everything:
+                top = np.argpartition(distances, k - 1)[:k]
+                top = top[np.argsort(distances[top], kind="stable")]
+                return np.asarray(self.rows[positions[top]]), distances[top]
+            meters = min(everything, meters * min(8.0, max(2.0, math.sqrt(k / max(len(positions), 1)) * 1.2)))
+
+
+def feature_collection(dataset: Any, rows: np.ndarray, distances: Optional[np.ndarray] = None,
+                       matched: Optional[int] = None) -> Dict[str, Any]:
+    """GeoJSON for query results: each feature with its row as id, and its distance when given."""
+    rows = np.asarray(rows, dtype=np.int64)
+    features: List[Dict[str, Any]] = []
+    for i, (row, geometry, properties) in enumerate(zip(rows.tolist(), dataset.geometries(rows), dataset.records(rows))):
+        feature = {"type": "Feature", "id": row, "geometry": geometry, "properties": properties}
+        if distances is not None:
+            feature["distance"] = float(distances[i])
+        features.append(feature)
+    return {"type": "FeatureCollection", "matched": len(rows) if matched is None else matched, "features": features}
@@ -0,0 +1,75 @@
+"""Compare SpatialIndex bbox, radius and nearest queries with brute force on random data.
+
+Point sets include clusters straddling the antimeridian and near the poles, where grid edges
+matter. Exits with status 1 when any query differs.
+
+Usage: python SpatialIndexCheck.py [cases] [seed]
+"""
+import sys
+
+import numpy as np
+
+from SpatialIndex import SpatialIndex, haversine
+
+
+def _points(rng: np.random.Generator, n: int):
+    kind = rng.integers(4)
+    if kind == 0:
+        # Straddling the antimeridian (Fiji)
+        x = rng.uniform(177, 183, n)
+        return (x + 180) % 360 - 180, rng.uniform(-20, -15, n)
+    if kind == 1:
+        return rng.uniform(-180, 180, n), rng.uniform(80, 90, n) * rng.choice([-1, 1], n)
+    if kind == 2:
+        return rng.uniform(-180, 180, n), np.degrees(np.arcsin(rng.uniform(-1, 1, n)))
+    return rng.normal(rng.uniform(-170, 170), 2, n).clip(-180, 180), rng.normal(rng.uniform(-60, 60), 2, n)
+
+
+def _query(rng: np.random.Generator, x: np.ndarray, y: np.ndarray):
+    i = rng.integers(len(x))
+    lon = (x[i] + rng.normal(0, 1) + 180) % 360 - 180
+    return float(lon), float(np.clip(y[i] + rng.normal(0, 1), -90, 90))
+
+
+def check_case(rng: np.random.Generator) -> list:
+    """Return the descriptions of the queries of one random case that differ from brute force."""
+    x, y = _points(rng, int(rng.integers(50, 5000)))
+    index = SpatialIndex.build(x, y, target_per_cell=int(rng.integers(1, 64)))
+    failures = []
+
+    lon, lat = _query(rng, x, y)
+    k = int(rng.integers(1, 20))
+    rows, distances = index.nearest(lon, lat, k)
+    expected = np.sort(haversine(lon, lat, x, y))[:k]
+    if not np.allclose(distances, expected, rtol=1e-9, atol=1e-6):
+        failures.append(f"nearest({lon:.4f}, {lat:.4f}, {k}): {distances[:3]} != {expected[:3]}")
+    elif not np.allclose(haversine(lon, lat, x[rows], y[rows]), distances, rtol=1e-9, atol=1e-6):
+        failures.append(f"nearest({lon:.4f}, {lat:.4f}, {k}): rows do not match their distances")
+
+    meters = float(rng.uniform(1e3, 1e6))
+    rows, distances = index.radius(lon, lat, meters)
+    expected = np.flatnonzero(haversine(lon, lat, x, y) <= meters)
+    if not np.array_equal(np.sort(rows), expected) or np.any(np.diff(distances) < 0):
+        failures.append(f"radius({lon:.4f}, {lat:.4f}, {meters:.0f}): {len(rows)} rows, expected {len(expected)}")
+
+    west, east = (float(v) for v in rng.uniform(-180, 180, 2))
+    south, north = sorted(float(v) for v in rng.uniform(-90, 90, 2))
+    rows, _, _ = index.bbox(west, south, east, north)
+    inside_lon = (x >= west) & (x <= east) if west <= east else (x >= west) | (x <= east)
+    expected = np.flatnonzero(inside_lon & (y >= south) & (y <= north))
+    if not np.array_equal(np.sort(rows), expected):
+        failures.append(f"bbox({west:.2f}, {south:.2f}, {east:.2f}, {north:.2f}): {len(rows)} rows, expected {len(expected)}")
+    return failures
+
+
+def main(cases: int, seed: int) -> int:
+    rng = np.random.default_rng(seed)
+    failures = [failure for _ in range(cases) for failure in check_case(rng)]
+    for failure in failures:
+        print(failure)
+    print(f"{cases} cases, {len(failures)} mismatches")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200, int(sys.argv[2]) if len(sys.argv) > 2 else 0))
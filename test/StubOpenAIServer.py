@@ -0,0 +1,149 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import hashlib
+import json
+import threading
+import time
+import uuid
+
+import numpy as np
+
+STUB_RESPONSE = """Here is a bubble layer visualization of your data.
+
+```
+<!DOCTYPE html>
+<html>
+<head>
+    <title>Stub Map</title>
+    <link href="https://atlas.microsoft.com/sdk/javascript/mapcontrol/3/atlas.min.css" rel="stylesheet" />
+    <script src="https://atlas.microsoft.com/sdk/javascript/mapcontrol/3/atlas.min.js"></script>
+</head>
+<body>
+    <div id="map"></div>
+    <script>
+        var map = new atlas.Map('map', { authOptions: { authType: 'subscriptionKey', subscriptionKey: 'AZURE_MAPS_SUBSCRIPTION_KEY' } });
+        atlas.io.read(USER_FILE_NAME, {type: 'geojson'});
+    </script>
+</body>
+</html>
+```
+
+<follow-up>
+1. Would you like to cluster the points?
+2. Should the bubbles be colored by a property?
+3. Do you want popups on hover?
+</follow-up>"""
+
+
+class StubOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # A burst of concurrent clients must not overflow the default backlog of 5
+    request_queue_size = 256
+
+
+class StubOpenAIHandler(BaseHTTPRequestHandler):
+    """Answers any POST with a canned chat completion after a fixed delay, streamed when requested.
+
+    Embedding requests get deterministic unit vectors derived from each input text.
+    """
+    latency = 0.5
+    content = STUB_RESPONSE
+    embedding_dimensions = 1536
+
+    chunk_size = 24
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        time.sleep(self.latency)
+        if self.path.split("?")[0].endswith("/embeddings"):
+            self._send_embeddings(request)
+            return
+        if request.get("stream"):
+            self._send_stream()
+            return
+        body = json.dumps({
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": "gpt-4",
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": self.content}
+            }],
+            "usage": {"prompt_tokens": 100, "completion_tokens": 100, "total_tokens": 200}
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    @classmethod
+    def embedding(cls, text: str) -> list:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(cls.embedding_dimensions).astype(np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def _send_embeddings(self, request: dict):
+        texts = request.get("input", [])
+        texts = [texts] if isinstance(texts, str) else texts
+        body = json.dumps({
+            "object": "list",
+            "model": request.get("model", "text-embedding-ada-002"),
+            "data": [{"object": "embedding", "index": i, "embedding": self.embedding(text)} for i, text in enumerate(texts)],
+            "usage": {"prompt_tokens": len(texts), "total_tokens": len(texts)}
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_stream(self):
+        """Send the canned response as server-sent chat completion chunks."""
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        for start in range(0, len(self.content), self.chunk_size):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": "gpt-4",
+                "choices": [{
+                    "index": 0,
+                    "finish_reason": None,
+                    "delta": {"content": self.content[start:start + self.chunk_size]}
+                }]
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        final_chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": "gpt-4",
+            "choices": [{"index": 0, "finish_reason": "stop", "delta": {}}]
+        }
+        self.wfile.write(f"data: {json.dumps(final_chunk)}\n\n".encode("utf-8"))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(latency: float = 0.5, host: str = "127.0.0.1", port: int = 0) -> StubOpenAIServer:
+    """Start the stub server on a background thread and return it. Port 0 picks a free port."""
+    handler = type("ConfiguredStubOpenAIHandler", (StubOpenAIHandler,), {"latency": latency})
+    server = StubOpenAIServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    server = start_stub_server(port=8100)
+    print(f"Stub OpenAI server listening on http://{server.server_address[0]}:{server.server_address[1]}")
+    threading.Event().wait()
@@ -0,0 +1,79 @@
+from typing import Dict, List, NamedTuple, Optional
+import hashlib
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger("azmaps-geo-assistant")
+
+
+class Template(NamedTuple):
+    name: str
+    content: str
+    mtime: float
+    version: str
+
+    @property
+    def prompt_id(self) -> str:
+        """Versioned ID recorded with each conversation, e.g. system_prompt@1a2b3c4d5e6f."""
+        return f"{self.name}@{self.version}"
+
+
+class TemplateRegistry:
+    """Loads every .txt template under a directory once and reloads files whose mtime changed.
+
+    Templates are named by their path relative to the directory without the extension, e.g.
+    "system_prompt" or "system_prompt_archives/system_prompt_002". The directory is re-scanned
+    at most every check_interval seconds, so lookups normally do no file I/O.
+    """
+
+    def __init__(self, directory: str, check_interval: float = 2.0):
+        self.directory = directory
+        self.check_interval = check_interval
+        self._templates: Dict[str, Template] = {}
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self._refresh()
+
+    def get(self, name: str) -> Template:
+        if time.monotonic() - self._last_check > self.check_interval:
+            self._refresh()
+        if name not in self._templates:
+            raise KeyError(f"Unknown template: {name}")
+        return self._templates[name]
+
+    def names(self) -> List[str]:
+        return sorted(self._templates)
+
+    def choose(self, names: List[str], key: str) -> Template:
+        """Pick one of several template variants, stable for a given key (e.g. a chat ID)."""
+        digest = hashlib.sha256(key.encode("utf-8")).digest()
+        return self.get(names[int.from_bytes(digest[:4], "big") % len(names)])
+
+    def _refresh(self) -> None:
+        with self._lock:
+            seen = set()
+            for root, _, files in os.walk(self.directory):
+                for file in files:
+                    if not file.endswith(".txt"):
+                        continue
+                    path = os.path.join(root, file)
+                    name = os.path.relpath(path, self.directory)[:-len(".txt")].replace(os.sep, "/")
+                    seen.add(name)
+                    mtime = os.stat(path).st_mtime
+                    current = self._templates.get(name)
+                    if current is None or current.mtime != mtime:
+                        self._templates[name] = self._load(name, path, mtime)
+                        if current is not None:
+                            logger.info(f"Reloaded template {self._templates[name].prompt_id}")
+            for name in set(self._templates) - seen:
+                del self._templates[name]
+            self._last_check = time.monotonic()
+
+    @staticmethod
+    def _load(name: str, path: str, mtime: float) -> Template:
+        with open(path, "r", encoding="utf-8") as f:
+            content = f.read()
+        version = hashlib.sha256(content.encode("utf-8")).hexdigest()[:12]
+        return Template(name=name, content=content, mtime=mtime, version=version)
@@ -0,0 +1,358 @@
+from typing import Any, Dict, Optional, Sequence, Tuple
+import json
+import logging
+import math
+import os
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from SpatialIndex import EARTH_RADIUS_METERS
+
+logger = logging.getLogger("azmaps-geo-assistant")
+
+VEHICLE_HINTS = ("vehicle", "device", "asset", "unit", "imei", "truck", "driver", "trip", "track")
+TIME_HINTS = ("time", "date", "timestamp")
+
+STOP_SPEED = 1.0  # m/s, slower segments count as stationary
+STOP_RADIUS = 100.0  # m, a reporting gap that moved less than this is a stop
+MIN_STOP_SECONDS = 300.0
+MAX_GAP_SECONDS = 1800.0  # longer gaps between points split a trip
+MAX_SPEED = 70.0  # m/s, faster segments are GPS jumps and are left out of the statistics
+HARD_ACCELERATION = 3.0  # m/s^2
+STOP_AREA_DEGREES = 0.002  # grid cell for grouping stops into areas, about 200 m
+INSIGHTS_FILE = "trajectories.json"
+
+_NAT = np.iinfo(np.int64).min
+
+
+def segment_distances(lon: np.ndarray, lat: np.ndarray) -> np.ndarray:
+    """Haversine distance in meters between consecutive points.
+
+    Coordinate differences are taken in float64 and the trigonometry runs in float32, which
+    keeps segments accurate to centimeters at a fraction of the cost.
+    """
+    a = np.subtract(lat[1:], lat[:-1], out=np.empty(len(lat) - 1, dtype=np.float32), casting="same_kind")
+    b = np.subtract(lon[1:], lon[:-1], out=np.empty(len(lon) - 1, dtype=np.float32), casting="same_kind")
+    cos_lat = np.multiply(lat, math.pi / 180, out=np.empty(len(lat), dtype=np.float32), casting="same_kind")
+    np.cos(cos_lat, out=cos_lat)
+    for half in (a, b):
+        half *= np.float32(math.pi / 360)
+        np.sin(half, out=half)
+        half *= half
+    b *= cos_lat[:-1]
+    b *= cos_lat[1:]
+    a += b
+    np.minimum(a, 1.0, out=a)
+    np.sqrt(a, out=a)
+    np.arcsin(a, out=a)
+    return np.multiply(a, 2 * EARTH_RADIUS_METERS, dtype=np.float64)
+
+
+def _zscores(values: np.ndarray) -> np.ndarray:
+    finite = np.isfinite(values)
+    if finite.sum() < 3 or values[finite].std() == 0:
+        return np.zeros_like(values)
+    return np.where(finite, (values - values[finite].mean()) / values[finite].std(), 0.0)
+
+
+def _tracks(lon: np.ndarray, lat: np.ndarray, times: np.ndarray, vehicle: np.ndarray) -> Tuple[np.ndarray, ...]:
+    """Points grouped by vehicle and ordered by time within each, with the time steps in ms and
+    the index where each vehicle's points start.
+
+    Input already in that order (the usual export layout) is used as is; a time-ordered feed of
+    interleaved vehicles only needs a stable sort by vehicle, anything else is sorted by time first.
+    """
+    steps = np.diff(times)
+    vehicle_starts = np.flatnonzero(vehicle[1:] != vehicle[:-1]) + 1
+    backwards = np.flatnonzero(steps < 0)
+    if (vehicle[vehicle_starts] > vehicle[vehicle_starts - 1]).all() and np.isin(backwards + 1, vehicle_starts).all():
+        return lon, lat, times, vehicle, steps, np.concatenate([[0], vehicle_starts])
+    order = np.argsort(times, kind="stable") if len(backwards) else None
+    key = vehicle if order is None else vehicle[order]
+    sorted_vehicle = None
+    if vehicle.max() < 65536:
+        # Stable sorts of 16-bit keys are radix sorts, several times faster than on wider integers
+        key = key.astype(np.uint16)
+        counts = np.bincount(key)
+        sorted_vehicle = np.repeat(np.flatnonzero(counts), counts[counts > 0]).astype(vehicle.dtype)
+    by_vehicle = np.argsort(key, kind="stable")
+    order = by_vehicle if order is None else order[by_vehicle]
+    lon, lat, times = lon[order], lat[order], times[order]
+    vehicle = vehicle[order] if sorted_vehicle is None else sorted_vehicle
+    return lon, lat, times, vehicle, np.diff(times), np.concatenate([[0], np.flatnonzero(vehicle[1:] != vehicle[:-1]) + 1])
+
+
+def analyze_trajectories(lon: np.ndarray, lat: np.ndarray, time_ms: np.ndarray, vehicle: Optional[np.ndarray] = None,
+                         vehicle_names: Optional[Sequence[Any]] = None, z_threshold: float = 2.0, top: int = 5) -> Dict[str, Any]:
+    """Movement statistics of vehicle tracks, computed with array operations only.
+
+    time_ms is milliseconds since the epoch (UTC). vehicle holds non-negative integer codes,
+    named by vehicle_names; without it all points are one vehicle. Points without a position or
+    a time are ignored. Returns the fleet totals, stops and frequent stop areas, hour-of-day
+    aggregates and vehicles whose metrics are z_threshold standard deviations from the fleet.
+    """
+    start = time.perf_counter()
+    lon, lat = np.asarray(lon, dtype=np.float64), np.asarray(lat, dtype=np.float64)
+    times = np.asarray(time_ms, dtype=np.int64)
+    vehicle = np.zeros(len(lon), dtype=np.int32) if vehicle is None else np.asarray(vehicle)
+    invalid = np.isnan(lon) | np.isnan(lat)
+    invalid |= times == _NAT
+    invalid |= vehicle < 0
+    if invalid.any():
+        valid = ~invalid
+        lon, lat, times, vehicle = lon[valid], lat[valid], times[valid], vehicle[valid]
+    if len(lon) < 2:
+        raise ValueError("At least two points with a position and a time are needed")
+    lon, lat, times, vehicle, steps, vehicle_starts = _tracks(lon, lat, times, vehicle)
+
+    # Segments join consecutive points; vehicles are contiguous ranges of points, and the segment
+    # from one vehicle's last point to the next vehicle's first is masked out everywhere
+    vehicle_ids = vehicle[vehicle_starts]
+    vehicles = len(vehicle_starts)
+    same = np.ones(len(steps), dtype=bool)
+    same[vehicle_starts[1:] - 1] = False
+    distance = segment_distances(lon, lat)
+    seconds = np.multiply(steps, 0.001)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        speed = distance / seconds
+    # Repeated timestamps have no speed; such segments only count as part of a stop
+    in_trip = seconds <= MAX_GAP_SECONDS
+    in_trip &= seconds > 0
+    in_trip &= same
+    jumps = speed > MAX_SPEED
+    jumps &= in_trip
+    moving = speed >= STOP_SPEED
+    moving &= in_trip
+    moving &= ~jumps
+    stationary = speed < STOP_SPEED
+    stationary &= in_trip
+    parked = (seconds > MAX_GAP_SECONDS) | (seconds == 0)
+    parked &= distance < STOP_RADIUS
+    parked &= same
+    stationary |= parked
+
+    # Stops: runs of stationary segments lasting at least MIN_STOP_SECONDS; a run never spans
+    # two vehicles, so its duration is the time between its first and last point
+    edges = np.flatnonzero(stationary[1:] != stationary[:-1]) + 1
+    edges = np.concatenate([[0] if stationary[0] else [], edges, [len(stationary)] if stationary[-1] else []]).astype(np.int64)
+    run_starts, run_ends = edges[::2], edges[1::2]
+    run_seconds = (times[run_ends] - times[run_starts]) * 0.001
+    is_stop = run_seconds >= MIN_STOP_SECONDS
+    stop_start, stop_seconds = run_starts[is_stop], run_seconds[is_stop]
+    stop_lon, stop_lat, stop_vehicle = lon[stop_start], lat[stop_start], vehicle[stop_start]
+
+    # Frequent stop areas: stops grouped on a grid
+    areas = []
+    if len(stop_start):
+        cell = (np.floor(stop_lat / STOP_AREA_DEGREES).astype(np.int64) * 1_000_000 +
+                np.floor(stop_lon / STOP_AREA_DEGREES).astype(np.int64))
+        cells, area, area_stops = np.unique(cell, return_inverse=True, return_counts=True)
+        visits = np.unique(np.stack([area.ravel(), stop_vehicle.astype(np.int64)]), axis=1)
+        area_vehicles = np.bincount(visits[0], minlength=len(cells))
+        area_seconds = np.bincount(area, weights=stop_seconds, minlength=len(cells))
+        area_lon = np.bincount(area, weights=stop_lon, minlength=len(cells)) / area_stops
+        area_lat = np.bincount(area, weights=stop_lat, minlength=len(cells)) / area_stops
+        for i in np.argsort(-area_stops, kind="stable")[:top]:
+            if area_stops[i] < 2:
+                break
+            areas.append({"lon": round(float(area_lon[i]), 5), "lat": round(float(area_lat[i]), 5), "stops": int(area_stops[i]),
+                          "vehicles": int(area_vehicles[i]), "dwellHours": round(float(area_seconds[i]) / 3600, 1)})
+
+    # Per vehicle, reduced over each vehicle's range of segments
+    ranges = np.minimum(vehicle_starts, len(steps) - 1)
+    # Hard acceleration or braking between consecutive moving segments
+    hard = np.zeros(len(steps), dtype=bool)
+    with np.errstate(invalid="ignore"):
+        change = np.diff(speed)
+        np.abs(change, out=change)
+        allowed = np.add(seconds[1:], seconds[:-1])
+        allowed *= HARD_ACCELERATION / 2
+        np.greater(change, allowed, out=hard[1:])
+    hard[1:] &= moving[1:]
+    hard[1:] &= moving[:-1]
+    vehicle_hard = np.bincount(np.searchsorted(vehicle_starts, np.flatnonzero(hard), side="right") - 1, minlength=vehicles)
+    with np.errstate(invalid="ignore"):
+        # Left out segments with no speed become nan, which fmax skips
+        np.multiply(speed, moving, out=speed)
+    vehicle_max = np.fmax.reduceat(speed, ranges)
+    np.multiply(seconds, in_trip, out=seconds)
+    vehicle_tracked = np.add.reduceat(seconds, ranges)
+    # From here on only moving segments count
+    np.multiply(seconds, moving, out=seconds)
+    np.multiply(distance, moving, out=distance)
+    vehicle_moving = np.add.reduceat(seconds, ranges)
+    vehicle_distance = np.add.reduceat(distance, ranges)
+    vehicle_stops = np.bincount(np.searchsorted(vehicle_starts, stop_start, side="right") - 1, minlength=vehicles)
+
+    # Hour of day (UTC): activity, moving speed and stops. Times run in order within each
+    # vehicle, so points fall into long runs of the same clock hour; sums are taken per run
+    # Half a millisecond keeps rounding from pushing a point on the hour into the hour before
+    hours = np.add(times, 0.5)
+    hours *= 1 / 3_600_000
+    np.floor(hours, out=hours)
+    hour_runs = np.concatenate([[0], np.flatnonzero(hours[1:] != hours[:-1]) + 1])
+    run_hour = (hours[hour_runs] % 24).astype(np.int64)
+    hourly_points = np.bincount(run_hour, weights=np.diff(hour_runs, append=len(hours)), minlength=24).astype(np.int64)
+    # A run made of the last point alone has no segments
+    segment_runs = hour_runs[hour_runs < len(steps)]
+    run_hour = run_hour[:len(segment_runs)]
+    hourly_distance = np.bincount(run_hour, weights=np.add.reduceat(distance, segment_runs), minlength=24)
+    hourly_seconds = np.bincount(run_hour, weights=np.add.reduceat(seconds, segment_runs), minlength=24)
+    hourly_stops = np.bincount((hours[stop_start] % 24).astype(np.int64), minlength=24)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        hourly_speed = np.where(hourly_seconds > 0, hourly_distance / hourly_seconds * 3.6, np.nan)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        metrics = {
+            "meanSpeedKmh": np.where(vehicle_moving > 0, vehicle_distance / vehicle_moving * 3.6, np.nan),
+            "maxSpeedKmh": vehicle_max * 3.6,
+            "hardAccelerationsPerHour": np.where(vehicle_moving > 0, vehicle_hard / (vehicle_moving / 3600), np.nan),
+            "stopsPerDay": np.where(vehicle_tracked > 0, vehicle_stops / (vehicle_tracked / 86400), np.nan)
+        }
+
+    anomalies = []
+    if vehicles >= 3:
+        for metric, values in metrics.items():
+            scores = _zscores(values)
+            for i in np.flatnonzero(np.abs(scores) >= z_threshold):
+                code = int(vehicle_ids[i])
+                anomalies.append({"vehicle": vehicle_names[code] if vehicle_names is not None else code, "metric": metric,
+                                  "value": round(float(values[i]), 2), "fleetMean": round(float(np.nanmean(values)), 2),
+                                  "zscore": round(float(scores[i]), 1)})
+        anomalies.sort(key=lambda anomaly: -abs(anomaly["zscore"]))
+
+    timed = np.flatnonzero(~np.isnan(hourly_speed))
+    return {
+        "points": int(len(lon)),
+        "vehicles": vehicles,
+        "timeRange": [str(np.datetime64(int(times.min()), "ms")) + "Z", str(np.datetime64(int(times.max()), "ms")) + "Z"],
+        "distanceKm": round(float(vehicle_distance.sum()) / 1000, 1),
+        "movingHours": round(float(vehicle_moving.sum()) / 3600, 1),
+        "gpsJumps": int(jumps.sum()),
+        "stops": {
+            "count": int(len(stop_start)),
+            "totalHours": round(float(stop_seconds.sum()) / 3600, 1),
+            "medianMinutes": round(float(np.median(stop_seconds)) / 60, 1) if len(stop_start) else None
+        },
+        "frequentStopAreas": areas,
+        "hourly": [{"hour": h, "points": int(hourly_points[h]),
+                    "meanSpeedKmh": None if np.isnan(hourly_speed[h]) else round(float(hourly_speed[h]), 1),
+                    "stops": int(hourly_stops[h])} for h in range(24)],
+        "busiestHours": [int(h) for h in np.argsort(-hourly_points, kind="stable")[:3] if hourly_points[h]],
+        "slowestHour": int(timed[np.argmin(hourly_speed[timed])]) if len(timed) else None,
+        "fastestHour": int(timed[np.argmax(hourly_speed[timed])]) if len(timed) else None,
+        "anomalies": anomalies[:top * 2],
+        "analysisSeconds": round(time.perf_counter() - start, 3)
+    }
+
+
+def _find_column(dataset: Any, types: Sequence[str], hints: Sequence[str]) -> Optional[str]:
+    names = [name for name in dataset.column_names if dataset.column_type(name) in types]
+    for hint in hints:
+        for name in names:
+            if hint in name.lower():
+                return name
+    return None
+
+
+def _epoch_ms(values: np.ndarray) -> Optional[np.ndarray]:
+    """Numeric epoch times in seconds or milliseconds as milliseconds, None when they are neither."""
+    finite = values[np.isfinite(values)] if values.dtype.kind == "f" else values
+    if not len(finite):
+        return None
+    median = float(np.median(finite[:100_000]))
+    scale = 1000 if 1e9 <= median < 1e11 else 1 if 1e12 <= median < 1e14 else None
+    if scale is None:
+        return None
+    result = np.full(len(values), np.iinfo(np.int64).min, dtype=np.int64)
+    ok = np.isfinite(values) if values.dtype.kind == "f" else np.ones(len(values), dtype=bool)
+    result[ok] = (values[ok] * scale).astype(np.int64)
+    return result
+
+
+def _analyze_dataset(dataset: Any) -> Optional[Dict[str, Any]]:
+    schema = dataset.schema
+    if schema["features"] < 3 or schema["geometryTypes"].get("Point", 0) < 0.9 * schema["features"]:
+        return None
+    time_column = _find_column(dataset, ("datetime",), TIME_HINTS) or _find_column(dataset, ("datetime",), ("",))
+    if time_column is not None:
+        time_ms = np.asarray(dataset.column(time_column)).view(np.int64)
+    else:
+        time_column = _find_column(dataset, ("integer", "number"), TIME_HINTS)
+        time_ms = _epoch_ms(np.asarray(dataset.column(time_column))) if time_column else None
+    if time_ms is None:
+        return None
+
+    vehicle_column = _find_column(dataset, ("string", "integer"), VEHICLE_HINTS)
+    vehicle, names = None, None
+    if vehicle_column is not None:
+        vehicle = np.asarray(dataset.column(vehicle_column))
+        if dataset.column_type(vehicle_column) == "string":
+            names = dataset.categories(vehicle_column)
+        else:
+            # Integer IDs can be anything, factorize them into small codes
+            vehicle, uniques = pd.factorize(vehicle)
+            names = uniques.tolist()
+    lon, lat = dataset.feature_points()
+    try:
+        insights = analyze_trajectories(lon, lat, time_ms, vehicle, names)
+    except ValueError:
+        return None
+    insights.update({"timeField": time_column, "vehicleField": vehicle_column})
+    return insights
+
+
+def trajectory_insights(dataset: Any) -> Optional[Dict[str, Any]]:
+    """Analyze a columnar point dataset with a time column as vehicle tracks; None when it is not one.
+
+    The time column is the first datetime column (or a numeric epoch column named like a
+    time); the vehicle column is a string or integer column named like a vehicle or device.
+    The result is saved beside the columns and read from there on later calls.
+    """
+    path = os.path.join(dataset.directory, INSIGHTS_FILE)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        pass
+    insights = _analyze_dataset(dataset)
+    if insights is not None:
+        logger.info(f"Analyzed {insights['points']} track points of {insights['vehicles']} vehicles in "
+                    f"{dataset.directory} in {insights['analysisSeconds']:.2f}s")
+    temp_path = os.path.join(dataset.directory, f".{uuid.uuid4().hex}.tmp.json")
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(insights, f)
+    os.replace(temp_path, path)
+    return insights
+
+
+def format_insights(insights: Dict[str, Any]) -> str:
+    """Render trajectory insights as the compact text block used in the prompt."""
+    lines = [f"Tracks: {insights['points']:,} points, {insights['vehicles']:,} vehicles"
+             + (f" (by {insights['vehicleField']})" if insights["vehicleField"] else "")
+             + f", time field {insights['timeField']}, {insights['timeRange'][0]} to {insights['timeRange'][1]}",
+             f"Moving: {insights['distanceKm']:,} km in {insights['movingHours']:,} h (speeds computed from positions; "
+             f"{insights['gpsJumps']:,} GPS jumps ignored)"]
+    stops = insights["stops"]
+    lines.append(f"Stops (>= {MIN_STOP_SECONDS / 60:.0f} min): {stops['count']:,}, {stops['totalHours']:,} h in total"
+                 + (f", median {stops['medianMinutes']} min" if stops["medianMinutes"] is not None else ""))
+    if insights["frequentStopAreas"]:
+        lines.append("Frequent stop areas [lon, lat]: " + "; ".join(
+            f"[{area['lon']}, {area['lat']}] {area['stops']} stops by {area['vehicles']} vehicles, {area['dwellHours']} h"
+            for area in insights["frequentStopAreas"]))
+    hourly = [entry for entry in insights["hourly"] if entry["points"]]
+    if hourly:
+        lines.append("By hour of day (UTC), points / mean moving speed km/h / stops: " + ", ".join(
+            f"{entry['hour']:02d}h {entry['points']:,}/{entry['meanSpeedKmh'] if entry['meanSpeedKmh'] is not None else '-'}/{entry['stops']}"
+            for entry in hourly))
+        lines.append(f"Busiest hours: {', '.join(f'{h:02d}h' for h in insights['busiestHours'])}"
+                     + (f"; slowest {insights['slowestHour']:02d}h, fastest {insights['fastestHour']:02d}h"
+                        if insights["slowestHour"] is not None else ""))
+    if insights["anomalies"]:
+        lines.append("Unusual vehicles (z-score vs fleet): " + "; ".join(
+            f"{anomaly['vehicle']} {anomaly['metric']} {anomaly['value']} (fleet {anomaly['fleetMean']}, z {anomaly['zscore']})"
+            for anomaly in insights["anomalies"]))
+    return "\n".join(lines)
@@ -0,0 +1,394 @@
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import json
+import logging
+import math
+import threading
+
+import numpy as np
+
+from ColumnarStore import ColumnarDataset, GEOMETRY_TYPES
+
+logger = logging.getLogger("azmaps-geo-assistant")
+
+TILE_SIZE = 256
+MAX_ZOOM = 24
+MAX_LATITUDE = 85.05112878
+# Simplification keeps the shape of lines and polygons this far outside a tile, so the pieces
+# clipped to neighbouring tiles line up at the edge
+TILE_BUFFER_PIXELS = 16
+_POINT = GEOMETRY_TYPES.index("Point")
+
+
+def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """(west, south, east, north) of an XYZ Web Mercator tile, in degrees."""
+    n = 2 ** z
+    west, east = x / n * 360.0 - 180.0, (x + 1) / n * 360.0 - 180.0
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return west, south, east, north
+
+
+def mercator(lon: np.ndarray, lat: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Project degrees to Web Mercator world coordinates in [0, 1], y growing southwards."""
+    lat = np.radians(np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE))
+    return (np.asarray(lon) + 180.0) / 360.0, (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / np.pi) / 2.0
+
+
+def inverse_mercator(mx: np.ndarray, my: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Web Mercator world coordinates back to degrees."""
+    return np.asarray(mx) * 360.0 - 180.0, np.degrees(np.arctan(np.sinh(np.pi * (1.0 - 2.0 * np.asarray(my)))))
+
+
+def _clip_line(mx: np.ndarray, my: np.ndarray, box: Tuple[float, float, float, float]) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """Liang-Barsky over every segment at once: the pieces of a polyline inside box (x0, y0, x1, y1)."""
+    x0, y0, x1, y1 = box
+    ax, ay, dx, dy = mx[:-1], my[:-1], np.diff(mx), np.diff(my)
+    t0, t1 = np.zeros(len(dx)), np.ones(len(dx))
+    for p, q in ((-dx, ax - x0), (dx, x1 - ax), (-dy, ay - y0), (dy, y1 - ay)):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            r = q / p
+        t0 = np.where(p < 0, np.maximum(t0, r), t0)
+        t1 = np.where(p > 0, np.minimum(t1, r), t1)
+        # Parallel to this edge and on its outer side
+        t1[(p == 0) & (q < 0)] = -1.0
+    visible = np.flatnonzero(t0 <= t1)
+    if not len(visible):
+        return []
+    # A piece starts where the line enters the box or after a segment that left it
+    starts = np.ones(len(visible), dtype=bool)
+    starts[1:] = (visible[1:] != visible[:-1] + 1) | (t1[visible[:-1]] < 1) | (t0[visible[1:]] > 0)
+    sx, sy = ax[visible] + t0[visible] * dx[visible], ay[visible] + t0[visible] * dy[visible]
+    ex, ey = ax[visible] + t1[visible] * dx[visible], ay[visible] + t1[visible] * dy[visible]
+    first = np.flatnonzero(starts)
+    pieces = []
+    for start, stop in zip(first.tolist(), np.append(first[1:], len(visible)).tolist()):
+        px, py = np.append(sx[start], ex[start:stop]), np.append(sy[start], ey[start:stop])
+        if np.ptp(px) > 0 or np.ptp(py) > 0:
+            pieces.append((px, py))
+    return pieces
+
+
+def _clip_ring(mx: np.ndarray, my: np.ndarray, box: Tuple[float, float, float, float]) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """Sutherland-Hodgman: a closed ring clipped to box (x0, y0, x1, y1), None when nothing is left.
+
+    Concave rings can come back with sides along the box edge, which fill correctly.
+    """
+    x, y = mx[:-1], my[:-1]
+    for axis, bound, lower in ((0, box[0], True), (0, box[2], False), (1, box[1], True), (1, box[3], False)):
+        if len(x) < 3:
+            return None
+        c = x if axis == 0 else y
+        inside = c >= bound if lower else c <= bound
+        if inside.all():
+            continue
+        nx, ny, next_inside = np.roll(x, -1), np.roll(y, -1), np.roll(inside, -1)
+        nc = nx if axis == 0 else ny
+        # Only the crossing points of edges with one end on each side are used
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t = (bound - c) / (nc - c)
+            if axis == 0:
+                ix, iy = np.full(len(x), bound), y + t * (ny - y)
+            else:
+                ix, iy = x + t * (nx - x), np.full(len(x), bound)
+        # Each edge adds its crossing point, if any, then its end vertex when that is inside
+        emit = np.column_stack([inside != next_inside, next_inside]).ravel()
+        x, y = np.column_stack([ix, nx]).ravel()[emit], np.column_stack([iy, ny]).ravel()[emit]
+    if len(x) < 3:
+        return None
+    return np.append(x, x[0]), np.append(y, y[0])
+
+
+def clip_geometry(geometry: Optional[Dict[str, Any]], box: Tuple[float, float, float, float]) -> Optional[Dict[str, Any]]:
+    """Clip a GeoJSON geometry to a box in Web Mercator world coordinates, None when nothing is left.
+
+    Parts entirely inside the box are returned unchanged.
+    """
+    if geometry is None:
+        return None
+    x0, y0, x1, y1 = box
+
+    def project(coordinates):
+        array = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+        mx, my = mercator(array[:, 0], array[:, 1])
+        return mx, my, bool(((mx >= x0) & (mx <= x1) & (my >= y0) & (my <= y1)).all())
+
+    def degrees(mx, my):
+        return np.column_stack(inverse_mercator(mx, my)).tolist()
+
+    def lines(coordinates):
+        mx, my, inside = project(coordinates)
+        return [coordinates] if inside else [degrees(px, py) for px, py in _clip_line(mx, my, box)]
+
+    def polygon(rings):
+        result = []
+        for i, ring in enumerate(rings):
+            mx, my, inside = project(ring)
+            clipped = None if inside else _clip_ring(mx, my, box)
+            if inside or clipped is not None:
+                result.append(ring if inside else degrees(*clipped))
+            elif i == 0:
+                return None
+        return result
+
+    geometry_type, coordinates = geometry["type"], geometry.get("coordinates")
+    if geometry_type in ("Point", "MultiPoint"):
+        points = [point for point in ([coordinates] if geometry_type == "Point" else coordinates) if project(point)[2]]
+        if not points:
+            return None
+        return {"type": geometry_type, "coordinates": points[0] if geometry_type == "Point" else points}
+    if geometry_type in ("LineString", "MultiLineString"):
+        pieces = [piece for line in ([coordinates] if geometry_type == "LineString" else coordinates) for piece in lines(line)]
+        if not pieces:
+            return None
+        if len(pieces) == 1:
+            return {"type": "LineString", "coordinates": pieces[0]}
+        return {"type": "MultiLineString", "coordinates": pieces}
+    if geometry_type in ("Polygon", "MultiPolygon"):
+        polygons = [rings for rings in map(polygon, [coordinates] if geometry_type == "Polygon" else coordinates) if rings]
+        if not polygons:
+            return None
+        return {"type": geometry_type, "coordinates": polygons[0] if geometry_type == "Polygon" else polygons}
+    if geometry_type == "GeometryCollection":
+        children = [child for child in (clip_geometry(child, box) for child in geometry["geometries"]) if child]
+        return {"type": "GeometryCollection", "geometries": children} if children else None
+    return None
+
+
+def simplify_mask(x: np.ndarray, y: np.ndarray, part_offsets: np.ndarray, tolerance: float) -> np.ndarray:
+    """Douglas-Peucker over every part at once: a mask of the vertices to keep.
+
+    Instead of recursing per line, each pass measures all interior vertices of all open segments
+    against their segment and splits every segment whose farthest vertex exceeds the tolerance,
+    so the Python loop runs once per recursion level, not once per segment.
+    """
+    keep = np.zeros(len(x), dtype=bool)
+    starts, ends = part_offsets[:-1], part_offsets[1:] - 1
+    non_empty = ends >= starts
+    keep[starts[non_empty]] = True
+    keep[ends[non_empty]] = True
+    open_segments = ends - starts >= 2
+    seg_start, seg_end = starts[open_segments], ends[open_segments]
+    while len(seg_start):
+        interior = seg_end - seg_start - 1
+        first = np.cumsum(interior) - interior
+        segment = np.repeat(np.arange(len(seg_start)), interior)
+        index = np.arange(interior.sum()) - first[segment] + seg_start[segment] + 1
+        ax, ay = x[seg_start][segment], y[seg_start][segment]
+        dx, dy = x[seg_end][segment] - ax, y[seg_end][segment] - ay
+        px, py = x[index] - ax, y[index] - ay
+        length = np.hypot(dx, dy)
+        # Distance to the segment's line, or to its start for closed rings where start == end
+        distance = np.where(length > 0, np.abs(px * dy - py * dx) / np.where(length > 0, length, 1), np.hypot(px, py))
+        farthest = np.maximum.reduceat(distance, first)
+        is_farthest = np.flatnonzero(distance == farthest[segment])
+        _, first_farthest = np.unique(segment[is_farthest], return_index=True)
+        split = index[is_farthest[first_farthest]]
+        over = farthest > tolerance
+        keep[split[over]] = True
+        seg_start = np.concatenate([seg_start[over], split[over]])
+        seg_end = np.concatenate([split[over], seg_end[over]])
+        still_open = seg_end - seg_start >= 2
+        seg_start, seg_end = seg_start[still_open], seg_end[still_open]
+    return keep
+
+
+def cluster_labels(px: np.ndarray, py: np.ndarray, cell: float, method: str = "grid") -> np.ndarray:
+    """Cluster ID of each point for square grid cells or pointy-top hexagons of size cell."""
+    if method == "hex":
+        size = cell / math.sqrt(3)
+        q = (math.sqrt(3) / 3 * px - py / 3) / size
+        r = (2 / 3 * py) / size
+        # Round fractional axial coordinates to the nearest hexagon through cube coordinates
+        cx, cz = q, r
+        cy = -cx - cz
+        rx, ry, rz = np.round(cx), np.round(cy), np.round(cz)
+        fix_x = (np.abs(rx - cx) > np.abs(ry - cy)) & (np.abs(rx - cx) > np.abs(rz - cz))
+        fix_z = ~fix_x & (np.abs(ry - cy) <= np.abs(rz - cz))
+        rx = np.where(fix_x, -ry - rz, rx)
+        rz = np.where(fix_z, -rx - ry, rz)
+        column, row = rx.astype(np.int64), rz.astype(np.int64)
+    elif method == "grid":
+        column, row = np.floor(px / cell).astype(np.int64), np.floor(py / cell).astype(np.int64)
+    else:
+        raise ValueError(f"Unknown clustering method {method}")
+    # Offset so keys stay non-negative for the points just outside the tile edges
+    return (row + 1024) * 4096 + (column + 1024)
+
+
+class _DatasetTiler:
+    """Per-dataset arrays used by every tile: the spatial index for points and shape bounding boxes."""
+
+    def __init__(self, dataset: ColumnarDataset):
+        self.dataset = dataset
+        self.index = dataset.spatial_index()
+        geometry_types = self.geometry_types = np.asarray(dataset.geometry_types)
+        is_point = geometry_types == _POINT
+        self.shape_rows = np.flatnonzero(~is_point & (geometry_types > 0))
+        self.shape_bbox = np.empty((0, 4))
+        if len(self.shape_rows):
+            vertex_offsets = np.asarray(dataset.part_offsets)[np.asarray(dataset.feature_offsets)]
+            self.shape_rows = self.shape_rows[vertex_offsets[self.shape_rows + 1] > vertex_offsets[self.shape_rows]]
+            # Reduce over the vertex range of every feature; the NaN sentinel keeps the last start index valid
+            starts = vertex_offsets[:-1]
+            x, y = np.append(dataset.x, np.nan), np.append(dataset.y, np.nan)
+            self.shape_bbox = np.column_stack([
+                reduce.reduceat(values, starts)[self.shape_rows]
+                for values, reduce in ((x, np.fmin), (y, np.fmin), (x, np.fmax), (y, np.fmax))
+            ])
+
+    def tile(self, z: int, x: int, y: int, method: str, max_points: int, cluster_pixels: float,
+             simplify_pixels: float) -> Dict[str, Any]:
+        west, south, east, north = tile_bounds(z, x, y)
+        features = []
+
+        # Points: half-open bounds so a point on a tile edge is only in one tile
+        rows, point_x, point_y = self.index.bbox(west, south, east, north)
+        in_tile = (self.geometry_types[rows] == _POINT) & (point_x < east) & (point_y > south)
+        rows, point_x, point_y = rows[in_tile], point_x[in_tile], point_y[in_tile]
+        if len(rows) <= max_points:
+            for row, geometry, properties in zip(rows.tolist(), self.dataset.geometries(rows), self.dataset.records(rows)):
+                features.append({"type": "Feature", "id": row, "geometry": geometry, "properties": properties})
+        else:
+            lon, lat = point_x, point_y
+            mx, my = mercator(lon, lat)
+            scale = TILE_SIZE * 2 ** z
+            labels = cluster_labels(mx * scale - x * TILE_SIZE, my * scale - y * TILE_SIZE, cluster_pixels, method)
+            _, cluster, counts = np.unique(labels, return_inverse=True, return_counts=True)
+            centre_lon = np.bincount(cluster, weights=lon) / counts
+            centre_lat = np.bincount(cluster, weights=lat) / counts
+            for lon_value, lat_value, count in zip(centre_lon.tolist(), centre_lat.tolist(), counts.tolist()):
+                features.append({"type": "Feature", "geometry": {"type": "Point", "coordinates": [lon_value, lat_value]},
+                                 "properties": {"cluster": True, "point_count": count}})
+
+        # Lines and polygons: features whose bounding box touches the tile, simplified for this zoom
+        # and clipped to the tile, so a shape crossing several tiles comes back as one piece per tile
+        if len(self.shape_rows):
+            bbox = self.shape_bbox
+            touches = np.flatnonzero((bbox[:, 0] <= east) & (bbox[:, 2] >= west) & (bbox[:, 1] <= north) & (bbox[:, 3] >= south))
+            tolerance = simplify_pixels / (TILE_SIZE * 2 ** z)
+            if len(touches) > max_points:
+                # Skip shapes smaller than the tolerance, they would not be visible at this zoom
+                (mx0, my0), (mx1, my1) = mercator(bbox[touches, 0], bbox[touches, 3]), mercator(bbox[touches, 2], bbox[touches, 1])
+                touches = touches[np.maximum(mx1 - mx0, my1 - my0) >= tolerance]
+            rows = self.shape_rows[touches]
+            if len(rows):
+                keep = self._simplify(rows, tolerance, z, x, y)
+                n = 2 ** z
+                box = (x / n, y / n, (x + 1) / n, (y + 1) / n)
+                for row, geometry, properties in zip(rows.tolist(), self.dataset.geometries(rows, keep),
+                                                     self.dataset.records(rows)):
+                    geometry = clip_geometry(geometry, box)
+                    if geometry is not None:
+                        features.append({"type": "Feature", "id": row, "geometry": geometry, "properties": properties})
+        return {"type": "FeatureCollection", "features": features}
+
+    def _simplify(self, rows: np.ndarray, tolerance: float, z: int, x: int, y: int) -> np.ndarray:
+        """Vertex keep mask over the whole dataset, computed for the parts of the given rows only.
+
+        Before Douglas-Peucker, runs of vertices that stay beyond one edge of the buffered tile are
+        reduced to their first and last vertex: the path between them and the chord replacing it
+        both stay outside the tile. Every vertex in the same tolerance-sized cell as the one before
+        it is dropped too, so the work per tile depends on what is visible in it.
+        """
+        feature_offsets = np.asarray(self.dataset.feature_offsets)
+        part_offsets = np.asarray(self.dataset.part_offsets)
+        keep = np.zeros(self.dataset.schema["vertices"], dtype=bool)
+        part_counts = feature_offsets[rows + 1] - feature_offsets[rows]
+        parts = np.repeat(feature_offsets[rows] - np.cumsum(part_counts) + part_counts, part_counts) + np.arange(part_counts.sum())
+        sizes = part_offsets[parts + 1] - part_offsets[parts]
+        vertices = np.repeat(part_offsets[parts] - np.cumsum(sizes) + sizes, sizes) + np.arange(sizes.sum())
+        mx, my = mercator(np.asarray(self.dataset.x)[vertices], np.asarray(self.dataset.y)[vertices])
+        part = np.repeat(np.arange(len(sizes)), sizes)
+        is_end = np.zeros(len(vertices), dtype=bool)
+        is_end[np.cumsum(sizes)[sizes > 0] - 1] = True
+        is_end[(np.cumsum(sizes) - sizes)[sizes > 0]] = True
+
+        n = 2 ** z
+        margin = TILE_BUFFER_PIXELS / (TILE_SIZE * n)
+        outside = (mx < x / n - margin, mx > (x + 1) / n + margin, my < y / n - margin, my > (y + 1) / n + margin)
+        index = np.arange(len(vertices))
+        # One edge at a time, each on the vertices left by the previous ones
+        for beyond in outside:
+            if len(index) < 3:
+                break
+            beyond, index_part = beyond[index], part[index]
+            interior = beyond & ~is_end[index]
+            interior[[0, -1]] = False
+            interior[1:-1] &= beyond[:-2] & beyond[2:] & (index_part[1:-1] == index_part[:-2]) & (index_part[1:-1] == index_part[2:])
+            index = index[~interior]
+        cell_x, cell_y = np.floor(mx[index] / tolerance), np.floor(my[index] / tolerance)
+        repeated = np.zeros(len(index), dtype=bool)
+        repeated[1:] = (cell_x[1:] == cell_x[:-1]) & (cell_y[1:] == cell_y[:-1]) & (part[index][1:] == part[index][:-1])
+        index = index[~repeated | is_end[index]]
+
+        local_offsets = np.zeros(len(sizes) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(part[index], minlength=len(sizes)), out=local_offsets[1:])
+        keep[vertices[index[simplify_mask(mx[index], my[index], local_offsets, tolerance)]]] = True
+        return keep
+
+
+class TileServer:
+    """GeoJSON tiles of uploaded datasets at /api/datasets/{datasetId}/tiles/{z}/{x}/{y}.json.
+
+    A tile holds the dataset's points as they are when at most max_points fall in it, otherwise
+    grid or hex clusters of cluster_pixels with a point_count. Lines and polygons touching the
+    tile are simplified to simplify_pixels at the tile's zoom and clipped to the tile. The size of a tile depends on the
+    viewport, not on the dataset. Encoded tiles are kept in an LRU cache.
+    """
+
+    def __init__(self, max_tiles: int = 2048, max_datasets: int = 16, max_points: int = 1000,
+                 cluster_pixels: float = 40.0, simplify_pixels: float = 1.0):
+        self.max_tiles = max_tiles
+        self.max_datasets = max_datasets
+        self.max_points = max_points
+        self.cluster_pixels = cluster_pixels
+        self.simplify_pixels = simplify_pixels
+        self._tiles: "OrderedDict[Tuple[str, int, int, int, str], bytes]" = OrderedDict()
+        self._tilers: "OrderedDict[str, _DatasetTiler]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def cached(self, dataset_id: str, z: int, x: int, y: int, method: str = "grid") -> bytes:
+        """Return a tile from the cache, or None."""
+        key = (dataset_id, z, x, y, method)
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is not None:
+                self._tiles.move_to_end(key)
+                self.stats["hits"] += 1
+            return tile
+
+    def tile(self, dataset_id: str, dataset: ColumnarDataset, z: int, x: int, y: int, method: str = "grid") -> bytes:
+        """Build (or fetch from the cache) one tile as GeoJSON bytes. Blocking, run it off the event loop.
+
+        Raises ValueError for tile coordinates outside the zoom level or an unknown method.
+        """
+        if not 0 <= z <= MAX_ZOOM or not 0 <= x < 2 ** z or not 0 <= y < 2 ** z:
+            raise ValueError(f"Tile {z}/{x}/{y} does not exist")
+        if method not in ("grid", "hex"):
+            raise ValueError(f"Unknown clustering method {method}")
+        tile = self.cached(dataset_id, z, x, y, method)
+        if tile is not None:
+            return tile
+
+        with self._lock:
+            tiler = self._tilers.get(dataset_id)
+            if tiler is not None:
+                self._tilers.move_to_end(dataset_id)
+        if tiler is None:
+            tiler = _DatasetTiler(dataset)
+            with self._lock:
+                self._tilers[dataset_id] = tiler
+                if len(self._tilers) > self.max_datasets:
+                    self._tilers.popitem(last=False)
+
+        tile = json.dumps(tiler.tile(z, x, y, method, self.max_points, self.cluster_pixels, self.simplify_pixels),
+                          separators=(",", ":")).encode("utf-8")
+        with self._lock:
+            self.stats["misses"] += 1
+            self._tiles[(dataset_id, z, x, y, method)] = tile
+            if len(self._tiles) > self.max_tiles:
+                self._tiles.popitem(last=False)
+                self.stats["evictions"] += 1
+        return tile
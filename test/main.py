@@ -1,9 +1,15 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
 from ChatAssistant import ChatAssistant, ChatMessage
-import os
+import os, json
+
+try:
+    # Request.form() needs python-multipart to parse multipart uploads
+    import multipart
+except ImportError:
+    multipart = None
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -11,6 +17,8 @@ load_dotenv()
 # Initialize FastAPI app and ChatAssistant
 app = FastAPI()
 assistant = ChatAssistant()
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+QUERY_MAX_RESULTS = int(os.getenv("QUERY_MAX_RESULTS", "10000"))
 
 # Configure CORS
 app.add_middleware(
@@ -21,6 +29,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("shutdown")
+async def shutdown():
+    await assistant.aclose()
+
 @app.post("/api/chat")
 async def chat(request: ChatMessage):
     try:
@@ -32,6 +44,140 @@ async def chat(request: ChatMessage):
         assistant.logger.error(f"Failed to process chat message: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/chat/stream")
+async def chat_stream(request: ChatMessage):
+    """Stream the chat response as newline-delimited JSON events."""
+    try:
+        events = await assistant.process_message_stream(request)
+    except ValueError as e:
+        assistant.logger.error(f"Failed to process chat message: {str(e)}")
+        raise HTTPException(status_code=404, detail=str(e))
+
+    async def ndjson_events():
+        try:
+            async for event in events:
+                yield json.dumps(event) + "\n"
+        except Exception as e:
+            assistant.logger.error(f"Failed to stream chat message: {str(e)}")
+            yield json.dumps({"type": "error", "detail": str(e)}) + "\n"
+
+    return StreamingResponse(ndjson_events(), media_type="application/x-ndjson")
+
+@app.post("/api/datasets")
+async def upload_dataset(request: Request, fileName: str = ""):
+    """Store an uploaded data file once and return its content-hashed dataset ID.
+
+    The body is either the raw file (name in the fileName query parameter), streamed straight
+    to disk, or a multipart form with a single "file" field. Multipart forms are refused with
+    415 when python-multipart is not installed.
+    """
+    try:
+        if request.headers.get("content-type", "").startswith("multipart/form-data"):
+            if multipart is None:
+                raise HTTPException(status_code=415, detail="Multipart uploads need python-multipart on the server, "
+                                                            "send the raw file with a fileName query parameter instead")
+            form = await request.form()
+            upload = form.get("file")
+            if upload is None or not hasattr(upload, "read"):
+                raise ValueError("Multipart upload needs a file field")
+
+            async def chunks():
+                while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+                    yield chunk
+
+            try:
+                dataset = await assistant.datasets.save_stream(upload.filename or fileName, chunks())
+            finally:
+                await form.close()
+        else:
+            dataset = await assistant.datasets.save_stream(fileName, request.stream())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    assistant.prepare_dataset(dataset["datasetId"])
+    return {key: dataset[key] for key in ("datasetId", "fileName", "bytes", "deduplicated")}
+
+@app.get("/api/datasets/{dataset_id}")
+async def dataset_info(dataset_id: str):
+    """Metadata and column schema of an uploaded dataset, read from its columnar copy"""
+    try:
+        columns = await assistant.dataset_columns(dataset_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    dataset = assistant.datasets.get(dataset_id)
+    return {
+        "datasetId": dataset_id,
+        "fileName": dataset["fileName"],
+        "bytes": dataset["bytes"],
+        **{key: columns.schema[key] for key in ("format", "features", "vertices", "bbox", "geometryTypes")},
+        "columns": [{"name": column["name"], "type": column["type"]} for column in columns.schema["columns"]]
+    }
+
+@app.get("/api/datasets/{dataset_id}/tiles/{z}/{x}/{y}.json")
+async def dataset_tile(dataset_id: str, z: int, x: int, y: int, cluster: str = "grid"):
+    """One GeoJSON tile of a dataset: points or point clusters, and simplified lines and polygons"""
+    try:
+        tile = await assistant.dataset_tile(dataset_id, z, x, y, cluster)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return Response(content=tile, media_type="application/geo+json", headers={"Cache-Control": "public, max-age=86400"})
+
+async def _query_dataset(dataset_id: str, query: str, limit: int, **params):
+    try:
+        return await assistant.query_dataset(dataset_id, query, min(limit, QUERY_MAX_RESULTS), **params)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.get("/api/datasets/{dataset_id}/bbox")
+async def dataset_bbox(dataset_id: str, west: float = Query(ge=-180, le=180), south: float = Query(ge=-90, le=90),
+                       east: float = Query(ge=-180, le=180), north: float = Query(ge=-90, le=90),
+                       limit: int = Query(1000, ge=1)):
+    """Features whose position is inside a bounding box; west > east crosses the antimeridian"""
+    return await _query_dataset(dataset_id, "bbox", limit, west=west, south=south, east=east, north=north)
+
+@app.get("/api/datasets/{dataset_id}/radius")
+async def dataset_radius(dataset_id: str, lon: float = Query(ge=-180, le=180), lat: float = Query(ge=-90, le=90),
+                         meters: float = Query(gt=0), limit: int = Query(1000, ge=1)):
+    """Features within a distance of a point, nearest first, each with its distance in meters"""
+    return await _query_dataset(dataset_id, "radius", limit, lon=lon, lat=lat, meters=meters)
+
+@app.get("/api/datasets/{dataset_id}/nearest")
+async def dataset_nearest(dataset_id: str, lon: float = Query(ge=-180, le=180), lat: float = Query(ge=-90, le=90),
+                          k: int = Query(10, ge=1)):
+    """The k features nearest to a point, each with its distance in meters"""
+    k = min(k, QUERY_MAX_RESULTS)
+    return await _query_dataset(dataset_id, "nearest", k, lon=lon, lat=lat, k=k)
+
+@app.get("/api/datasets/{dataset_id}/trajectories")
+async def dataset_trajectories(dataset_id: str):
+    """Vehicle track insights: stops, frequent stop areas, hour-of-day aggregates and unusual vehicles"""
+    try:
+        insights = await assistant.dataset_trajectories(dataset_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    if insights is None:
+        raise HTTPException(status_code=404, detail="Dataset has no time column to build vehicle tracks from")
+    return insights
+
+@app.get("/api/metrics/history")
+async def history_metrics():
+    """Prompt size statistics from history compaction"""
+    return assistant.history_manager.stats
+
+@app.get("/api/metrics/cache")
+async def cache_metrics():
+    """Completion cache hit/miss counters"""
+    return assistant.completion_cache.stats if assistant.completion_cache else {}
+
+@app.get("/api/metrics/search")
+async def search_metrics():
+    """Local search query counts and latencies"""
+    return assistant.local_search.stats if assistant.local_search else {}
+
+@app.get("/api/metrics/tiles")
+async def tile_metrics():
+    """Tile cache hit/miss counters"""
+    return assistant.tiles.stats
+
 @app.get("/data")
 async def list_data_files():
     """List all files in the data directory"""
@@ -1,45 +1,78 @@
 class AzureMapsAgent {
     constructor() {
         this.isFirstMessage = true;
+        this.chatId = null;
     }
 
-    async chat(userInput, fileContents = null, fileNames = null, useAiSearch = false) {
-        const response = await fetch('/api/chat', {
+    async chatStream(userInput, datasetIds = null, useAiSearch = false, onEvent = () => {}) {
+        const response = await fetch('/api/chat/stream', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
             },
             body: JSON.stringify({
                 userInput,
-                fileContents: this.isFirstMessage ? fileContents : undefined,
-                fileNames: this.isFirstMessage ? fileNames : undefined,
-                useAiSearch: this.isFirstMessage ? useAiSearch : undefined
+                datasetIds: this.isFirstMessage ? datasetIds : undefined,
+                useAiSearch: this.isFirstMessage ? useAiSearch : undefined,
+                chatId: this.isFirstMessage ? undefined : this.chatId
             })
         });
 
+        if (!response.ok) {
+            const error = await response.json();
+            throw new Error(error.detail || response.statusText);
+        }
+
         if (this.isFirstMessage) {
             this.isFirstMessage = false;
         }
 
-        return await response.json();
+        // Response is newline-delimited JSON, one event per line
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
+            lines.filter(line => line.trim()).forEach(line => this._handleStreamEvent(JSON.parse(line), onEvent));
+        }
+        if (buffer.trim()) {
+            this._handleStreamEvent(JSON.parse(buffer), onEvent);
+        }
     }
 
-    async readFile(file) {
-        return new Promise((resolve, reject) => {
-            const reader = new FileReader();
-            reader.onload = async (e) => {
-                try {
-                    resolve(e.target.result);
-                } catch (error) {
-                    reject(error);
-                }
-            };
-            reader.readAsText(file);
+    _handleStreamEvent(event, onEvent) {
+        if (event.type === 'done') {
+            this.chatId = event.chatId;
+        }
+        onEvent(event);
+    }
+
+    async uploadFile(file) {
+        // The file is sent as the raw request body, the server streams it to disk
+        const response = await fetch(`/api/datasets?fileName=${encodeURIComponent(file.name)}`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/octet-stream',
+            },
+            body: file
         });
+
+        if (!response.ok) {
+            const error = await response.json();
+            throw new Error(error.detail || response.statusText);
+        }
+
+        const result = await response.json();
+        return result.datasetId;
     }
 
     reset() {
         this.isFirstMessage = true;
+        this.chatId = null;
     }
 }
 
@@ -122,9 +155,42 @@ document.addEventListener('DOMContentLoaded', async () => {
 
         // Add loading indicator
         const loadingDiv = appendLoadingIndicator();
+        let explanationDiv = null;
+
+        const handleEvent = (event) => {
+            removeLoadingIndicator(loadingDiv);
+            switch (event.type) {
+                case 'explanation':
+                    // Explanation text arrives in pieces, grow a single message
+                    if (!explanationDiv) {
+                        explanationDiv = appendMessage('agent', '');
+                    }
+                    explanationDiv.textContent += event.text;
+                    chatHistory.scrollTop = chatHistory.scrollHeight;
+                    break;
+                case 'map':
+                    updateMap(event.mapHtml);
+                    break;
+                case 'followup':
+                    appendMessage('agent', event.text, true);
+                    break;
+                case 'done':
+                    if (explanationDiv && event.additionalText) {
+                        explanationDiv.textContent = event.additionalText;
+                    } else if (explanationDiv) {
+                        chatHistory.removeChild(explanationDiv);
+                    }
+                    if (event.text) {
+                        appendMessage('agent', event.text);
+                    }
+                    break;
+                case 'error':
+                    appendMessage('agent', 'Error: ' + event.detail);
+                    break;
+            }
+        };
 
         try {
-            let response;
             if (agent.isFirstMessage) {
                 // Get all files that have been selected
                 const files = fileInputs
@@ -135,39 +201,16 @@ document.addEventListener('DOMContentLoaded', async () => {
                     throw new Error('Please select at least one file first');
                 }
 
-                // Read all files
-                const fileContents = await Promise.all(files.map(file => agent.readFile(file)));
-                const fileNames = files.map(file => file.name);
+                // Upload all files, identical files are only stored once
+                const datasetIds = await Promise.all(files.map(file => agent.uploadFile(file)));
 
-                response = await agent.chat(message, fileContents, fileNames, aiSearchCheckbox.checked);
+                await agent.chatStream(message, datasetIds, aiSearchCheckbox.checked, handleEvent);
 
                 // Disable file inputs and AI search checkbox after first message
                 fileInputs.forEach(input => input.disabled = true);
                 aiSearchCheckbox.disabled = true;
             } else {
-                response = await agent.chat(message);
-            }
-
-            removeLoadingIndicator(loadingDiv);
-            
-            // Handle main response text
-            if (response.text) {
-                appendMessage('agent', response.text);
-            }
-
-            // Handle additional text if present
-            if (response.additionalText) {
-                appendMessage('agent', response.additionalText);
-            }
-
-            // Handle follow-up if present
-            if (response.followup) {
-                appendMessage('agent', response.followup, true);
-            }
-
-            // Handle map if present
-            if (response.mapHtml) {
-                updateMap(response.mapHtml);
+                await agent.chatStream(message, null, false, handleEvent);
             }
         } catch (error) {
             removeLoadingIndicator(loadingDiv);
@@ -218,6 +261,7 @@ document.addEventListener('DOMContentLoaded', async () => {
         
         chatHistory.appendChild(messageDiv);
         chatHistory.scrollTop = chatHistory.scrollHeight;
+        return messageDiv;
     }
 
     function updateMap(mapHtml) {